@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Stand-ins for OpenVSP, STAR-CCM+ and SU2 used by the benchmarks. They write artefacts
+                 and logs in the format the pipeline reads, after a configurable delay:
+                     FAKE_DELAY       seconds spent by each program (default 0)
+                     FAKE_ITERATIONS  solver iterations written to the logs and history (default 1000)
+                     FAKE_POINTS      nodes of the volume output and restart (default 1000)
+                     FAKE_YPLUS       maximum y+ of the volume output (default 0.8)
+"""
+
+import os
+import sys
+import math
+import time
+import zlib
+
+def setting(name, default):
+    return type(default)(os.environ.get(name, default))
+
+def delay():
+    time.sleep(setting('FAKE_DELAY', 0.0))
+
+def read_options(cfg_path):
+    """Reads the options of an SU2 configuration file."""
+    options = {}
+    with open(cfg_path, 'r') as file:
+        for line in file:
+            line = line.split('%', 1)[0]
+            if '=' in line:
+                key, value = line.split('=', 1)
+                options[key.strip().upper()] = value.strip()
+    return options
+
+def coefficients(iteration, seed=0.0):
+    """Damped oscillation of CL and CD towards their converged values."""
+    decay = math.exp(-iteration / 150.0) * math.cos(iteration / 15.0)
+    return 0.5 + 0.02 * seed + 0.05 * decay, 0.03 + 0.001 * seed + 0.005 * decay
+
+def write_su2_table(file, iterations, seed=0.0):
+    """Writes the SU2 screen output table (Inner_Iter, Time, rms[Rho], CL, CD), as found in submit.pbs.o* files."""
+    file.write("+" + "-" * 75 + "+\n")
+    file.write("|  Inner_Iter|    Time(sec)|     rms[Rho]|           CL|           CD|\n")
+    file.write("+" + "-" * 75 + "+\n")
+    for iteration in range(iterations):
+        cl, cd = coefficients(iteration, seed)
+        file.write(f"|{iteration:12d}|{0.1:13.4e}|{-2 - 6 * iteration / iterations:13.6f}|{cl:13.6f}|{cd:13.6f}|\n")
+
+def write_history(path, iterations, seed=0.0):
+    """Writes an SU2 history CSV file."""
+    with open(path, 'w') as file:
+        file.write('"Inner_Iter","rms[Rho]","CL","CD"\n')
+        for iteration in range(iterations):
+            cl, cd = coefficients(iteration, seed)
+            file.write(f"{iteration}, {-2 - 6 * iteration / iterations:.6f}, {cl:.8f}, {cd:.8f}\n")
+
+def write_vtu(path, n_points, max_yplus):
+    """Writes an ASCII VTU file with a Y_Plus point array."""
+    values = " ".join(f"{max_yplus * (i + 1) / n_points:.6f}" for i in range(n_points))
+    points = " ".join(f"{i * 0.001:.6f} 0 0" for i in range(n_points))
+    with open(path, 'w') as file:
+        file.write('<?xml version="1.0"?>\n'
+                   '<VTKFile type="UnstructuredGrid" version="0.1" byte_order="LittleEndian">\n'
+                   '<UnstructuredGrid>\n'
+                   f'<Piece NumberOfPoints="{n_points}" NumberOfCells="0">\n'
+                   f'<PointData Scalars="Y_Plus">\n<DataArray type="Float32" Name="Y_Plus" format="ascii">{values}</DataArray>\n</PointData>\n'
+                   f'<Points>\n<DataArray type="Float32" NumberOfComponents="3" format="ascii">{points}</DataArray>\n</Points>\n'
+                   '<Cells>\n<DataArray type="Int32" Name="connectivity" format="ascii"></DataArray>\n'
+                   '<DataArray type="Int32" Name="offsets" format="ascii"></DataArray>\n'
+                   '<DataArray type="UInt8" Name="types" format="ascii"></DataArray>\n</Cells>\n'
+                   '</Piece>\n</UnstructuredGrid>\n</VTKFile>\n')
+
+def write_native_mesh(path, n_points):
+    """Writes a native SU2 mesh with points only."""
+    with open(path, 'w') as file:
+        file.write("NDIME= 3\nNELEM= 0\n")
+        file.write(f"NPOIN= {n_points}\n")
+        for i in range(n_points):
+            file.write(f"{i * 0.001:.6f} {0.0:.6f} {0.0:.6f} {i}\n")
+        file.write("NMARK= 0\n")
+
+def write_restart(path, n_points):
+    """Writes an ASCII SU2 restart."""
+    with open(path, 'w') as file:
+        file.write('"PointID", "x", "y", "z", "Density", "Momentum_x", "Momentum_y", "Momentum_z", "Energy"\n')
+        for i in range(n_points):
+            file.write(f"{i}, {i * 0.001:.6f}, 0.0, 0.0, 1.0, 100.0, 0.0, 0.0, 250000.0\n")
+
+def vspscript():
+    """vspscript -script <script>: writes wing.stp in the working directory."""
+    delay()
+    with open('wing.stp', 'w') as file:
+        file.write("ISO-10303-21;\nHEADER;\nFILE_NAME('wing.stp');\nENDSEC;\nDATA;\nENDSEC;\nEND-ISO-10303-21;\n")
+
+def starccm():
+    """starccm+ -batch <macro> ...: writes mesh.cga in the working directory."""
+    delay()
+    with open('mesh.cga', 'wb') as file:
+        file.write(os.urandom(64 * 1024))
+
+def su2_cfd():
+    """SU2_CFD <cfg>: prints the convergence table and writes the history, volume output and restart."""
+    options = read_options(sys.argv[1])
+    iterations = setting('FAKE_ITERATIONS', 1000)
+    n_points = setting('FAKE_POINTS', 1000)
+    seed = (zlib.crc32(os.getcwd().encode()) % 1000) / 1000.0
+    volume_output = options.get('VOLUME_FILENAME', 'flow') + '.vtu'
+    # Intermediate solution write (OUTPUT_WRT_FREQ) before the run ends, as SU2 does
+    write_vtu(volume_output, n_points, setting('FAKE_YPLUS', 0.8))
+    delay()
+    write_su2_table(sys.stdout, iterations, seed)
+    write_history(options.get('CONV_FILENAME', 'history') + '.csv', iterations, seed)
+    if 'RESTART_ASCII' in options.get('OUTPUT_FILES', ''):
+        write_restart('restart_flow.csv', n_points)
+    write_vtu(volume_output, n_points, setting('FAKE_YPLUS', 0.8))
+
+def su2_def():
+    """SU2_DEF <cfg>: writes MESH_OUT_FILENAME."""
+    options = read_options(sys.argv[1])
+    delay()
+    write_native_mesh(options.get('MESH_OUT_FILENAME', 'mesh_out.su2'), setting('FAKE_POINTS', 1000))
+
+def su2_geo():
+    """SU2_GEO <cfg>: writes the geometry functions."""
+    delay()
+    with open('of_func.csv', 'w') as file:
+        file.write('"AIRFOIL_AREA","WING_VOLUME"\n0.01, 0.05\n')
+
+def shape_optimization():
+    """shape_optimization.py ... -f <cfg>: prints an optimisation summary."""
+    delay()
+    print("Optimization finished (fake).")
+
+PROGRAMS = {
+    'vspscript': vspscript,
+    'starccm+': starccm,
+    'SU2_CFD': su2_cfd,
+    'SU2_DEF': su2_def,
+    'SU2_GEO': su2_geo,
+    'shape_optimization.py': shape_optimization,
+}
+
+if __name__ == "__main__":
+    PROGRAMS[os.path.basename(sys.argv[0])]()
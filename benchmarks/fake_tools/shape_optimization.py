@@ -0,0 +1 @@
+fake_artifacts.py
\ No newline at end of file
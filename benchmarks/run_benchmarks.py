@@ -0,0 +1,200 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Measures the cost of the Python side of the pipeline (submission, rendering and
+                 post-processing) against the stand-in programs of benchmarks/fake_tools, so that
+                 the external tools and the queue do not hide it. Every case runs in a fresh process
+                 and reports its wall time, time per design point and peak memory.
+
+    Usage:  python3 benchmarks/run_benchmarks.py --sizes 100 1000 10000 --cases serial array dag geometry extract
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_FOLDER = os.path.dirname(BENCHMARK_DIR)
+FAKE_TOOLS = os.path.join(BENCHMARK_DIR, 'fake_tools')
+CASES = ['serial', 'array', 'dag', 'geometry', 'extract', 'pipeline']
+DEFAULT_CASES = ['serial', 'array', 'dag', 'geometry', 'extract']
+STEPS = {
+    'geo': 1,
+    'mesh': 1,
+    'prism_layer': 0,
+    'cfd': 1,
+    'cfd_solver': 'Euler',
+    'aso': 0,
+    'aso_solver': 'Euler',
+    'cache_dir': None,
+    'cache_size': 50,
+    'warm_start': 0,
+    'cfd_args': '',
+}
+
+def fake_environment():
+    """Environment pointing the pipeline at the stand-in programs."""
+    return dict(os.environ,
+                VSPSCRIPT=os.path.join(FAKE_TOOLS, 'vspscript'),
+                STARCCM=os.path.join(FAKE_TOOLS, 'starccm+'),
+                SU2_BIN=FAKE_TOOLS,
+                MPIEXEC=os.path.join(FAKE_TOOLS, 'mpiexec'),
+                QSUB=os.path.join(FAKE_TOOLS, 'qsub'),
+                QSTAT=os.path.join(FAKE_TOOLS, 'qstat'),
+                # The stages run python3 from PATH, which must be the interpreter of the benchmark
+                PATH=os.pathsep.join([FAKE_TOOLS, os.path.dirname(sys.executable), os.environ.get('PATH', '')]))
+
+def design_grid(size, n_sweep=10):
+    """Cant and sweep lists of a grid of about size design points."""
+    n_sweep = min(n_sweep, size)
+    return list(range(math.ceil(size / n_sweep))), list(range(n_sweep))
+
+def make_main_folder(work_dir):
+    """Creates a main folder with the templates, as the pipeline expects."""
+    main_folder = os.path.join(work_dir, 'main')
+    shutil.copytree(os.path.join(MAIN_FOLDER, 'templates'), os.path.join(main_folder, 'templates'))
+    os.makedirs(os.path.join(main_folder, 'output'))
+    return main_folder
+
+def write_logs(main_folder, list_cant, list_sweep, iterations):
+    """Writes an SU2 log (submit.pbs.o*) in the CFD directory of every design point."""
+    import fake_artifacts
+    for cant in list_cant:
+        for sweep in list_sweep:
+            cfd_dir = os.path.join(main_folder, f'output/winglet_c{cant}_s{sweep}/CFD/Euler')
+            os.makedirs(cfd_dir, exist_ok=True)
+            with open(os.path.join(cfd_dir, 'submit.pbs.o1'), 'w') as file:
+                fake_artifacts.write_su2_table(file, iterations, (cant * 7 + sweep) % 10 / 10)
+
+def run_case(case, size, work_dir, local_cores=None):
+    """
+    Runs one case in the current process.
+
+    Returns:
+        dict: Timings of the case (seconds), keyed by phase.
+    """
+    sys.path.insert(0, MAIN_FOLDER)
+    sys.path.insert(0, os.path.join(MAIN_FOLDER, 'bin'))
+    sys.path.insert(0, FAKE_TOOLS)
+    import main_runAutomation
+    import executors
+    import geometry_generation
+    import extract_coefficients
+
+    main_folder = make_main_folder(work_dir)
+    list_cant, list_sweep = design_grid(size)
+    timings = {}
+    start = time.perf_counter()
+
+    if case == 'serial':
+        main_runAutomation.main(8, 32, 8, dict(STEPS), list_cant, list_sweep, main_folder)
+    elif case == 'array':
+        main_runAutomation.main_array(8, 32, 8, dict(STEPS), list_cant, list_sweep, main_folder=main_folder)
+    elif case == 'dag':
+        main_runAutomation.main_dag(8, 32, 8, dict(STEPS), list_cant, list_sweep, main_folder=main_folder)
+    elif case == 'geometry':
+        geometry_generation.batch(list_cant, list_sweep, os.path.join(main_folder, 'templates/winggen.vspscript'), os.path.join(main_folder, 'output'))
+    elif case == 'extract':
+        write_logs(main_folder, list_cant, list_sweep, int(os.environ.get('FAKE_ITERATIONS', 1000)))
+        start = time.perf_counter()
+        extract_coefficients.main(main_folder, list_cant, list_sweep, os.path.join(work_dir, 'results'))
+        timings['cold'] = time.perf_counter() - start
+        start = time.perf_counter()
+        extract_coefficients.main(main_folder, list_cant, list_sweep, os.path.join(work_dir, 'results'))
+        timings['warm'] = time.perf_counter() - start
+        return timings
+    elif case == 'pipeline':
+        executor = executors.LocalExecutor(local_cores, os.path.join(MAIN_FOLDER, 'bin'), poll_interval=0.05)
+        status = main_runAutomation.main_dag(8, 32, 8, dict(STEPS), list_cant, list_sweep, ['geo=1:1:1', 'mesh=1:1:1', 'cfd=1:1:1'],
+                                             executor, main_folder)
+        timings['failed_stages'] = sum(1 for returncode in status.values() if returncode != 0)
+    else:
+        raise ValueError(f"Unknown case '{case}'")
+
+    timings['total'] = time.perf_counter() - start
+    return timings
+
+def run_in_child(case, size, keep=False, local_cores=None):
+    """Runs a case in a fresh Python process and returns its timings and peak memory."""
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{case}_{size}_')
+    result_path = os.path.join(work_dir, 'result.json')
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-case', case, '--size', str(size),
+           '--work-dir', work_dir, '--result', result_path]
+    if local_cores:
+        cmd += ['--local-cores', str(local_cores)]
+    with open(os.path.join(work_dir, 'case.log'), 'w') as log:
+        process = subprocess.run(cmd, env=fake_environment(), stdout=log, stderr=subprocess.STDOUT)
+    try:
+        with open(result_path, 'r') as file:
+            result = json.load(file)
+    except (OSError, ValueError):
+        result = {'error': f"exit status {process.returncode}, see {os.path.join(work_dir, 'case.log')}"}
+        keep = True
+    if not keep:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+def print_table(results):
+    print(f"{'case':<10}{'designs':>9}{'total (s)':>12}{'per design (ms)':>17}{'peak RSS (MB)':>15}{'children RSS (MB)':>19}  notes")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['case']:<10}{result['size']:>9}  {result['error']}")
+            continue
+        timings = result['timings']
+        total = timings.get('total', timings.get('cold', 0.0))
+        notes = ", ".join(f"{name} {value:.3f}" if isinstance(value, float) else f"{name} {value}"
+                          for name, value in timings.items() if name != 'total')
+        print(f"{result['case']:<10}{result['size']:>9}{total:>12.3f}{1000 * total / result['size']:>17.3f}"
+              f"{result['max_rss_mb']:>15.1f}{result['children_max_rss_mb']:>19.1f}  {notes}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the orchestration and post-processing of the pipeline with stand-in tools.')
+    parser.add_argument('--sizes', nargs='+', type=int, help='Numbers of design points', default=[100, 1000, 10000])
+    parser.add_argument('--cases', nargs='+', choices=CASES, help='Cases to run', default=DEFAULT_CASES)
+    parser.add_argument('--output', type=str, help='JSON file to save the results to', default=None)
+    parser.add_argument('--keep', action='store_true', help='Keep the working directories of the cases')
+    parser.add_argument('--local-cores', type=int, help='Core budget of the pipeline case', default=None)
+    # Internal: run a single case in this process
+    parser.add_argument('--run-case', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--result', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        timings = run_case(args.run_case, args.size, args.work_dir, args.local_cores)
+        # ru_maxrss is in kB on Linux
+        result = {
+            'case': args.run_case,
+            'size': args.size,
+            'timings': timings,
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'children_max_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        }
+        with open(args.result, 'w') as file:
+            json.dump(result, file)
+        sys.exit()
+
+    results = []
+    for case in args.cases:
+        for size in args.sizes:
+            result = {'case': case, 'size': size}
+            result.update(run_in_child(case, size, args.keep, args.local_cores))
+            results.append(result)
+            print(f"{case} with {size} design points: {'failed' if 'error' in result else 'done'}")
+    print()
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.output}")
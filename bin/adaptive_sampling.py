@@ -0,0 +1,171 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Adaptive sampling of the cant/sweep design space. A Gaussian-process surrogate of the
+                 objective (L/D, -CD or -CD/CL^2) is fitted to the designs solved so far, and the next batch of
+                 grid points is chosen by expected improvement or maximum uncertainty.
+"""
+
+import os
+import csv
+import numpy as np
+from scipy.stats import norm
+from scipy.linalg import cho_factor, cho_solve
+import checkpoint
+import run_index
+import extract_coefficients
+
+OBJECTIVES = ['ld', 'cd', 'k']
+ACQUISITIONS = ['ei', 'std']
+STUDY_FILE = 'adaptive_study.csv'
+# Length scales (in normalised cant/sweep units) tried when fitting the surrogate
+LENGTH_SCALES = [0.1, 0.2, 0.35, 0.5, 0.75, 1.0]
+
+def design_result(directory, solver):
+    """
+    Returns (CL, CD) of a design point whose CFD completed successfully, or (None, None).
+    Success is the completion marker of the CFD stage (see checkpoint.py), so a run that stalled or used
+    up its y+ iterations still counts, although it cannot warm-start its neighbours.
+
+    Parameters:
+        directory (str): Output directory of the design point.
+        solver (str): Solver type (Euler or RANS).
+    """
+    work_dir = os.path.join(directory, 'CFD', solver)
+    if not os.path.exists(checkpoint.marker_path(directory, run_index.stage_key('cfd', solver))):
+        return None, None
+    return extract_coefficients.read_history_coefficients(work_dir, os.path.join(work_dir, f'{solver.upper()}-cfd.cfg'))
+
+def objective(cl, cd, name='ld'):
+    """
+    Objective to maximise, shared with the screening of bin/screening.py: L/D, -CD (drag at the fixed CL of
+    the configuration) or -CD/CL^2 (induced-drag factor). None if it cannot be computed.
+    """
+    if name == 'ld':
+        return cl / cd if cd else None
+    if name == 'cd':
+        return -cd
+    if name == 'k':
+        return -cd / cl**2 if cl else None
+    raise ValueError(f"Unknown objective '{name}'. Expected one of {', '.join(OBJECTIVES)}.")
+
+def normalise(points, bounds):
+    """Scales (cant, sweep) points to the unit square of the design space."""
+    lower, upper = bounds
+    return (np.asarray(points, dtype=float) - lower) / np.where(upper > lower, upper - lower, 1.0)
+
+def kernel(a, b, length_scale):
+    """Squared-exponential kernel between two sets of normalised points."""
+    distances = np.sum((a[:, None, :] - b[None, :, :]) ** 2, axis=2)
+    return np.exp(-0.5 * distances / length_scale ** 2)
+
+class GaussianProcess:
+    """
+    Gaussian-process regression with a squared-exponential kernel on standardised observations.
+    The length scale is chosen from LENGTH_SCALES by maximum marginal likelihood.
+    """
+
+    def __init__(self, x, y, noise=1e-6):
+        self.x = x
+        self.mean = y.mean()
+        self.scale = y.std() or 1.0
+        self.y = (y - self.mean) / self.scale
+        self.noise = noise
+
+        best = None
+        for length_scale in LENGTH_SCALES:
+            factor = cho_factor(kernel(x, x, length_scale) + noise * np.eye(len(x)))
+            alpha = cho_solve(factor, self.y)
+            log_likelihood = -0.5 * self.y @ alpha - np.sum(np.log(np.diag(factor[0])))
+            if best is None or log_likelihood > best[0]:
+                best = (log_likelihood, length_scale, factor, alpha)
+        _, self.length_scale, self.factor, self.alpha = best
+
+    def predict(self, x):
+        """
+        Returns:
+            tuple: Mean and standard deviation of the objective at the points.
+        """
+        k = kernel(x, self.x, self.length_scale)
+        mean = k @ self.alpha
+        variance = 1.0 - np.sum(k * cho_solve(self.factor, k.T).T, axis=1)
+        std = np.sqrt(np.maximum(variance, 0.0))
+        return mean * self.scale + self.mean, std * self.scale
+
+def expected_improvement(mean, std, best, xi=0.01):
+    """Expected improvement over the best observed objective (maximisation)."""
+    improvement = mean - best - xi * abs(best)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(std > 0, improvement / std, 0.0)
+    return np.where(std > 0, improvement * norm.cdf(z) + std * norm.pdf(z), np.maximum(improvement, 0.0))
+
+def initial_design(candidates, n_points):
+    """
+    Picks space-filling starting points: the grid point nearest the centre of the design space,
+    then repeatedly the candidate farthest from every point already picked (maximin).
+
+    Parameters:
+        candidates (list): Unsolved (cant, sweep) grid points.
+        n_points (int): Number of points to pick.
+
+    Returns:
+        list: Chosen (cant, sweep) points.
+    """
+    points = np.asarray(candidates, dtype=float)
+    x = normalise(points, (points.min(axis=0), points.max(axis=0)))
+    chosen = [int(np.argmin(np.sum((x - 0.5) ** 2, axis=1)))]
+    while len(chosen) < min(n_points, len(candidates)):
+        distances = np.min(np.sum((x[:, None, :] - x[None, chosen, :]) ** 2, axis=2), axis=1)
+        chosen.append(int(np.argmax(distances)))
+    return [candidates[i] for i in chosen]
+
+def select_batch(candidates, observed, values, batch_size, acquisition='ei'):
+    """
+    Chooses the next batch of design points from the candidate grid.
+    Points within a batch are chosen one at a time, each time adding the previous choice to the
+    surrogate with its predicted value (kriging believer), so that the batch does not cluster.
+
+    Parameters:
+        candidates (list): Unsolved (cant, sweep) grid points.
+        observed (list): Solved (cant, sweep) points.
+        values (list): Objective of the solved points.
+        batch_size (int): Number of points to choose.
+        acquisition (str): 'ei' (expected improvement) or 'std' (maximum uncertainty).
+
+    Returns:
+        tuple: (list of chosen (cant, sweep) points, list of their acquisition values,
+                list of (predicted mean, predicted std)).
+    """
+    all_points = np.asarray(list(candidates) + list(observed), dtype=float)
+    bounds = (all_points.min(axis=0), all_points.max(axis=0))
+    x_candidates = normalise(np.asarray(candidates, dtype=float), bounds)
+    x_observed = normalise(np.asarray(observed, dtype=float), bounds)
+    y_observed = np.asarray(values, dtype=float)
+    best = y_observed.max()
+    available = np.ones(len(candidates), dtype=bool)
+
+    chosen, scores, predictions = [], [], []
+    for _ in range(min(batch_size, len(candidates))):
+        surrogate = GaussianProcess(x_observed, y_observed)
+        mean, std = surrogate.predict(x_candidates)
+        score = expected_improvement(mean, std, best) if acquisition == 'ei' else std
+        score = np.where(available, score, -np.inf)
+        i = int(np.argmax(score))
+        chosen.append(candidates[i])
+        scores.append(float(score[i]))
+        predictions.append((float(mean[i]), float(std[i])))
+        available[i] = False
+        x_observed = np.vstack([x_observed, x_candidates[i]])
+        y_observed = np.append(y_observed, mean[i])
+    return chosen, scores, predictions
+
+def append_study(study_path, rows):
+    """Appends rows (iteration, cant, sweep, cl, cd, objective, predicted mean, predicted std, acquisition) to the study log."""
+    new_file = not os.path.exists(study_path)
+    with open(study_path, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(['iteration', 'cant', 'sweep', 'cl', 'cd', 'objective', 'predicted_mean', 'predicted_std', 'acquisition'])
+        writer.writerows(rows)
@@ -0,0 +1,184 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Content-addressed cache for the artefacts of the geometry and mesh stages.
+                 Entries are keyed on a hash of the rendered stage inputs, live on the shared
+                 filesystem and are evicted least-recently-used once the cache exceeds its size limit.
+"""
+
+import os
+import shutil
+import hashlib
+import fcntl
+import tempfile
+import argparse
+from contextlib import contextmanager
+import artifact_staging
+
+DEFAULT_CACHE_SIZE_GB = 50
+LOCK_NAME = '.lock'
+
+def cache_key(stage, files=(), texts=(), params=None):
+    """
+    Build the cache key of a stage from its rendered inputs.
+
+    Parameters:
+        stage (str): Name of the stage (e.g. 'geometry', 'mesh').
+        files (iterable): Input files whose content is part of the key.
+        texts (iterable): Rendered input texts (e.g. a vspscript after substitution).
+        params (dict, optional): Scalar parameters of the stage (e.g. cant and sweep angles).
+
+    Returns:
+        str: Hexadecimal cache key.
+    """
+    digest = hashlib.sha256(stage.encode())
+    for file_path in files:
+        digest.update(artifact_staging.hash_file(file_path).encode())
+    for text in texts:
+        digest.update(hashlib.sha256(text.encode()).hexdigest().encode())
+    for name, value in sorted((params or {}).items()):
+        digest.update(f"{name}={value}".encode())
+    return digest.hexdigest()
+
+@contextmanager
+def cache_lock(cache_dir):
+    """Holds an exclusive lock on the cache directory, shared by all jobs on the filesystem."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LOCK_NAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def entry_path(cache_dir, key):
+    """Returns the directory holding the cache entry of a key."""
+    return os.path.join(cache_dir, key[:2], key)
+
+def lookup(cache_dir, key, names, dest_dir):
+    """
+    Restores the artefacts of a cache entry into a directory.
+
+    Parameters:
+        cache_dir (str): Root directory of the cache.
+        key (str): Cache key of the stage.
+        names (list): Names of the artefacts to restore.
+        dest_dir (str): Directory where the artefacts are placed.
+
+    Returns:
+        bool: True if every artefact was restored, False on a cache miss.
+    """
+    if not cache_dir:
+        return False
+    entry = entry_path(cache_dir, key)
+    if not all(os.path.exists(os.path.join(entry, name)) for name in names):
+        return False
+
+    os.makedirs(dest_dir, exist_ok=True)
+    for name in names:
+        artifact_staging.stage_file(os.path.join(entry, name), os.path.join(dest_dir, name))
+
+    # The entry mtime records the last access and drives the LRU eviction
+    try:
+        os.utime(entry)
+    except OSError:
+        pass
+    return True
+
+def store(cache_dir, key, names, src_dir, max_bytes=DEFAULT_CACHE_SIZE_GB * 1024**3):
+    """
+    Stores the artefacts of a stage in the cache and evicts old entries if needed.
+
+    Parameters:
+        cache_dir (str): Root directory of the cache.
+        key (str): Cache key of the stage.
+        names (list): Names of the artefacts to store.
+        src_dir (str): Directory containing the artefacts.
+        max_bytes (int): Size limit of the cache in bytes.
+    """
+    if not cache_dir:
+        return
+    entry = entry_path(cache_dir, key)
+    if os.path.exists(entry):
+        os.utime(entry)
+        return
+
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    # Populate a private directory first so that readers never see a partial entry
+    staging_dir = tempfile.mkdtemp(prefix=f".{key}.", dir=os.path.dirname(entry))
+    try:
+        for name in names:
+            artifact_staging.stage_file(os.path.join(src_dir, name), os.path.join(staging_dir, name))
+        with cache_lock(cache_dir):
+            if os.path.exists(entry):
+                shutil.rmtree(staging_dir)
+            else:
+                os.rename(staging_dir, entry)
+            evict(cache_dir, max_bytes, keep=key)
+    except OSError as e:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        print(f"Error storing cache entry {key}: {e}")
+
+def entries(cache_dir):
+    """
+    Lists the entries of the cache.
+
+    Returns:
+        list: Tuples (last access time, size in bytes, entry path, key), oldest first.
+    """
+    result = []
+    if not os.path.isdir(cache_dir):
+        return result
+    for prefix in os.listdir(cache_dir):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if prefix == LOCK_NAME or not os.path.isdir(prefix_dir):
+            continue
+        for key in os.listdir(prefix_dir):
+            if key.startswith('.'):
+                continue
+            entry = os.path.join(prefix_dir, key)
+            size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+            result.append((os.path.getmtime(entry), size, entry, key))
+    return sorted(result)
+
+def evict(cache_dir, max_bytes, keep=None):
+    """
+    Removes the least recently used entries until the cache fits in its size limit.
+    Must be called while holding the cache lock.
+
+    Parameters:
+        cache_dir (str): Root directory of the cache.
+        max_bytes (int): Size limit of the cache in bytes.
+        keep (str, optional): Key that must not be evicted (the entry just stored).
+
+    Returns:
+        int: Number of entries removed.
+    """
+    cached = entries(cache_dir)
+    total = sum(size for _, size, _, _ in cached)
+    removed = 0
+    for _, size, entry, key in cached:
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect or trim the geometry/mesh artefact cache.')
+    parser.add_argument('cache_dir', type=str, help='Cache directory')
+    parser.add_argument('--max-size-gb', type=float, help='Evict entries until the cache fits in this size', default=None)
+    args = parser.parse_args()
+
+    if args.max_size_gb is not None:
+        with cache_lock(args.cache_dir):
+            removed = evict(args.cache_dir, int(args.max_size_gb * 1024**3))
+        print(f"Removed {removed} cache entries")
+
+    cached = entries(args.cache_dir)
+    print(f"{len(cached)} entries, {sum(size for _, size, _, _ in cached) / 1024**3:.2f} GB")
@@ -0,0 +1,132 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Places the artefacts of one stage (wing.stp, domain.STEP, mesh.cga) in the directory of
+                 the next without duplicating them: a hard link, else a reflink (copy-on-write clone),
+                 else an in-process copy. Symbolic links can be requested instead. Every staged file is
+                 checked against its source by size, and copies by SHA-256.
+                 The mode can be forced with the STAGING_MODE environment variable
+                 (auto, hardlink, reflink, symlink or copy).
+
+                 Artefacts are never modified in place: the stages delete and regenerate them, so links
+                 are safe. Files that are edited in place (configuration files, macros) must be copied
+                 with copy_file instead.
+"""
+
+import os
+import shutil
+import fcntl
+import hashlib
+
+MODES = ['auto', 'hardlink', 'reflink', 'symlink', 'copy']
+MODE_ENV = 'STAGING_MODE'
+# ioctl(dest, FICLONE, src) clones a file on filesystems with copy-on-write extents (XFS, Btrfs)
+FICLONE = 0x40049409
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """
+    Calculate the SHA-256 digest of a file.
+
+    Parameters:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hexadecimal digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def reflink(src, dest):
+    """Clones src into dest. Raises OSError if the filesystem does not support it."""
+    with open(src, 'rb') as src_file, open(dest, 'wb') as dest_file:
+        try:
+            fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dest_file.close()
+            os.remove(dest)
+            raise
+
+def link(src, dest, mode):
+    """Creates dest from src with one mode. Raises OSError on failure."""
+    if mode == 'hardlink':
+        os.link(src, dest)
+    elif mode == 'reflink':
+        reflink(src, dest)
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(src), dest)
+    elif mode == 'copy':
+        # copyfile uses sendfile on Linux, without forking a cp process
+        shutil.copyfile(src, dest)
+    else:
+        raise ValueError(f"Unknown staging mode '{mode}'. Expected one of {', '.join(MODES)}.")
+
+def verify(src, dest, mode):
+    """Checks a staged file against its source: same file for links, same size and SHA-256 for clones and copies."""
+    if os.path.getsize(src) != os.path.getsize(dest):
+        raise OSError(f"Staged file '{dest}' has {os.path.getsize(dest)} bytes, expected {os.path.getsize(src)}")
+    if mode in ('hardlink', 'symlink'):
+        if not os.path.samefile(src, dest):
+            raise OSError(f"Staged file '{dest}' is not a link to '{src}'")
+    elif hash_file(src) != hash_file(dest):
+        raise OSError(f"Staged file '{dest}' differs from '{src}'")
+
+def stage_file(src, dest, mode=None, check=True):
+    """
+    Places src at dest, replacing any previous file atomically.
+
+    Parameters:
+        src (str): Source artefact.
+        dest (str): Destination path (or directory, in which case the name of src is kept).
+        mode (str, optional): One of MODES. Defaults to $STAGING_MODE, or auto (hard link, reflink, copy).
+        check (bool): Verify the staged file against its source.
+
+    Returns:
+        str: Mode actually used.
+    """
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(src))
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"Artefact '{src}' not found")
+    if os.path.exists(dest) and os.path.samefile(src, dest):
+        return 'hardlink' if not os.path.islink(dest) else 'symlink'
+
+    mode = mode or os.environ.get(MODE_ENV, 'auto')
+    candidates = ['hardlink', 'reflink', 'copy'] if mode == 'auto' else [mode]
+    # Build the new file beside dest, then swap it in, so that readers never see a partial file
+    tmp_path = os.path.join(os.path.dirname(os.path.abspath(dest)), f".{os.path.basename(dest)}.{os.getpid()}.staging")
+    for candidate in candidates:
+        try:
+            link(src, tmp_path, candidate)
+        except OSError:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            # Cross-device link, no reflink support, ...: try the next mode
+            if candidate == candidates[-1]:
+                raise
+            continue
+        try:
+            if check:
+                verify(src, tmp_path, candidate)
+            os.replace(tmp_path, dest)
+        except OSError:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return candidate
+
+def copy_file(src, dest):
+    """Copies a file that will be edited in place (configuration, macro, script), without forking cp."""
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(src))
+    if os.path.abspath(src) == os.path.abspath(dest):
+        return
+    if os.path.islink(dest) or (os.path.exists(dest) and os.stat(dest).st_nlink > 1):
+        # Editing a linked file would also change its source
+        os.remove(dest)
+    shutil.copyfile(src, dest)
@@ -0,0 +1,152 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Completion markers of the stages of a design point. A stage that finished successfully
+                 writes .complete_<stage>.json in the winglet directory (.complete_cfd_rans.json for the
+                 CFD and ASO, which are kept per solver) with its command line and the SHA-256 of its
+                 inputs, and a later launch of the stage is skipped while the command, the inputs and
+                 the outputs are unchanged. Set FORCE_RERUN=1 to run the stages regardless.
+
+                 The inputs are the artefacts of the upstream stages and the templates that the stage's
+                 own files (vspscript, macros, cfg) are rendered from: those files are edited by the
+                 stages themselves, so their content changes on every run.
+"""
+
+import os
+import glob
+import json
+import fnmatch
+from datetime import datetime
+import artifact_staging
+import retention
+import run_index
+
+MARKER_PREFIX = '.complete_'
+FORCE_ENV = 'FORCE_RERUN'
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+
+# Inputs of each stage: patterns relative to the winglet directory, or to the templates directory.
+# {SOLVER}, {Solver} and {mesh} are filled in from the solver of the stage key (see stage_inputs).
+STAGE_INPUTS = {
+    'geo': ['templates/winggen.vspscript'],
+    'mesh': ['templates/macro_with_prism.java', 'templates/macro_without_prism.java', 'templates/domain.STEP', 'GEOMETRY/wing.stp'],
+    'cfd': ['templates/{SOLVER}-cfd.cfg', 'MESH/{mesh}/mesh.cga'],
+    'aso': ['templates/{Solver}-shapeOptimisation.cfg', 'MESH/{mesh}/mesh.cga'],
+}
+MESH_SUBDIRS = {'Euler': 'without_prism', 'RANS': 'with_prism'}
+
+def stage_inputs(key):
+    """Input patterns of a stage key (see run_index.stage_key), limited to the template and mesh of its solver."""
+    stage, solver = run_index.split_key(key)
+    if solver:
+        names = {'SOLVER': solver.upper(), 'Solver': solver, 'mesh': MESH_SUBDIRS[solver]}
+    else:
+        names = {'SOLVER': '*', 'Solver': '*', 'mesh': '*'}
+    return [pattern.format(**names) for pattern in STAGE_INPUTS.get(stage, [])]
+
+def marker_path(workdir, stage):
+    return os.path.join(workdir, f"{MARKER_PREFIX}{stage}.json")
+
+def retained_files(workdir):
+    """
+    Files of a design point compressed by the retention policy (see retention.py), which a skipped stage
+    does not need to restore.
+
+    Returns:
+        dict: Path to the SHA-256 of the original file, as recorded in the retention manifest.
+    """
+    retained = {}
+    for entry in retention.load_manifest(workdir):
+        if entry['action'] != 'compress' or not os.path.exists(os.path.join(workdir, entry['archive'])):
+            continue
+        for name in [entry['path']] + entry.get('links', []):
+            path = os.path.join(workdir, name)
+            if not os.path.exists(path):
+                retained[path] = entry['sha256']
+    return retained
+
+def matching(pattern, workdir, retained=None):
+    """Paths of the files matching a pattern relative to the winglet directory, including the retained ones."""
+    pattern = os.path.join(workdir, pattern)
+    return glob.glob(pattern) + [path for path in retained or {} if fnmatch.fnmatch(path, pattern)]
+
+def input_files(stage, workdir, retained=None):
+    """Sorted paths of the inputs of a stage, including those in retained (see retained_files)."""
+    paths = []
+    for pattern in stage_inputs(stage):
+        if pattern.startswith('templates/'):
+            paths.extend(glob.glob(os.path.join(TEMPLATES_DIR, pattern[len('templates/'):])))
+        else:
+            paths.extend(matching(pattern, workdir, retained))
+    return sorted(paths)
+
+def fingerprint(paths, known=None):
+    """
+    SHA-256, size and modification time of files. Files whose size and modification time match
+    their entry in known are not read again.
+
+    Returns:
+        dict: Path to {'sha256', 'size', 'mtime_ns'}.
+    """
+    known = known or {}
+    result = {}
+    for path in paths:
+        stat = os.stat(path)
+        entry = known.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            result[path] = entry
+        else:
+            result[path] = {'sha256': artifact_staging.hash_file(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return result
+
+def outputs_present(stage, workdir, retained=None):
+    """True if every artefact pattern of the stage (see run_index.stage_artefacts) matches a file, possibly retained."""
+    return all(matching(pattern, workdir, retained) for pattern in run_index.stage_artefacts(stage))
+
+def is_complete(stage, workdir, command):
+    """
+    True if the stage already completed with the same command and inputs, and its outputs are still there.
+    Inputs and outputs compressed by the retention policy count as unchanged and present, without being
+    restored, when the SHA-256 recorded in the retention manifest matches the marker.
+
+    Parameters:
+        stage (str): Stage key (geo, mesh, cfd_euler, cfd_rans, aso_rans, ..., see run_index.stage_key).
+        workdir (str): Winglet directory of the design point.
+        command (list): Command line of the stage.
+    """
+    if os.environ.get(FORCE_ENV) == '1':
+        return False
+    try:
+        with open(marker_path(workdir, stage), 'r') as file:
+            marker = json.load(file)
+    except (OSError, ValueError):
+        return False
+    retained = retained_files(workdir)
+    if marker.get('command') != list(command) or not outputs_present(stage, workdir, retained):
+        return False
+    paths = input_files(stage, workdir, retained)
+    if sorted(marker.get('inputs', {})) != paths:
+        return False
+    current = fingerprint([path for path in paths if path not in retained], marker['inputs'])
+    current.update((path, {'sha256': retained[path]}) for path in paths if path in retained)
+    return all(current[path]['sha256'] == marker['inputs'][path]['sha256'] for path in paths)
+
+def mark_complete(stage, workdir, command):
+    """Writes the completion marker of a stage, with the hashes of its inputs as they are now."""
+    marker = {
+        'stage': stage,
+        'command': list(command),
+        'completed': datetime.now().isoformat(timespec='seconds'),
+        'inputs': fingerprint(input_files(stage, workdir)),
+    }
+    path = marker_path(workdir, stage)
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump(marker, file, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+def clear(stage, workdir):
+    """Removes the completion marker of a stage that is about to run again."""
+    if os.path.exists(marker_path(workdir, stage)):
+        os.remove(marker_path(workdir, stage))
@@ -0,0 +1,211 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Streams the SU2 history file while SU2_CFD runs and stops the solver once the force
+                 coefficients meet engineering tolerances, or when the residuals stall or diverge.
+"""
+
+import os
+import math
+import time
+import signal
+import subprocess
+
+DEFAULT_CRITERIA = {
+    'window': 200,              # Iterations over which the coefficients and residuals are assessed
+    'min_iter': 500,            # Iterations always run before any early termination
+    'cl_tol': 1e-4,             # Maximum relative variation of CL over the window
+    'cd_tol': 1e-4,             # Maximum relative variation of CD over the window
+    'stall_slope': 1e-4,        # Residual slope (log10 units per iteration) below which the residual is stalled
+    'divergence_rise': 3.0,     # Rise of the residual above its minimum (orders of magnitude) considered divergence
+    'residual': 'rms[Rho]',     # History column used for the residual checks
+}
+
+class HistoryReader:
+    """Reads the rows appended to an SU2 CSV history file since the previous call."""
+
+    def __init__(self, history_path):
+        self.history_path = history_path
+        self.offset = 0
+        self.columns = None
+        self.partial = ''
+
+    def read_new_rows(self):
+        """
+        Returns:
+            list: New rows as dicts of column name to float value.
+        """
+        try:
+            with open(self.history_path, 'r') as file:
+                file.seek(self.offset)
+                data = file.read()
+                self.offset = file.tell()
+        except OSError:
+            return []
+
+        lines = (self.partial + data).split('\n')
+        # The last line may still be being written
+        self.partial = lines.pop()
+
+        rows = []
+        for line in lines:
+            if not line.strip():
+                continue
+            fields = [field.strip().strip('"').strip() for field in line.split(',')]
+            if self.columns is None:
+                self.columns = fields
+                continue
+            try:
+                rows.append(dict(zip(self.columns, (float(field) for field in fields))))
+            except ValueError:
+                continue
+        return rows
+
+def relative_variation(values):
+    """Returns the range of the values relative to their mean magnitude."""
+    mean = abs(sum(values) / len(values))
+    if mean == 0:
+        return math.inf
+    return (max(values) - min(values)) / mean
+
+def slope(values):
+    """Returns the least-squares slope of the values against their index."""
+    n = len(values)
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    numerator = sum((i - mean_x) * (value - mean_y) for i, value in enumerate(values))
+    denominator = sum((i - mean_x) ** 2 for i in range(n))
+    return numerator / denominator if denominator else 0.0
+
+def assess(history, criteria):
+    """
+    Assesses the convergence of the rows read so far.
+
+    Parameters:
+        history (list): Rows of the history file.
+        criteria (dict): Termination criteria (see DEFAULT_CRITERIA).
+
+    Returns:
+        str: 'converged', 'stalled', 'diverged' or None to keep running.
+    """
+    residual = criteria['residual']
+    last = history[-1] if history else {}
+    if any(math.isnan(value) or math.isinf(value) for value in last.values()):
+        return 'diverged'
+
+    residuals = [row[residual] for row in history if residual in row]
+    if residuals and residuals[-1] - min(residuals) > criteria['divergence_rise']:
+        return 'diverged'
+
+    window = criteria['window']
+    if len(history) < max(criteria['min_iter'], window):
+        return None
+
+    recent = history[-window:]
+    if all('CL' in row and 'CD' in row for row in recent):
+        cl_variation = relative_variation([row['CL'] for row in recent])
+        cd_variation = relative_variation([row['CD'] for row in recent])
+        if cl_variation < criteria['cl_tol'] and cd_variation < criteria['cd_tol']:
+            return 'converged'
+
+    if len(residuals) >= window and abs(slope(residuals[-window:])) < criteria['stall_slope']:
+        return 'stalled'
+
+    return None
+
+# History columns of the SU2 convergence fields (CONV_FIELD)
+CONV_FIELD_COLUMNS = {'RMS_DENSITY': 'rms[Rho]', 'DRAG': 'CD', 'LIFT': 'CL'}
+
+def history_converged(history_path, options):
+    """
+    Checks whether a run that SU2_CFD ended by itself met the convergence criterion of its configuration,
+    rather than only reaching ITER: the last residual of CONV_FIELD below CONV_RESIDUAL_MINVAL, or, for a
+    coefficient, its mean relative change over the last CONV_CAUCHY_ELEMS iterations below CONV_CAUCHY_EPS.
+
+    Parameters:
+        history_path (str): Path to the history CSV file of the run.
+        options (dict): Options of the configuration (see su2_config.read_config).
+
+    Returns:
+        bool: True if the criterion is met.
+    """
+    field = options.get('CONV_FIELD', 'RMS_DENSITY').strip().strip('()').split(',')[0].strip().upper()
+    column = CONV_FIELD_COLUMNS.get(field)
+    reader = HistoryReader(history_path)
+    rows = reader.read_new_rows()
+    # A history without a final line break still has its last row
+    reader.partial += '\n'
+    rows += reader.read_new_rows()
+    values = [row[column] for row in rows if column in row]
+    if not values or any(math.isnan(value) or math.isinf(value) for value in values):
+        return False
+    if column.startswith('rms['):
+        return values[-1] <= float(options.get('CONV_RESIDUAL_MINVAL', -8))
+    elements = int(options.get('CONV_CAUCHY_ELEMS', 100))
+    if len(values) <= elements:
+        return False
+    recent = values[-elements - 1:]
+    changes = [abs(current - previous) / abs(current) if current else math.inf for previous, current in zip(recent, recent[1:])]
+    return sum(changes) / len(changes) <= float(options.get('CONV_CAUCHY_EPS', 1e-5))
+
+def stop_process(process, grace_period=60):
+    """
+    Stops an MPI job started in its own session: SIGTERM to the whole process group,
+    then SIGKILL if it has not exited after the grace period.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+def monitor(process, history_path, criteria=None, timeout=None, poll_interval=10.0):
+    """
+    Follows the history file of a running SU2_CFD job and stops it when a termination criterion is met.
+    The process must be started with start_new_session=True so that every MPI rank can be signalled.
+    The solution files of the last OUTPUT_WRT_FREQ write are kept when the job is stopped.
+
+    Parameters:
+        process (subprocess.Popen): Running SU2_CFD (mpiexec) process.
+        history_path (str): Path to the history CSV file (CONV_FILENAME + '.csv').
+        criteria (dict, optional): Termination criteria overriding DEFAULT_CRITERIA.
+        timeout (float, optional): Maximum run time in seconds.
+        poll_interval (float): Time in seconds between reads of the history file.
+
+    Returns:
+        tuple: (status, history) where status is 'finished', 'converged', 'stalled', 'diverged' or 'timeout'.
+    """
+    criteria = {**DEFAULT_CRITERIA, **(criteria or {})}
+    reader = HistoryReader(history_path)
+    history = []
+    start = time.monotonic()
+
+    # Only the monitored columns are kept, so long runs do not accumulate whole history rows
+    columns = ('Inner_Iter', 'CL', 'CD', criteria['residual'])
+
+    def read_rows():
+        return [{name: row[name] for name in columns if name in row} for row in reader.read_new_rows()]
+
+    while True:
+        history.extend(read_rows())
+        if process.poll() is not None:
+            history.extend(read_rows())
+            if process.returncode != 0:
+                raise RuntimeError(f"SU2_CFD failed with exit code {process.returncode}")
+            return 'finished', history
+
+        status = assess(history, criteria)
+        if status is None and timeout is not None and time.monotonic() - start > timeout:
+            status = 'timeout'
+        if status is not None:
+            iteration = int(history[-1].get('Inner_Iter', len(history))) if history else 0
+            print(f"Stopping SU2_CFD at iteration {iteration}: {status}")
+            stop_process(process)
+            return status, history
+
+        time.sleep(poll_interval)
@@ -0,0 +1,222 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Executors that run the stages of the design points. PBSExecutor submits every stage
+                 with qsub, LocalExecutor runs them on the current machine, packing the stages onto a
+                 core budget and honouring the same afterok dependencies.
+"""
+
+import os
+import re
+import time
+import subprocess
+import stage_jobs
+import tool_paths
+
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def qstat_status(job_ids):
+    """
+    Queries the state of PBS jobs, including finished ones (qstat -x).
+
+    Returns:
+        dict: Job ID to (job_state, Exit_status). Jobs PBS no longer knows (Unknown Job Id) get (None, None).
+              Jobs qstat did not report, e.g. because the call failed, are left out, so that callers keep
+              waiting for them instead of taking them as finished.
+    """
+    try:
+        result = subprocess.run([tool_paths.QSTAT, '-x', '-f'] + list(job_ids), capture_output=True, text=True)
+    except OSError as e:
+        print(f"Error executing qstat: {e}")
+        return {}
+    # qstat reports the full server name, qsub may not
+    by_number = {job_id.split('.')[0]: job_id for job_id in job_ids}
+    status = {}
+    for match in re.finditer(r'Unknown Job Id:?\s+(\S+)', result.stderr):
+        job_id = by_number.get(match.group(1).split('.')[0])
+        if job_id:
+            status[job_id] = (None, None)
+    job_id = None
+    for line in result.stdout.splitlines():
+        if line.startswith('Job Id:'):
+            job_id = by_number.get(line.split(':', 1)[1].strip().split('.')[0])
+        elif job_id and '=' in line:
+            key, value = (part.strip() for part in line.split('=', 1))
+            if key == 'job_state':
+                status[job_id] = (value, status.get(job_id, (None, None))[1])
+            elif key == 'Exit_status':
+                status[job_id] = (status.get(job_id, (None, None))[0], int(value))
+    if result.returncode != 0 and len(status) < len(job_ids):
+        print(f"qstat failed for {len(job_ids) - len(status)} jobs, their state is unknown: {result.stderr.strip()}")
+    return status
+
+def qstat_dependencies(job_ids):
+    """
+    Queries the dependencies of queued PBS jobs.
+
+    Returns:
+        dict: Job ID to its depend attribute (e.g. 'afterok:123.pbs@pbs,afterany:120.pbs@pbs'), for the jobs with one.
+    """
+    if not job_ids:
+        return {}
+    try:
+        result = subprocess.run([tool_paths.QSTAT, '-f'] + list(job_ids), capture_output=True, text=True)
+    except OSError as e:
+        print(f"Error executing qstat: {e}")
+        return {}
+    by_number = {job_id.split('.')[0]: job_id for job_id in job_ids}
+    dependencies = {}
+    job_id = None
+    # Long attribute values continue on lines starting with a tab
+    for line in result.stdout.replace('\n\t', '').splitlines():
+        if line.startswith('Job Id:'):
+            job_id = by_number.get(line.split(':', 1)[1].strip().split('.')[0])
+        elif job_id and '=' in line:
+            key, value = (part.strip() for part in line.split('=', 1))
+            if key == 'depend':
+                dependencies[job_id] = value
+    return dependencies
+
+def job_finished(state):
+    """Whether a job state returned by qstat_status is final (finished, or no longer known to PBS)."""
+    return state in (None, 'F')
+
+class PBSExecutor:
+    """Submits each stage as a PBS job rendered from the stage template."""
+
+    def __init__(self, template_path, poll_interval=60.0):
+        self.template_path = template_path
+        self.poll_interval = poll_interval
+        self.job_ids = []
+
+    def submit(self, stage, workdir, command, resources, depends_on=None, after=None):
+        """
+        Submits a stage.
+
+        Parameters:
+            stage (str): Name of the stage.
+            workdir (str): Output directory of the design point.
+            command (str): Command that runs the stage.
+            resources (tuple): (ncpus, mem, walltime) of the stage, and optionally the number of nodes.
+            depends_on (str, optional): Job ID that must complete successfully before the stage starts.
+            after (str, optional): Job ID that must have ended, successfully or not, before the stage starts.
+
+        Returns:
+            str: Job ID, or None if the submission failed.
+        """
+        script_path = os.path.join(workdir, f"submit_{stage}.pbs")
+        stage_jobs.write_stage_script(self.template_path, script_path, stage, resources, command)
+        job_id = stage_jobs.submit_stage(script_path, depends_on, after)
+        if job_id:
+            self.job_ids.append(job_id)
+        return job_id
+
+    def wait(self, block=False):
+        """
+        PBS runs the jobs asynchronously. With block=True, waits until every job submitted so far has finished.
+
+        Returns:
+            dict: Job ID to exit status (None if unknown, e.g. deleted after a failed dependency). Empty if not blocking.
+        """
+        if not block or not self.job_ids:
+            return {}
+        while True:
+            status = qstat_status(self.job_ids)
+            if len(status) == len(self.job_ids) and all(job_finished(state) for state, _ in status.values()):
+                break
+            time.sleep(self.poll_interval)
+        self.job_ids = []
+        return {job_id: exit_status for job_id, (_, exit_status) in status.items()}
+
+class LocalExecutor:
+    """
+    Runs the stages as local processes within a core budget.
+    Whenever cores are released, the ready stage with the most cores that still fits is started
+    (first-fit decreasing), so small geometry stages fill the gaps left by CFD runs.
+    """
+
+    def __init__(self, total_cores=None, bin_dir=BIN_DIR, poll_interval=1.0):
+        self.total_cores = total_cores or os.cpu_count() or 1
+        self.bin_dir = bin_dir
+        self.poll_interval = poll_interval
+        self.jobs = {}
+
+    def submit(self, stage, workdir, command, resources, depends_on=None, after=None):
+        """
+        Queues a stage. Same parameters as PBSExecutor.submit.
+        Stages needing more cores than the budget are run on the whole budget.
+
+        Returns:
+            str: Local job ID.
+        """
+        job_id = f"{len(self.jobs)}.local"
+        self.jobs[job_id] = {
+            'stage': stage,
+            'workdir': workdir,
+            'command': command,
+            'ncpus': max(1, min(resources[0] * (resources[3] if len(resources) > 3 else 1), self.total_cores)),
+            'depends_on': depends_on,
+            'after': after,
+            'state': 'queued',
+            'returncode': None,
+        }
+        return job_id
+
+    def start(self, job):
+        """Starts a stage in its design directory, logging to <stage>.log."""
+        env = dict(os.environ, BIN_DIR=self.bin_dir, NP=str(job['ncpus']), NCPUS=str(job['ncpus']))
+        log = open(os.path.join(job['workdir'], f"{job['stage']}.log"), 'w')
+        process = subprocess.Popen(job['command'], cwd=job['workdir'], shell=True, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        log.close()
+        return process
+
+    def wait(self, block=True):
+        """
+        Runs all the queued stages. Local stages always run to completion, whatever block is.
+
+        Returns:
+            dict: Job ID to exit status (None for stages skipped because a dependency failed).
+        """
+        pending = [job_id for job_id, job in self.jobs.items() if job['state'] == 'queued']
+        running = {}
+        free_cores = self.total_cores
+
+        while pending or running:
+            # Release the cores of finished stages
+            for job_id, process in list(running.items()):
+                returncode = process.poll()
+                if returncode is not None:
+                    job = self.jobs[job_id]
+                    job['returncode'] = returncode
+                    job['state'] = 'done'
+                    free_cores += job['ncpus']
+                    del running[job_id]
+                    print(f"{job['workdir']} {job['stage']}: {'done' if returncode == 0 else f'failed ({returncode})'}")
+
+            # afterok: stages after a failed or skipped stage never run
+            for job_id in list(pending):
+                depends_on = self.jobs[job_id]['depends_on']
+                if depends_on and depends_on not in running and depends_on not in pending and self.jobs[depends_on]['returncode'] != 0:
+                    pending.remove(job_id)
+                    self.jobs[job_id]['state'] = 'skipped'
+                    print(f"{self.jobs[job_id]['workdir']} {self.jobs[job_id]['stage']}: skipped")
+
+            # afterany: the stage waits until the other job has ended or been skipped
+            ready = [job_id for job_id in pending
+                     if (not self.jobs[job_id]['depends_on'] or self.jobs[self.jobs[job_id]['depends_on']]['returncode'] == 0)
+                     and self.jobs[job_id]['after'] not in running and self.jobs[job_id]['after'] not in pending]
+            for job_id in sorted(ready, key=lambda job_id: -self.jobs[job_id]['ncpus']):
+                job = self.jobs[job_id]
+                if job['ncpus'] <= free_cores:
+                    running[job_id] = self.start(job)
+                    job['state'] = 'running'
+                    free_cores -= job['ncpus']
+                    pending.remove(job_id)
+
+            if running:
+                time.sleep(self.poll_interval)
+
+        return {job_id: job['returncode'] for job_id, job in self.jobs.items()}
@@ -9,10 +9,43 @@
 import os
 import re
 import sys
+import csv
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import su2_config
+
+ITERATION_ROW = re.compile(r'\|\s*\d+\s*\|')
+STATE_FILE = '.extract_coefficients_state.json'
+
+def iter_lines_reversed(file, block_size=64 * 1024):
+    """
+    Yields the lines of a binary file from the last to the first, reading blocks from the end.
+
+    Parameters:
+        file (file object): File opened in binary mode.
+        block_size (int): Number of bytes read at a time.
+    """
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    remainder = b''
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        file.seek(position)
+        lines = (file.read(read_size) + remainder).split(b'\n')
+        # The first line may continue in the previous block
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            yield line
+    if remainder:
+        yield remainder
 
 def extract_last_cl_cd(file_path):
     """
     Extracts the last Cl and Cd values from an output SU2 file.
+    The file is read backwards from the end, so only the tail of long logs is parsed.
 
     Parameters:
         file_path (str): Path to the file.
@@ -20,54 +53,155 @@ def extract_last_cl_cd(file_path):
     Returns:
         tuple: Last Cl and Cd values, or (None, None) if not found.
     """
-    last_cl = None
-    last_cd = None
-
-    with open(file_path, 'r') as file:
-        for line in file:
-            if re.match(r'\|\s*\d+\s*\|', line):
+    with open(file_path, 'rb') as file:
+        for raw_line in iter_lines_reversed(file):
+            line = raw_line.decode(errors='replace')
+            if ITERATION_ROW.match(line):
                 parts = line.split('|')
-                if len(parts) > 4:
+                if len(parts) > 5:
                     try:
-                        last_cl = float(parts[4].strip())
-                        last_cd = float(parts[5].strip())
+                        return float(parts[4].strip()), float(parts[5].strip())
                     except ValueError:
                         print(f"Conversion failed for line: {line.strip()}")  # Handle conversion error
-                    
-    return last_cl, last_cd
 
-def main():
+    return None, None
+
+def read_history_coefficients(work_dir, cfg_file):
     """
-    Main function to traverse directories, extract Cl and Cd values, and save the results.
+    Reads CL and CD of the last iteration of the SU2 history file of a CFD run.
+
+    Returns:
+        tuple: (CL, CD), or (None, None) if the history is missing or incomplete.
+    """
+    options = su2_config.read_config(cfg_file) if os.path.exists(cfg_file) else {}
+    history_path = os.path.join(work_dir, options.get('CONV_FILENAME', 'history') + '.csv')
+    try:
+        with open(history_path, 'rb') as file:
+            columns = [field.strip().strip('"').strip() for field in file.readline().decode().split(',')]
+            for raw_line in iter_lines_reversed(file):
+                fields = raw_line.decode(errors='replace').split(',')
+                if len(fields) == len(columns):
+                    row = dict(zip(columns, fields))
+                    return float(row['CL']), float(row['CD'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return None, None
+
+def find_logs(cfd_dir):
+    """Returns the sorted paths of the SU2 log files (submit.pbs.o*) below a CFD directory."""
+    logs = []
+    for root, dirs, files in os.walk(cfd_dir):
+        for file in files:
+            if file.startswith('submit.pbs.o'):
+                logs.append(os.path.join(root, file))
+    return sorted(logs)
+
+def collect_design(task):
     """
-    if len(sys.argv) < 4:
-        print("Usage: python extractCoefficients.py <base_dir> <cant_angles> <sweep_angles>")
-        sys.exit(1)
+    Extracts Cl and Cd from every log of one design point, skipping logs that did not change.
 
-    base_dir = sys.argv[1]
-    list_cant = [int(angle) for angle in sys.argv[2].split(',')]
-    list_sweep = [int(angle) for angle in sys.argv[3].split(',')]
+    Parameters:
+        task (tuple): (cant, sweep, CFD directory, previous state of the design's logs).
 
+    Returns:
+        tuple: (list of (cant, sweep, cl, cd, log path), updated state of the design's logs).
+    """
+    cant, sweep, cfd_dir, previous = task
     results = []
+    state = {}
+    if not os.path.exists(cfd_dir):
+        return results, state
 
+    for file_path in find_logs(cfd_dir):
+        stat = os.stat(file_path)
+        entry = previous.get(file_path)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            cl, cd = entry['cl'], entry['cd']
+        else:
+            cl, cd = extract_last_cl_cd(file_path)
+        state[file_path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'cl': cl, 'cd': cd}
+        results.append((cant, sweep, cl, cd, file_path))
+    return results, state
+
+def load_state(state_path):
+    """Loads the log state of the previous run, or an empty state."""
+    try:
+        with open(state_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def write_results(results, output_prefix):
+    """
+    Writes the results to a CSV file with a header and to a NumPy .npz archive.
+
+    Parameters:
+        results (list): Tuples (cant, sweep, cl, cd, log path).
+        output_prefix (str): Output path without extension.
+    """
+    with open(f"{output_prefix}.csv", 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['cant', 'sweep', 'cl', 'cd', 'log_file'])
+        for cant, sweep, cl, cd, file_path in results:
+            writer.writerow([cant, sweep, '' if cl is None else cl, '' if cd is None else cd, file_path])
+
+    np.savez(f"{output_prefix}.npz",
+             cant=np.array([result[0] for result in results], dtype=np.int32),
+             sweep=np.array([result[1] for result in results], dtype=np.int32),
+             cl=np.array([np.nan if result[2] is None else result[2] for result in results], dtype=np.float64),
+             cd=np.array([np.nan if result[3] is None else result[3] for result in results], dtype=np.float64))
+
+def main(base_dir, list_cant, list_sweep, output_prefix='results', workers=None):
+    """
+    Main function to traverse directories, extract Cl and Cd values, and save the results.
+
+    Parameters:
+        base_dir (str): Directory containing the output folder.
+        list_cant (list): Cant angles to process.
+        list_sweep (list): Sweep angles to process.
+        output_prefix (str): Output path of the results without extension.
+        workers (int, optional): Number of worker processes (all cores if None).
+    """
+    state_path = os.path.join(base_dir, STATE_FILE)
+    previous = load_state(state_path)
+
+    tasks = []
     for cant in list_cant:
         for sweep in list_sweep:
-            winglet_dir = f'output/winglet_c{cant}_s{sweep}/CFD'
-            full_dir_path = os.path.join(base_dir, winglet_dir)
+            cfd_dir = os.path.join(base_dir, f'output/winglet_c{cant}_s{sweep}/CFD')
+            design_state = {path: entry for path, entry in previous.items() if path.startswith(cfd_dir + os.sep)}
+            tasks.append((cant, sweep, cfd_dir, design_state))
 
-            if os.path.exists(full_dir_path):
-                for root, dirs, files in os.walk(full_dir_path):
-                    for file in files:
-                        if file.startswith('submit.pbs.o'):
-                            file_path = os.path.join(root, file)
-                            cl, cd = extract_last_cl_cd(file_path)
-                            results.append((cant, sweep, cl, cd))
+    # Keep the state of designs outside this run so that partial runs do not discard it
+    processed_dirs = tuple(task[2] + os.sep for task in tasks)
+    state = {path: entry for path, entry in previous.items() if not path.startswith(processed_dirs)}
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map preserves the cant/sweep order of the tasks
+        for design_results, design_state in executor.map(collect_design, tasks, chunksize=max(1, len(tasks) // 64)):
+            results.extend(design_results)
+            state.update(design_state)
 
-    with open('results.dat', 'w') as output_file:
-        for result in results:
-            output_file.write(f"{result[0]} {result[1]} {result[2]} {result[3]}\n")
+    write_results(results, output_prefix)
+    try:
+        with open(state_path, 'w') as file:
+            json.dump(state, file)
+    except OSError as e:
+        print(f"Error saving extraction state: {state_path} - {e}")
 
-    print("Results saved to results.dat")
+    print(f"Results saved to {output_prefix}.csv and {output_prefix}.npz")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Extract the last Cl and Cd of every winglet configuration.')
+    parser.add_argument('base_dir', type=str, help='Directory containing the output folder')
+    parser.add_argument('cant_angles', type=str, help='Cant angles to process, separated by commas')
+    parser.add_argument('sweep_angles', type=str, help='Sweep angles to process, separated by commas')
+    parser.add_argument('-o', '--output', type=str, help='Output path of the results without extension', default='results')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: all cores)', default=None)
+    # Lists starting with a negative angle (e.g. -120,-105) would otherwise be taken for options
+    argv = [f" {arg}" if re.fullmatch(r'-\d+(,-?\d+)*', arg) else arg for arg in sys.argv[1:]]
+    args = parser.parse_args(argv)
+
+    list_cant = [int(angle) for angle in args.cant_angles.split(',')]
+    list_sweep = [int(angle) for angle in args.sweep_angles.split(',')]
+    main(args.base_dir, list_cant, list_sweep, args.output, args.workers)
@@ -0,0 +1,216 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Waits for the output file of an external tool (STAR-CCM+, SU2) without busy-waiting.
+                 Uses inotify on Linux and falls back to exponential-backoff polling. The wait fails
+                 if the tool exits with an error or without writing the file, or if the timeout expires.
+                 Tools that rewrite their output while running (SU2 every OUTPUT_WRT_FREQ iterations,
+                 STAR-CCM+ saving the simulation after the mesh) are waited for with wait_for_exit.
+"""
+
+import os
+import time
+import errno
+import select
+import subprocess
+import struct
+import ctypes
+import ctypes.util
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """Watches a directory for files being created, renamed into it or closed after writing."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {directory}")
+        self.closed_names = set()
+
+    def wait(self, timeout):
+        """
+        Blocks until an event arrives or the timeout expires.
+
+        Returns:
+            set: Names of the files that were reported by the events.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+
+        names = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            names.add(name)
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self.closed_names.add(name)
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+def open_for_writing(path):
+    """
+    Checks whether any process visible in /proc still holds the file open for writing.
+
+    Returns:
+        bool: True if a writer was found, False otherwise or when /proc is unavailable.
+    """
+    target = os.path.realpath(path)
+    try:
+        pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+    except OSError:
+        return False
+    for pid in pids:
+        fd_dir = f'/proc/{pid}/fd'
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(os.path.join(fd_dir, fd)) != target:
+                    continue
+                with open(f'/proc/{pid}/fdinfo/{fd}', 'r') as fdinfo:
+                    flags = int(fdinfo.readline().split()[1], 8)
+                if flags & (os.O_WRONLY | os.O_RDWR):
+                    return True
+            except (OSError, ValueError, IndexError):
+                continue
+    return False
+
+def is_complete(path, stable_time, closed=False):
+    """
+    Checks that a file has been fully written: not empty, not open for writing and with a stable size.
+
+    Parameters:
+        path (str): Path to the file.
+        stable_time (float): Time in seconds during which the size must not change.
+        closed (bool): The writer is already known to have closed the file (inotify IN_CLOSE_WRITE).
+
+    Returns:
+        bool: True if the file is complete.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    if size == 0:
+        return False
+    if not closed and open_for_writing(path):
+        return False
+    time.sleep(stable_time)
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
+
+def wait_for_output(path, process=None, timeout=None, poll_interval=0.5, max_poll_interval=30.0, stable_time=2.0):
+    """
+    Waits until an output file is completely written.
+
+    Parameters:
+        path (str): Path to the expected output file.
+        process (subprocess.Popen, optional): Process producing the file. Its exit code is checked.
+        timeout (float, optional): Maximum waiting time in seconds (no limit if None).
+        poll_interval (float): Initial polling interval in seconds, doubled after every poll.
+        max_poll_interval (float): Upper bound of the polling interval in seconds.
+        stable_time (float): Time in seconds during which the file size must not change.
+
+    Raises:
+        RuntimeError: If the process fails or exits without writing the file.
+        TimeoutError: If the file is not complete before the timeout.
+    """
+    path = os.path.abspath(path)
+    directory, name = os.path.split(path)
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    watcher = None
+    try:
+        watcher = InotifyWatcher(directory)
+    except (OSError, AttributeError, TypeError):
+        # No inotify (non-Linux, exhausted watches or unsupported filesystem): poll with backoff
+        watcher = None
+
+    interval = poll_interval
+    try:
+        while True:
+            exited = process is not None and process.poll() is not None
+            if exited and process.returncode != 0:
+                raise RuntimeError(f"Process {process.args!r} failed with exit code {process.returncode} before '{path}' was complete.")
+
+            closed = watcher is not None and name in watcher.closed_names
+            if os.path.exists(path) and is_complete(path, stable_time, closed or exited):
+                return
+
+            if exited:
+                raise RuntimeError(f"Process {process.args!r} exited without writing '{path}'.")
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError(f"Timed out after {timeout} s waiting for '{path}'.")
+
+            wait_time = interval if remaining is None else min(interval, remaining)
+            if watcher is not None:
+                watcher.wait(wait_time)
+            else:
+                time.sleep(wait_time)
+            interval = min(interval * 2, max_poll_interval)
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+def wait_for_exit(process, path, timeout=None):
+    """
+    Waits until a process exits successfully, then checks its output file.
+    The process must be started with start_new_session=True: its whole process group (every MPI rank)
+    is stopped when the timeout expires or the wait is interrupted.
+
+    Parameters:
+        process (subprocess.Popen): Process producing the file.
+        path (str): Path to the expected output file.
+        timeout (float, optional): Maximum run time in seconds (no limit if None).
+
+    Raises:
+        RuntimeError: If the process fails or exits without writing the file.
+        TimeoutError: If the process has not exited before the timeout.
+    """
+    from convergence_monitor import stop_process
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        stop_process(process)
+        raise TimeoutError(f"Process {process.args!r} did not exit within {timeout} s.")
+    except BaseException:
+        stop_process(process)
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"Process {process.args!r} failed with exit code {process.returncode}.")
+    try:
+        # The output may take a moment to appear on a networked filesystem
+        wait_for_output(path, None, timeout=60, stable_time=0.0)
+    except TimeoutError:
+        raise RuntimeError(f"Process {process.args!r} exited without writing '{path}'.") from None
@@ -7,92 +7,236 @@
 """
 
 import os
+import re
 import subprocess
 import numpy as np
 import sys
 import argparse
+import artifact_cache
+import template_renderer
+import tool_paths
+import stage_ledger
 
 def chord_distribution(x, span_total, chord_root, chord_tip):
     """
     Calculate chord length at position x.
     
     Parameters:
-        x (float): Position along the wingspan (m).
-        span_total (float): Total wingspan (m).
-        chord_root (float): Chord length at the root (m).
-        chord_tip (float): Chord length at the tip (m).
+        x (float or numpy.ndarray): Position along the wingspan (m).
+        span_total (float or numpy.ndarray): Total wingspan (m).
+        chord_root (float or numpy.ndarray): Chord length at the root (m).
+        chord_tip (float or numpy.ndarray): Chord length at the tip (m).
 
     Returns:
-        float: Chord length at position x (m).
+        float or numpy.ndarray: Chord length at position x (m).
     """
-    return round((chord_tip - chord_root)/span_total * x + chord_root, 4)
+    return np.round((chord_tip - chord_root)/span_total * x + chord_root, 4)
 
 def wingspan_distribution(span_total, span_blend, span_winglet, cant_blend, cant_winglet):
     """
     Calculate effective wingspan considering blended and winglet sections.
     
     Parameters:
-        span_total (float): Total wingspan (m).
-        span_blend (float): Span of the blended section (m).
-        span_winglet (float): Span of the winglet section (m).
-        cant_blend (float): Cant angle of the blended section (degrees).
-        cant_winglet (float): Cant angle of the winglet section (degrees).
+        span_total (float or numpy.ndarray): Total wingspan (m).
+        span_blend (float or numpy.ndarray): Span of the blended section (m).
+        span_winglet (float or numpy.ndarray): Span of the winglet section (m).
+        cant_blend (float or numpy.ndarray): Cant angle of the blended section (degrees).
+        cant_winglet (float or numpy.ndarray): Cant angle of the winglet section (degrees).
 
     Returns:
-        float: Effective wingspan (m).
+        float or numpy.ndarray: Effective wingspan (m).
     """
     cant_blend = np.radians(cant_blend)
     cant_winglet = np.radians(cant_winglet)
     projected_span_blend = span_blend * np.cos(cant_blend)
     projected_span_winglet = span_winglet * np.cos(cant_winglet)
-    if -np.radians(90) <= cant_winglet <= np.radians(90):
-        return round(span_total - projected_span_blend - projected_span_winglet, 4)
-    else:
-        return round(span_total - projected_span_blend, 4)
+    # A winglet canted beyond 90 degrees folds back over the wing and does not reduce the span
+    projected_span_winglet = np.where(np.abs(cant_winglet) <= np.radians(90), projected_span_winglet, 0.0)
+    return np.round(span_total - projected_span_blend - projected_span_winglet, 4)
 
 def winglet_chord_distribution(x, span_total, chord_root, chord_tip):
     """
     Calculate chord length at position x for winglet.
     
     Parameters:
-        x (float): Position along the winglet span (m).
-        span_total (float): Total span including winglet (m).
-        chord_root (float): Chord length at the root (m).
-        chord_tip (float): Chord length at the tip (m).
+        x (float or numpy.ndarray): Position along the winglet span (m).
+        span_total (float or numpy.ndarray): Total span including winglet (m).
+        chord_root (float or numpy.ndarray): Chord length at the root (m).
+        chord_tip (float or numpy.ndarray): Chord length at the tip (m).
 
     Returns:
-        float: Chord length at position x (m).
+        float or numpy.ndarray: Chord length at position x (m).
     """
-    return round((chord_tip - chord_root)/span_total * x + chord_root, 4)
+    return np.round((chord_tip - chord_root)/span_total * x + chord_root, 4)
 
 def blended_span_distribution(cant):
     """
     Calculate span for blended section.
     
     Parameters:
-        cant (float): Cant angle (degrees).
+        cant (float or numpy.ndarray): Cant angle (degrees).
 
     Returns:
-        float: Span of the blended section (m).
+        float or numpy.ndarray: Span of the blended section (m).
     """
-    return round(0.01/9 * abs(cant) + 0.1, 4)
+    return np.round(0.01/9 * np.abs(cant) + 0.1, 4)
 
-def main(cant, sweep, output_dir):
-    """Generate wing geometry including blended winglet."""
-    # Wing parameters
-    span_total = 3.536  # meters
-    span_blend = blended_span_distribution(cant)  # meters
-    span_winglet = 0.3536  # meters
-    wing_chord_root = 0.4713  # meters
-    wing_chord_tip = 0.2357  # meters
-    wing_sweep = 20  # degrees
+# Planform of the FLEXOP wing. Distances in meters, angles in degrees.
+DEFAULT_PLANFORM = {
+    'span_total': 3.536,
+    'span_winglet': 0.3536,
+    'wing_chord_root': 0.4713,
+    'wing_chord_tip': 0.2357,
+    'wing_sweep': 20,
+    'winglet_taper_ratio': 0.2,
+}
 
-    # Calculate geometry
-    new_wing_span = wingspan_distribution(span_total, span_blend, span_winglet, cant * 0.5, cant)  # meters
-    new_wing_chord_tip = chord_distribution(new_wing_span, span_total, wing_chord_root, wing_chord_tip)  # meters
+# OpenVSP parameters set by the geometry stage: (parameter, XSec group) -> key of xsec_parameters
+XSEC_PARAMETERS = {
+    ('Tip_Chord', 'XSec_1'): 'wing_chord_tip',
+    ('Span', 'XSec_1'): 'wing_span',
+    ('Span', 'XSec_2'): 'blend_span',
+    ('Root_Chord', 'XSec_2'): 'wing_chord_tip',
+    ('Tip_Chord', 'XSec_2'): 'blend_chord_tip',
+    ('Sweep', 'XSec_2'): 'blend_sweep',
+    ('Dihedral', 'XSec_2'): 'blend_dihedral',
+    ('Root_Chord', 'XSec_3'): 'blend_chord_tip',
+    ('Tip_Chord', 'XSec_3'): 'winglet_chord_tip',
+    ('Sweep', 'XSec_3'): 'winglet_sweep',
+    ('Dihedral', 'XSec_3'): 'winglet_dihedral',
+}
+
+MIN_CHORD = 0.005  # meters, below which the meshing of the trailing edge fails
+
+def xsec_parameters(cant, sweep, planform=DEFAULT_PLANFORM):
+    """
+    Calculate the XSec parameters of the wing and blended winglet for one or many designs.
+
+    Parameters:
+        cant (float or numpy.ndarray): Cant angle of the winglet (degrees).
+        sweep (float or numpy.ndarray): Sweep angle of the winglet (degrees).
+        planform (dict): Fixed planform parameters (see DEFAULT_PLANFORM). Values may also be arrays.
+
+    Returns:
+        dict: Parameter name to value (numpy arrays broadcast over the inputs).
+    """
+    cant = np.asarray(cant, dtype=float)
+    sweep = np.asarray(sweep, dtype=float)
+    span_total = planform['span_total']
+    span_winglet = planform['span_winglet']
+    wing_sweep = planform['wing_sweep']
+    taper_ratio = planform['winglet_taper_ratio']
+
+    span_blend = blended_span_distribution(cant)
+    new_wing_span = wingspan_distribution(span_total, span_blend, span_winglet, cant * 0.5, cant)
+    new_wing_chord_tip = chord_distribution(new_wing_span, span_total, planform['wing_chord_root'], planform['wing_chord_tip'])
+    new_blended_chord_tip = chord_distribution(span_blend, span_blend + span_winglet, new_wing_chord_tip, new_wing_chord_tip * taper_ratio)
+
+    return {
+        'wing_span': new_wing_span,
+        'wing_chord_tip': new_wing_chord_tip,
+        'blend_span': span_blend,
+        'blend_chord_tip': new_blended_chord_tip,
+        'blend_sweep': np.round(wing_sweep + sweep * 0.5, 4),
+        'blend_dihedral': np.round(cant * 0.5, 4),
+        'winglet_chord_tip': new_wing_chord_tip * taper_ratio,
+        'winglet_sweep': np.round(wing_sweep + sweep, 4),
+        'winglet_dihedral': np.round(cant, 4),
+    }
+
+def check_planform(params):
+    """
+    Flag invalid or degenerate planforms before any OpenVSP or meshing job is queued.
+
+    Parameters:
+        params (dict): Output of xsec_parameters.
+
+    Returns:
+        numpy.ndarray: Reason why each design is invalid, or an empty string for valid designs.
+    """
+    shape = np.broadcast(*params.values()).shape
+    reasons = np.full(shape, '', dtype=object)
+    checks = [
+        (~np.all(np.isfinite(np.stack(np.broadcast_arrays(*params.values()))), axis=0), 'non-finite parameter'),
+        (params['wing_span'] <= 0, 'non-positive wing span'),
+        (params['blend_span'] <= 0, 'non-positive blend span'),
+        (params['winglet_chord_tip'] < MIN_CHORD, 'winglet tip chord below minimum'),
+        (params['blend_chord_tip'] < params['winglet_chord_tip'], 'blend tip chord smaller than winglet tip chord'),
+        (np.abs(params['winglet_dihedral']) > 180, 'cant angle beyond 180 degrees'),
+        (np.abs(params['winglet_sweep']) >= 90, 'section sweep of 90 degrees or more'),
+    ]
+    for failed, reason in checks:
+        failed = np.broadcast_to(failed, shape)
+        reasons[failed & (reasons == '')] = reason
+    return reasons
+
+# Renderer rules matching the SetParmVal lines of the XSec parameters
+XSEC_RULES = tuple(((parameter, xsec), re.escape(f"'{parameter}', '{xsec}'")) for parameter, xsec in XSEC_PARAMETERS)
+
+def xsec_values(params, i=None):
+    """
+    Renderer values of the winggen.vspscript of one design.
 
-    winglet_taper_ratio = 0.2
-    new_blended_chord_tip = chord_distribution(span_blend, span_blend + span_winglet, new_wing_chord_tip, new_wing_chord_tip * winglet_taper_ratio)  # meters
+    Parameters:
+        params (dict): Output of xsec_parameters.
+        i (int, optional): Index of the design when params holds arrays.
+
+    Returns:
+        dict: Renderer values setting the XSec parameters of the design.
+    """
+    values = {}
+    for (parameter, xsec), key in XSEC_PARAMETERS.items():
+        value = params[key] if i is None else params[key][i]
+        values[(parameter, xsec)] = "SetParmVal(wid, '{0}', '{1}', {2});".format(parameter, xsec, str(float(value)))
+    return values
+
+def batch(list_cant, list_sweep, template_path, output_root, planform=DEFAULT_PLANFORM):
+    """
+    Compute, screen and render the geometry of a whole cant/sweep grid in one pass.
+    Scripts are only written for valid designs, to output_root/winglet_c{cant}_s{sweep}/GEOMETRY.
+
+    Parameters:
+        list_cant (list): Cant angles (degrees).
+        list_sweep (list): Sweep angles (degrees).
+        template_path (str): Path to the winggen.vspscript template.
+        output_root (str): Directory containing the winglet directories.
+        planform (dict): Fixed planform parameters.
+
+    Returns:
+        tuple: (cant array, sweep array, parameters dict, reasons array).
+    """
+    cant, sweep = (grid.ravel() for grid in np.meshgrid(np.asarray(list_cant, dtype=float), np.asarray(list_sweep, dtype=float), indexing='ij'))
+    params = xsec_parameters(cant, sweep, planform)
+    reasons = check_planform(params)
+
+    template = template_renderer.compile_template(template_path, XSEC_RULES)
+
+    for i in np.flatnonzero(reasons == ''):
+        geometry_dir = os.path.join(output_root, f"winglet_c{cant[i]:g}_s{sweep[i]:g}", "GEOMETRY")
+        os.makedirs(geometry_dir, exist_ok=True)
+        template_renderer.render_file(template, xsec_values(params, i), os.path.join(geometry_dir, 'winggen.vspscript'))
+    return cant, sweep, params, reasons
+
+def write_screening(path, cant, sweep, params, reasons):
+    """Write the parameters and validity of every design of a batch to a CSV file."""
+    keys = list(params)
+    columns = [np.broadcast_to(params[key], cant.shape) for key in keys]
+    with open(path, "w") as file:
+        file.write(",".join(['cant', 'sweep'] + keys + ['valid', 'reason']) + "\n")
+        for i in range(len(cant)):
+            values = [f"{cant[i]:g}", f"{sweep[i]:g}"] + [f"{column[i]:.6g}" for column in columns]
+            file.write(",".join(values + [str(reasons[i] == ''), reasons[i]]) + "\n")
+
+def main(cant, sweep, output_dir, cache_dir=None, cache_size=artifact_cache.DEFAULT_CACHE_SIZE_GB):
+    """Generate wing geometry including blended winglet, reusing a cached wing.stp when available."""
+    output_dir = os.path.abspath(output_dir)
+
+    # Calculate geometry
+    params = xsec_parameters(cant, sweep)
+    reason = check_planform(params)[()]
+    if reason:
+        print(f"Invalid planform for cant {cant} and sweep {sweep}: {reason}")
+        sys.exit(1)
 
     script_path = os.path.join(output_dir, 'winggen.vspscript')
     if not os.path.exists(script_path):
@@ -100,54 +244,49 @@ def main(cant, sweep, output_dir):
         sys.exit()
 
     # Update script with new parameters
-    with open(script_path, "r") as file:
-        replaced_content = ""
-        for line in file:
-            if "'Tip_Chord', 'XSec_1'" in line.strip():
-                new_line = "SetParmVal(wid, 'Tip_Chord', 'XSec_1', {0});".format(str(new_wing_chord_tip))
-            elif "'Span', 'XSec_1'" in line.strip():
-                new_line = "SetParmVal(wid, 'Span', 'XSec_1', {0});".format(str(new_wing_span))
-            elif "'Span', 'XSec_2'" in line.strip():
-                new_line = "SetParmVal(wid, 'Span', 'XSec_2', {0});".format(str(span_blend))
-            elif "'Root_Chord', 'XSec_2'" in line.strip():
-                new_line = "SetParmVal(wid, 'Root_Chord', 'XSec_2', {0});".format(str(new_wing_chord_tip))
-            elif "'Tip_Chord', 'XSec_2'" in line.strip():
-                new_line = "SetParmVal(wid, 'Tip_Chord', 'XSec_2', {0});".format(str(new_blended_chord_tip))
-            elif "'Sweep', 'XSec_2'" in line.strip():
-                new_line = "SetParmVal(wid, 'Sweep', 'XSec_2', {0});".format(str(round((wing_sweep + sweep * 0.5), 4)))
-            elif "'Dihedral', 'XSec_2'" in line.strip():
-                new_line = "SetParmVal(wid, 'Dihedral', 'XSec_2', {0});".format(str(round((cant * 0.5), 4)))
-            elif "'Root_Chord', 'XSec_3'" in line.strip():
-                new_line = "SetParmVal(wid, 'Root_Chord', 'XSec_3', {0});".format(str(new_blended_chord_tip))
-            elif "'Tip_Chord', 'XSec_3'" in line.strip():
-                new_line = "SetParmVal(wid, 'Tip_Chord', 'XSec_3', {0});".format(str(new_wing_chord_tip * winglet_taper_ratio))
-            elif "'Sweep', 'XSec_3'" in line.strip():
-                new_line = "SetParmVal(wid, 'Sweep', 'XSec_3', {0});".format(str(round((wing_sweep + sweep), 4)))
-            elif "'Dihedral', 'XSec_3'" in line.strip():
-                new_line = "SetParmVal(wid, 'Dihedral', 'XSec_3', {0});".format(str(round((cant), 4)))
-            else:
-                new_line = line.strip()
-            replaced_content += new_line + "\n"
-
-    with open(script_path, "w") as write_file:
-        write_file.write(replaced_content)
-
-    os.chdir(output_dir)
+    template = template_renderer.compile_template(script_path, XSEC_RULES)
+    replaced_content = template_renderer.render_file(template, xsec_values(params), script_path)
+
+    # The rendered script fully determines the geometry
+    key = artifact_cache.cache_key('geometry', texts=[replaced_content])
+    cache_hit = artifact_cache.lookup(cache_dir, key, ['wing.stp'], output_dir)
+    stage_ledger.report_metrics(cache_hit=cache_hit)
+    if cache_hit:
+        print(f"Geometry restored from cache ({key[:12]})")
+        return
+
+    # A previous wing.stp may be a link to a cache entry of another key, which OpenVSP would overwrite in place
+    if os.path.lexists(os.path.join(output_dir, 'wing.stp')):
+        os.remove(os.path.join(output_dir, 'wing.stp'))
 
     # Run OpenVSP script
-    cmd_str = f"/path/to/OpenVSP_v3.37.0_Compiled/vspscript -script {script_path}"
-    subprocess.run(cmd_str, shell=True)
+    cmd_str = f"{tool_paths.VSPSCRIPT} -script {script_path}"
+    subprocess.run(cmd_str, cwd=output_dir, shell=True)
 
-    os.chdir("..")
+    if os.path.exists(os.path.join(output_dir, 'wing.stp')):
+        artifact_cache.store(cache_dir, key, ['wing.stp'], output_dir, int(cache_size * 1024**3))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Generate wing geometry with specified cant and sweep.')
     parser.add_argument('-c', '--cant', type=float, help='Cant angle (degrees)')
     parser.add_argument('-s', '--sweep', type=float, help='Sweep angle (degrees)')
     parser.add_argument('-o', '--output', type=str, help='Output directory', default='.')
+    parser.add_argument('--cache-dir', type=str, help='Artefact cache directory (disabled if not given)', default=None)
+    parser.add_argument('--cache-size', type=float, help='Size limit of the artefact cache in GB', default=artifact_cache.DEFAULT_CACHE_SIZE_GB)
+    parser.add_argument('--batch-cant', nargs='+', type=float, help='Screen and render a grid of cant angles (degrees)', default=None)
+    parser.add_argument('--batch-sweep', nargs='+', type=float, help='Screen and render a grid of sweep angles (degrees)', default=None)
+    parser.add_argument('--template', type=str, help='winggen.vspscript template used in batch mode', default='templates/winggen.vspscript')
     args = parser.parse_args()
 
+    if args.batch_cant or args.batch_sweep:
+        if not (args.batch_cant and args.batch_sweep):
+            parser.error("Provide both --batch-cant and --batch-sweep")
+        cant, sweep, params, reasons = batch(args.batch_cant, args.batch_sweep, args.template, args.output)
+        write_screening(os.path.join(args.output, 'geometry_screening.csv'), cant, sweep, params, reasons)
+        print(f"{np.count_nonzero(reasons == '')} valid and {np.count_nonzero(reasons != '')} invalid designs. Screening saved to geometry_screening.csv")
+        sys.exit()
+
     if args.cant is None or args.sweep is None:
         parser.error("Provide both cant and sweep values using -c/--cant and -s/--sweep")
 
-    main(args.cant, args.sweep, args.output)
\ No newline at end of file
+    main(args.cant, args.sweep, args.output, args.cache_dir, args.cache_size)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Submits a whole cant/sweep sweep as one PBS job array. A manifest lists the design
+                 points, the array script maps $PBS_ARRAY_INDEX to a point and records its exit status,
+                 so that only the failed indices need to be resubmitted.
+"""
+
+import os
+import csv
+import subprocess
+import template_renderer
+import tool_paths
+
+MANIFEST_NAME = 'manifest.csv'
+STATUS_DIR_NAME = 'status'
+MANIFEST_HEADER = ['index', 'cant', 'sweep', 'workdir']
+
+def write_manifest(manifest_path, points):
+    """
+    Writes the manifest of design points of the array.
+
+    Parameters:
+        manifest_path (str): Path to the manifest file.
+        points (list): Tuples (index, cant, sweep, workdir). The index identifies the point across resubmissions.
+    """
+    with open(manifest_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(MANIFEST_HEADER)
+        writer.writerows(points)
+
+def read_manifest(manifest_path):
+    """
+    Reads the manifest of design points of the array.
+
+    Returns:
+        list: Tuples (index, cant, sweep, workdir).
+    """
+    with open(manifest_path, 'r', newline='') as file:
+        reader = csv.DictReader(file)
+        return [(int(row['index']), int(row['cant']), int(row['sweep']), row['workdir']) for row in reader]
+
+def array_range(n_points, max_concurrent=None):
+    """
+    Returns the value of the #PBS -J directive for an array of n_points.
+    PBS Pro rejects single-index arrays, so one-point arrays get a padding index that exits immediately.
+    """
+    directive = f"0-{max(n_points - 1, 1)}"
+    if max_concurrent:
+        directive += f"%{max_concurrent}"
+    return directive
+
+def write_array_script(template_path, script_path, n_points, np, mem, time, steps, max_concurrent=None):
+    """
+    Writes the PBS array script from the array template.
+
+    Parameters:
+        template_path (str): Path to the array template.
+        script_path (str): Path to the array script to write.
+        n_points (int): Number of design points in the manifest.
+        np (int): Number of processors per design point.
+        mem (int): Memory per design point in GB.
+        time (int): Walltime per design point in hours.
+        steps (dict): Stages to run and solvers to use.
+        max_concurrent (int, optional): Maximum number of array indices running at the same time.
+    """
+    variables = template_renderer.step_variables(steps)
+    rules = template_renderer.PBS_RESOURCE_RULES + (('array', r'^#PBS -J'),) + template_renderer.assignment_rules(variables)
+    values = template_renderer.pbs_values(np, mem, time, variables)
+    values['array'] = f"#PBS -J {array_range(n_points, max_concurrent)}"
+    template_renderer.render_template_file(template_path, script_path, rules, values)
+
+def failed_points(array_dir):
+    """
+    Finds the design points of an array that did not finish successfully.
+    Points without a status file (never started or killed at walltime) count as failed.
+
+    Parameters:
+        array_dir (str): Directory containing the manifest and the status files.
+
+    Returns:
+        list: Tuples (index, cant, sweep, workdir) of the failed points.
+    """
+    status_dir = os.path.join(array_dir, STATUS_DIR_NAME)
+    failed = []
+    for point in read_manifest(os.path.join(array_dir, MANIFEST_NAME)):
+        status_file = os.path.join(status_dir, str(point[0]))
+        status = None
+        if os.path.exists(status_file):
+            with open(status_file, 'r') as file:
+                status = file.read().strip()
+        if status != '0':
+            failed.append(point)
+    return failed
+
+def submit_array(array_dir, script_name):
+    """
+    Submits an array script with qsub from its directory.
+
+    Returns:
+        str: Job ID of the array, or None if the submission failed.
+    """
+    try:
+        result = subprocess.run([tool_paths.QSUB, script_name], cwd=array_dir, check=True, capture_output=True, text=True)
+        job_id = result.stdout.strip()
+        print(f"Submitted job array {job_id}")
+        return job_id
+    except subprocess.CalledProcessError as e:
+        print(f"Error executing qsub: {e}")
+        return None
+
+def resubmit_failed(array_dir, template_path, np, mem, time, steps, max_concurrent=None):
+    """
+    Resubmits only the failed points of a previous array.
+    The failed points are moved to a new manifest so that PBS indices stay contiguous,
+    while their original index is kept for the status files.
+
+    Returns:
+        str: Job ID of the new array, or None if nothing was submitted.
+    """
+    manifest_path = os.path.join(array_dir, MANIFEST_NAME)
+    points = failed_points(array_dir)
+    if not points:
+        print("No failed design points to resubmit.")
+        return None
+
+    # Keep the previous manifest for reference
+    attempt = 1
+    while os.path.exists(os.path.join(array_dir, f"manifest.{attempt}.csv")):
+        attempt += 1
+    os.rename(manifest_path, os.path.join(array_dir, f"manifest.{attempt}.csv"))
+
+    write_manifest(manifest_path, points)
+    write_array_script(template_path, os.path.join(array_dir, "submit_array.pbs"), len(points), np, mem, time, steps, max_concurrent)
+    print(f"Resubmitting {len(points)} failed design points: {', '.join(str(point[0]) for point in points)}")
+    return submit_array(array_dir, "submit_array.pbs")
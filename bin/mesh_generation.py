@@ -11,44 +11,71 @@ import os
 import sys
 import argparse
 import math
+import re
+import artifact_cache
+import yplus_estimator
+import file_waiter
+import template_renderer
+import tool_paths
+import artifact_staging
+import stage_ledger
+import mpi_layout
+
+PRISM_WALL_THICKNESS = re.compile(r'PrismWallThickness\.class\)\.setValue\(([^)]*)\)')
+PRISM_LAYER_RULES = (
+    ('near_wall', r'PrismWallThickness\.class\)\.setValue'),
+    ('num_layers', r'integerValue_0\.getQuantity\(\)\.setValue'),
+)
+
+def read_prism_wall_thickness(macro_path):
+    """
+    Reads the first-cell height of the prism layer from the macro file.
+    """
+    with open(macro_path, "r") as file:
+        for line in file:
+            match = PRISM_WALL_THICKNESS.search(line)
+            if match:
+                return float(match.group(1))
+    raise ValueError("PrismWallThickness.class).setValue not found in macro file.")
+
+def set_prism_layer(macro_path, near_wall):
+    """
+    Sets the first-cell height of the prism layer in the macro file, and the number of layers
+    needed to reach the prism layer thickness with a growth rate of 1.2.
+    """
+    num_prism_layers = math.ceil((math.log(1 + (0.2 * 0.01 / near_wall)) / math.log(1.2)))
+
+    template_renderer.render_template_file(macro_path, macro_path, PRISM_LAYER_RULES, {
+        'near_wall': "autoMeshOperation_0.getDefaultValues().get(PrismWallThickness.class).setValue({0});".format(str(near_wall)),
+        'num_layers': "integerValue_0.getQuantity().setValue({0});".format(str(num_prism_layers)),
+    })
 
 def update_prism_layer(macro_path, max_yplus):
     """
     Updates the prism layer configuration in the macro file based on the max y+ value.
     """
-    with open(macro_path, "r") as file:
-        content = file.readlines()
-
-    current_near_wall = None
-    for line in content:
-        if "PrismWallThickness.class).setValue" in line.strip():
-            line = line.strip()
-            line = line.strip("autoMeshOperation_0.getDefaultValues().get(PrismWallThickness.class).setValue(")
-            line = line.strip(");")
-            current_near_wall = float(line)
-            break
-
-    if current_near_wall is None:
-        raise ValueError("PrismWallThickness.class).setValue not found in macro file.")
-
-    new_near_wall = current_near_wall / (max_yplus * 1.1)
-    num_prism_layers = math.ceil((math.log(1 + (0.2 * 0.01 / new_near_wall)) / math.log(1.2)))
-
-    new_content = []
-    for line in content:
-        if "PrismWallThickness.class).setValue" in line.strip():
-            new_line = "autoMeshOperation_0.getDefaultValues().get(PrismWallThickness.class).setValue({0});".format(str(new_near_wall))
-            new_content.append(new_line + "\n")
-        elif "integerValue_0.getQuantity().setValue" in line.strip():
-            new_line = "integerValue_0.getQuantity().setValue({0});".format(str(num_prism_layers))
-            new_content.append(new_line + "\n")
-        else:
-            new_content.append(line)
-
-    with open(macro_path, "w") as file:
-        file.writelines(new_content)
-
-def main(np, input_dir, output_dir, prism_layer, max_yplus=None):
+    current_near_wall = read_prism_wall_thickness(macro_path)
+    set_prism_layer(macro_path, yplus_estimator.corrected_height([(current_near_wall, max_yplus)]))
+
+def size_solver_jobs(mesh_path, design_dir, cells_per_rank=None, cores_per_node=mpi_layout.DEFAULT_CORES_PER_NODE, max_nodes=None):
+    """
+    Records the cell count of a new mesh and, with cells_per_rank, resizes the queued CFD/ASO jobs of the design to it.
+    Sizing never fails the mesh stage.
+    """
+    try:
+        cells = mpi_layout.mesh_cells(mesh_path)
+    except Exception as e:
+        print(f"Error counting the cells of {mesh_path}: {e}")
+        return
+    stage_ledger.report_metrics(cells=cells)
+    if cells_per_rank:
+        layout = mpi_layout.plan(cells, cells_per_rank, cores_per_node, max_nodes)
+        resized = mpi_layout.resize_queued_stages(design_dir, layout)
+        print(f"{cells} cells: {layout.nodes} x {layout.ranks_per_node} ranks, {layout.mem_per_node} GB per node"
+              + (f" (resized jobs {', '.join(resized)})" if resized else ""))
+
+def main(np, input_dir, output_dir, prism_layer, max_yplus=None, cache_dir=None, cache_size=artifact_cache.DEFAULT_CACHE_SIZE_GB, timeout=None,
+         first_cell_height=None, cfg_path=None, cells_per_rank=None, cores_per_node=mpi_layout.DEFAULT_CORES_PER_NODE, max_nodes=None):
     """
     Main function to set up and run the meshing process with STAR-CCM+.
 
@@ -58,34 +85,40 @@ def main(np, input_dir, output_dir, prism_layer, max_yplus=None):
     output_dir (str): Directory to save the output files.
     prism_layer (int): Whether to include prism layer (0: No, 1: Yes).
     max_yplus (float, optional): Maximum y+ value to adjust the prism layer.
+    cache_dir (str, optional): Artefact cache directory. The mesh is reused when the macro, domain and wing are unchanged.
+    cache_size (float, optional): Size limit of the artefact cache in GB.
+    timeout (float, optional): Maximum time in seconds to wait for STAR-CCM+ to write the mesh.
+    first_cell_height (float, optional): First-cell height of the prism layer (m).
+    cfg_path (str, optional): RANS configuration used to predict the first-cell height when neither
+                              first_cell_height nor max_yplus is given. Defaults to CFD/RANS/RANS-cfd.cfg of the design.
+    cells_per_rank (int, optional): Resize the queued CFD/ASO jobs of the design to this many cells per rank.
+    cores_per_node (int): Cores of a compute node, for the resizing.
+    max_nodes (int, optional): Maximum number of nodes of the resized jobs.
     """
     try:
         mesh_subdir = "with_prism" if prism_layer == 1 else "without_prism"
-        output_dir = os.path.join(output_dir, mesh_subdir)
+        input_dir = os.path.abspath(input_dir)
+        output_dir = os.path.abspath(os.path.join(output_dir, mesh_subdir))
         
-        os.chdir(output_dir)
-
         # Remove existing files if they exist
-        if os.path.exists('./mesh.cga'):
-            os.remove('./mesh.cga')
-
-        if os.path.exists('./star@meshed.sim'):
-            os.remove('./star@meshed.sim')
+        for name in ['mesh.cga', 'star@meshed.sim']:
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
 
         # Check for required input STEP files
         wing_file = os.path.join(input_dir, 'wing.stp')
-        domain_file = os.path.join(output_dir, 'domain.stp')
+        domain_file = os.path.join(output_dir, 'domain.STEP')
 
         if not os.path.exists(wing_file):
             print(f"Input file '{wing_file}' not found. Please run the geometry generation step first.")
             sys.exit(1)  # Exit if wing.stp file is missing
 
         if not os.path.exists(domain_file):
-            print(f"Input file '{domain_file}' not found. Please provide the domain.stp file in the MESH directory.")
-            sys.exit(1)  # Exit if domain.stp file is missing
+            print(f"Input file '{domain_file}' not found. Please provide the domain.STEP file in the MESH directory.")
+            sys.exit(1)  # Exit if domain.STEP file is missing
 
-        # Copy the wing.stp file to the output directory
-        subprocess.run(['cp', wing_file, output_dir])
+        # Link the wing.stp file into the output directory
+        artifact_staging.stage_file(wing_file, output_dir)
 
         # Select the appropriate macro file based on prism layer configuration
         macro_file = "macro_with_prism.java" if prism_layer == 1 else "macro_without_prism.java"
@@ -99,17 +132,42 @@ def main(np, input_dir, output_dir, prism_layer, max_yplus=None):
             print(f"Required macro file without prism layer '{macro_path}' not found.")
             sys.exit(1)  # Exit if macro file is missing for no prism layer
 
-        # Update the prism layer if max_yplus is provided
-        if max_yplus and prism_layer == 1:
-            update_prism_layer(macro_path, max_yplus)
-
-        # Run STAR-CCM+ command
-        cmd_str = f"starccm+ -batch {macro_path} -power -podkey KEY -licpath 1999@flex.cd-adapco.com -np {np}"
-        subprocess.run(cmd_str, shell=True)
-
-        # Wait until the mesh file is generated
-        while not os.path.exists('./mesh.cga'):
-            pass
+        # Size the prism layer: explicit height, correction from a previous y+, or prediction from the freestream
+        if prism_layer == 1:
+            if first_cell_height:
+                set_prism_layer(macro_path, first_cell_height)
+            elif max_yplus:
+                update_prism_layer(macro_path, max_yplus)
+            else:
+                if cfg_path is None:
+                    cfg_path = os.path.join(os.path.dirname(os.path.dirname(output_dir)), 'CFD', 'RANS', 'RANS-cfd.cfg')
+                if os.path.exists(cfg_path):
+                    predicted_height = yplus_estimator.first_cell_height(cfg_path)
+                    print(f"Predicted first-cell height: {predicted_height:.3e} m")
+                    set_prism_layer(macro_path, predicted_height)
+
+        # The mesh is fully determined by the macro and the two STEP inputs
+        key = artifact_cache.cache_key('mesh', files=[macro_path, domain_file, wing_file], params={'prism_layer': prism_layer})
+        cache_hit = artifact_cache.lookup(cache_dir, key, ['mesh.cga'], output_dir)
+        stage_ledger.report_metrics(cache_hit=cache_hit, prism_layer=prism_layer,
+                                    first_cell_height=read_prism_wall_thickness(macro_path) if prism_layer == 1 else None)
+        design_dir = os.path.dirname(os.path.dirname(output_dir))
+        if cache_hit:
+            print(f"Mesh restored from cache ({key[:12]})")
+            size_solver_jobs(os.path.join(output_dir, 'mesh.cga'), design_dir, cells_per_rank, cores_per_node, max_nodes)
+            return
+
+        # Run STAR-CCM+ command, over every node of the job
+        cmd_str = f"{tool_paths.STARCCM} -batch {macro_path} -power -podkey KEY -licpath 1999@flex.cd-adapco.com -np {np}"
+        if len(set(mpi_layout.allocated_hosts())) > 1:
+            cmd_str += f" -machinefile {os.environ['PBS_NODEFILE']}"
+        process = subprocess.Popen(cmd_str, cwd=output_dir, shell=True, start_new_session=True)
+
+        # Wait until STAR-CCM+ exits (the macro still saves the simulation after the mesh file) and check the mesh file
+        file_waiter.wait_for_exit(process, os.path.join(output_dir, 'mesh.cga'), timeout)
+
+        artifact_cache.store(cache_dir, key, ['mesh.cga'], output_dir, int(cache_size * 1024**3))
+        size_solver_jobs(os.path.join(output_dir, 'mesh.cga'), design_dir, cells_per_rank, cores_per_node, max_nodes)
 
     except Exception as e:
         print("An error occurred:", e)
@@ -122,9 +180,18 @@ if __name__ == "__main__":
     parser.add_argument('-o', '--output', type=str, help='Output directory', default='.')
     parser.add_argument('-pl', '--prism-layer', type=int, choices=[0, 1], help='Include prism layer in mesh (0: No, 1: Yes)', default=0)
     parser.add_argument('-my', '--max-yplus', type=float, help='Maximum y+ value to adjust the prism layer', default=None)
+    parser.add_argument('--cache-dir', type=str, help='Artefact cache directory (disabled if not given)', default=None)
+    parser.add_argument('--cache-size', type=float, help='Size limit of the artefact cache in GB', default=artifact_cache.DEFAULT_CACHE_SIZE_GB)
+    parser.add_argument('--timeout', type=float, help='Maximum time in hours to wait for the mesh', default=None)
+    parser.add_argument('--first-cell-height', type=float, help='First-cell height of the prism layer (m)', default=None)
+    parser.add_argument('--cfg', type=str, help='RANS configuration used to predict the first-cell height', default=None)
+    parser.add_argument('--cells-per-rank', type=int, help='Resize the queued CFD/ASO jobs of the design to this many cells per MPI rank', default=None)
+    parser.add_argument('--cores-per-node', type=int, help='Cores of a compute node', default=mpi_layout.DEFAULT_CORES_PER_NODE)
+    parser.add_argument('--max-nodes', type=int, help='Maximum number of nodes of the CFD/ASO jobs', default=None)
     args = parser.parse_args()
 
     if args.np is None:
         parser.error("Please provide an integer as number of processes to run in parallel")
 
-    main(args.np, args.input, args.output, args.prism_layer, args.max_yplus)
\ No newline at end of file
+    main(args.np, args.input, args.output, args.prism_layer, args.max_yplus, args.cache_dir, args.cache_size,
+         args.timeout * 3600 if args.timeout else None, args.first_cell_height, args.cfg, args.cells_per_rank, args.cores_per_node, args.max_nodes)
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Sizes the MPI jobs of the CFD and ASO from the cell count of their mesh: number of nodes,
+                 ranks per node and memory per node for a target number of cells per rank, rendered as a
+                 multi-chunk PBS select. Also gives the number of ranks actually allocated to a running
+                 job, so that every mpiexec and STAR-CCM+ call of the job uses the same -np.
+"""
+
+import os
+import json
+import math
+import subprocess
+from collections import namedtuple
+import tool_paths
+
+DEFAULT_CELLS_PER_RANK = 50000
+DEFAULT_CORES_PER_NODE = 48
+# Memory of the solver per million cells (adjoint RANS is the most demanding), and of each MPI rank
+DEFAULT_GB_PER_MCELL = 4.0
+GB_PER_RANK = 0.5
+MIN_MEM_GB = 8
+# Written next to a mesh: its cell count, with the size and modification time it was counted for
+CELLS_SUFFIX = '.cells'
+
+Layout = namedtuple('Layout', ['nodes', 'ranks_per_node', 'mem_per_node'])
+
+def plan(cells, cells_per_rank=DEFAULT_CELLS_PER_RANK, cores_per_node=DEFAULT_CORES_PER_NODE, max_nodes=None,
+         gb_per_mcell=DEFAULT_GB_PER_MCELL):
+    """
+    Chooses the nodes, ranks per node and memory per node of a mesh.
+
+    Parameters:
+        cells (int): Number of cells of the mesh.
+        cells_per_rank (int): Target number of cells per MPI rank.
+        cores_per_node (int): Cores of a compute node.
+        max_nodes (int, optional): Maximum number of nodes of a job.
+        gb_per_mcell (float): Memory of the solver per million cells in GB.
+
+    Returns:
+        Layout: Nodes, ranks per node and memory per node in GB. The ranks are spread evenly over the nodes.
+    """
+    ranks = max(1, math.ceil(cells / cells_per_rank))
+    nodes = math.ceil(ranks / cores_per_node)
+    if max_nodes:
+        nodes = min(nodes, max_nodes)
+    ranks_per_node = min(cores_per_node, math.ceil(ranks / nodes))
+    mem_per_node = max(MIN_MEM_GB, math.ceil(gb_per_mcell * cells / 1e6 / nodes + GB_PER_RANK * ranks_per_node))
+    return Layout(nodes, ranks_per_node, mem_per_node)
+
+def resources(layout, time):
+    """Stage resources (ncpus, mem, walltime, nodes) of a layout, see stage_jobs.parse_stage_resources."""
+    return (layout.ranks_per_node, layout.mem_per_node, time, layout.nodes)
+
+def su2_cells(mesh_path):
+    """Number of elements (NELEM) of a native SU2 mesh, summed over its zones."""
+    cells = 0
+    with open(mesh_path, 'r') as file:
+        for line in file:
+            if line.startswith('NELEM='):
+                cells += int(line.split('=', 1)[1])
+                # The elements follow: skip them
+                for _ in range(int(line.split('=', 1)[1])):
+                    next(file)
+    return cells
+
+def cgns_cells(mesh_path):
+    """Number of cells of a CGNS mesh, read with VTK."""
+    import vtk
+    reader = vtk.vtkCGNSReader()
+    reader.SetFileName(mesh_path)
+    reader.Update()
+    output = reader.GetOutput()
+    iterator = output.NewIterator()
+    iterator.InitTraversal()
+    cells = 0
+    while not iterator.IsDoneWithTraversal():
+        cells += iterator.GetCurrentDataObject().GetNumberOfCells()
+        iterator.GoToNextItem()
+    return cells
+
+def mesh_cells(mesh_path):
+    """
+    Number of cells of a mesh (native SU2, or CGNS as written by STAR-CCM+).
+    The count is kept in <mesh>.cells and only recomputed when the mesh changes.
+    """
+    stat = os.stat(mesh_path)
+    cells_path = mesh_path + CELLS_SUFFIX
+    try:
+        with open(cells_path, 'r') as file:
+            entry = json.load(file)
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['cells']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    cells = su2_cells(mesh_path) if mesh_path.endswith('.su2') else cgns_cells(mesh_path)
+    with open(cells_path, 'w') as file:
+        json.dump({'cells': cells, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, file)
+    return cells
+
+def solver_mesh(workdir, solver):
+    """Mesh of a design point used by a solver (Euler: without prism layer, RANS: with), or None if not generated yet."""
+    mesh_path = os.path.join(workdir, 'MESH', 'with_prism' if solver == 'RANS' else 'without_prism', 'mesh.cga')
+    return mesh_path if os.path.exists(mesh_path) else None
+
+def design_layout(workdir, solver, steps):
+    """
+    Layout of the CFD/ASO of a design point from its mesh, or None when sizing is disabled (no
+    cells_per_rank in steps) or the mesh does not exist yet.
+    """
+    if not steps.get('cells_per_rank') or not solver:
+        return None
+    mesh_path = solver_mesh(workdir, solver)
+    if mesh_path is None:
+        return None
+    return plan(mesh_cells(mesh_path), steps['cells_per_rank'], steps.get('cores_per_node', DEFAULT_CORES_PER_NODE),
+                steps.get('max_nodes'))
+
+def select(layout):
+    """Value of the PBS select resource of a layout."""
+    return f"{layout.nodes}:ncpus={layout.ranks_per_node}:mpiprocs={layout.ranks_per_node}:mem={layout.mem_per_node}gb"
+
+def resize_job(job_id, layout):
+    """Changes the select of a queued (or held) PBS job."""
+    try:
+        subprocess.run([tool_paths.QALTER, '-l', f"select={select(layout)}", job_id], check=True)
+        return True
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error resizing job {job_id}: {e}")
+        return False
+
+def resize_queued_stages(workdir, layout):
+    """
+    Resizes the CFD and ASO jobs of a design point that are still queued (e.g. waiting for the mesh job),
+    as recorded in the run index.
+
+    Returns:
+        list: Job IDs resized.
+    """
+    import run_index
+    connection = run_index.connect(run_index.index_path(workdir))
+    rows = [row for row in run_index.stage_status(connection) if row['workdir'] == os.path.abspath(workdir)
+            and run_index.split_key(row['stage'])[0] in ('cfd', 'aso') and row['status'] == 'submitted'
+            and row['job_id'] and not row['job_id'].endswith('.local')]
+    connection.close()
+    return [row['job_id'] for row in rows if resize_job(row['job_id'], layout)]
+
+def allocated_hosts():
+    """Hosts of the running PBS job, one entry per MPI rank (PBS_NODEFILE), or an empty list outside PBS."""
+    nodefile = os.environ.get('PBS_NODEFILE')
+    if not nodefile or not os.path.exists(nodefile):
+        return []
+    with open(nodefile, 'r') as file:
+        return [line.strip() for line in file if line.strip()]
+
+def allocated_ranks(default=None):
+    """
+    Number of MPI ranks of the running job: every mpiprocs of every chunk (PBS_NODEFILE), or NCPUS
+    (the ncpus of the first chunk) if larger, else default.
+    """
+    ncpus = int(os.environ['NCPUS']) if os.environ.get('NCPUS', '').isdigit() else 0
+    return max(len(allocated_hosts()), ncpus) or default
+
+def mpiexec(default=None):
+    """The mpiexec prefix with the ranks of the running job (all chunks), or without -n if unknown."""
+    ranks = allocated_ranks(default)
+    return f"{tool_paths.MPIEXEC} -n {ranks}" if ranks else tool_paths.MPIEXEC
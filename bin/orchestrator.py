@@ -0,0 +1,162 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Asynchronous submission of a sweep, one job per design point, with a bounded number of jobs
+                 in flight. The next design point is submitted as soon as a job finishes, so that a sweep
+                 larger than the per-user queue limit keeps its share of the queue without being watched.
+
+                 All the jobs in flight are polled with a single qstat call. Jobs qstat does not report (failed
+                 call) are kept in flight until a later poll says they finished. When a job finishes, the stages
+                 it did not record are marked as failed in the run index, a job requeued before its walltime
+                 (see requeue.py) is followed under its new ID, and the outcome of the design point (exit
+                 status, stage statuses, CL and CD) is appended to orchestrator_results.csv as it comes.
+"""
+
+import os
+import csv
+import asyncio
+import executors
+import run_index
+import tool_paths
+
+RESULTS_NAME = 'orchestrator_results.csv'
+RESULT_COLUMNS = ['cant', 'sweep', 'job_id', 'exit_status', 'status', 'stages', 'cl', 'cd']
+
+async def submit(workdir, script='submit.pbs'):
+    """
+    Submits a job script from its directory (qsub is given the directory, not the process).
+
+    Returns:
+        str: Job ID, or None if the submission failed.
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(tool_paths.QSUB, script, cwd=workdir,
+                                                       stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+    except OSError as e:
+        print(f"Error executing qsub in {workdir}: {e}")
+        return None
+    if process.returncode != 0:
+        print(f"Error executing qsub in {workdir}: {stderr.decode().strip()}")
+        return None
+    return stdout.decode().strip()
+
+def design_stages(index_path, workdir):
+    """Rows of the run index of the stages of a design point."""
+    connection = run_index.connect(index_path)
+    rows = [row for row in run_index.stage_status(connection) if row['workdir'] == os.path.abspath(workdir)]
+    connection.close()
+    return rows
+
+def requeued_job(rows, job_id):
+    """New job of a design point whose job was requeued (see requeue.resubmit), or None."""
+    for row in rows:
+        if row['status'] == 'submitted' and row['job_id'] not in (None, job_id):
+            return row['job_id']
+    return None
+
+def design_outcome(index_path, workdir, cant, sweep, stages, job_id, exit_status, rows):
+    """
+    Outcome of a design point whose job finished. Stages of the job still submitted or running never
+    recorded their end (killed at the walltime, or failed before the stage wrapper started) and are
+    marked as failed in the run index.
+
+    Returns:
+        dict: cant, sweep, job ID, exit status, status (done or failed), status of each stage, CL and CD.
+    """
+    statuses = {row['stage']: row['status'] for row in rows}
+    for row in rows:
+        if row['stage'] in stages and row['status'] in ('submitted', 'running') and row['job_id'] == job_id:
+            run_index.record_stage(index_path, workdir, row['stage'], 'failed', exit_status)
+            statuses[row['stage']] = 'failed'
+    cfd = next((row for row in rows if row['stage'] in stages and run_index.split_key(row['stage'])[0] == 'cfd'), None)
+    done = exit_status == 0 and all(statuses.get(stage) == 'done' for stage in stages)
+    return {
+        'cant': cant,
+        'sweep': sweep,
+        'job_id': job_id,
+        'exit_status': exit_status,
+        'status': 'done' if done else 'failed',
+        'stages': {stage: statuses.get(stage, '-') for stage in stages},
+        'cl': cfd['cl'] if cfd else None,
+        'cd': cfd['cd'] if cfd else None,
+    }
+
+def append_result(results_path, outcome):
+    """Appends the outcome of a design point to the results file."""
+    new_file = not os.path.exists(results_path)
+    with open(results_path, 'a', newline='') as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(RESULT_COLUMNS)
+        writer.writerow([" ".join(f"{stage}={status}" for stage, status in outcome['stages'].items()) if column == 'stages'
+                         else outcome[column] for column in RESULT_COLUMNS])
+
+def report(outcome):
+    cl = f", CL = {outcome['cl']:.5f}, CD = {outcome['cd']:.5f}" if outcome['cl'] is not None and outcome['cd'] is not None else ""
+    print(f"winglet_c{outcome['cant']}_s{outcome['sweep']}: {outcome['status']} (job {outcome['job_id']}, "
+          f"exit {outcome['exit_status']}{cl})")
+
+async def run_sweep(points, render, stages, index_path, results_path, max_in_flight=50, poll_interval=60.0):
+    """
+    Submits the jobs of the design points with at most max_in_flight queued or running, until all have finished.
+
+    Parameters:
+        points (list): (cant, sweep) design points in submission order.
+        render (callable): render(cant, sweep) prepares the winglet directory and its submit.pbs, and returns the directory.
+        stages (list): Keys of the stages run by each job in the run index (e.g. cfd_euler, see run_index.stage_key).
+        index_path (str): Run index of the sweep.
+        results_path (str): CSV file the outcomes are appended to.
+        max_in_flight (int): Maximum number of jobs queued or running at the same time.
+        poll_interval (float): Seconds between two qstat calls.
+
+    Returns:
+        list: Outcome of every design point (see design_outcome), in the order they finished.
+    """
+    pending = list(points)
+    in_flight = {}
+    outcomes = []
+
+    def finish(outcome):
+        outcomes.append(outcome)
+        append_result(results_path, outcome)
+        report(outcome)
+
+    while pending or in_flight:
+        free = max(0, max_in_flight - len(in_flight))
+        batch, pending = pending[:free], pending[free:]
+        if batch:
+            workdirs = [render(cant, sweep) for cant, sweep in batch]
+            job_ids = await asyncio.gather(*(submit(workdir) for workdir in workdirs))
+            submissions = []
+            for (cant, sweep), workdir, job_id in zip(batch, workdirs, job_ids):
+                if job_id is None:
+                    finish({'cant': cant, 'sweep': sweep, 'job_id': None, 'exit_status': None, 'status': 'failed',
+                            'stages': {stage: '-' for stage in stages}, 'cl': None, 'cd': None})
+                    continue
+                in_flight[job_id] = (cant, sweep, workdir)
+                submissions.extend((workdir, stage, job_id) for stage in stages)
+            run_index.record_submissions(index_path, submissions)
+            print(f"{len(in_flight)} jobs in flight, {len(pending)} design points waiting")
+        if not in_flight:
+            continue
+
+        await asyncio.sleep(poll_interval)
+        status = await asyncio.to_thread(executors.qstat_status, sorted(in_flight))
+        for job_id, (state, exit_status) in status.items():
+            if not executors.job_finished(state):
+                continue
+            cant, sweep, workdir = in_flight.pop(job_id)
+            rows = design_stages(index_path, workdir)
+            next_job_id = requeued_job(rows, job_id)
+            if next_job_id:
+                print(f"winglet_c{cant}_s{sweep}: requeued as job {next_job_id}")
+                in_flight[next_job_id] = (cant, sweep, workdir)
+                continue
+            finish(design_outcome(index_path, workdir, cant, sweep, stages, job_id, exit_status, rows))
+
+    failed = sum(outcome['status'] != 'done' for outcome in outcomes)
+    print(f"{len(outcomes) - failed} of {len(outcomes)} design points completed successfully. Results in {results_path}")
+    return outcomes
@@ -0,0 +1,256 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Pilot jobs: long-lived workers that drain a shared queue of stage tasks inside one PBS
+                 allocation, so that short stages (geometry, Euler CFD) do not each pay the queue wait and
+                 the module and conda start-up of a job.
+
+                 The queue is an SQLite file (pilot_queue.sqlite in the output directory) with one task per
+                 stage of a design point, chained to the previous stage of the same design. Every worker
+                 claims ready tasks in an exclusive transaction and runs them side by side within its cores,
+                 largest first, through the stage wrapper (ledger, run index and checkpoints, see
+                 stage_ledger.py). A worker stops when the queue is drained, or a margin before its walltime:
+                 the stages it is running are then stopped and put back in the queue, where the next worker
+                 resumes them. Tasks of a worker that died are put back after STALE_S without heartbeat.
+
+    Usage:  python3 pilot.py work <queue> [--cores N] [--script <pilot job script>] [--margin MIN]
+            python3 pilot.py status <queue>
+"""
+
+import os
+import sys
+import time
+import socket
+import sqlite3
+import argparse
+import subprocess
+from datetime import datetime
+import convergence_monitor
+import requeue
+
+QUEUE_NAME = 'pilot_queue.sqlite'
+STATUSES = ['queued', 'running', 'done', 'failed']
+# A running task whose worker has not been heard of for this long is put back in the queue
+STALE_S = 900
+BIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    workdir TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    command TEXT NOT NULL,
+    ncpus INTEGER NOT NULL,
+    after INTEGER REFERENCES tasks (id),
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    exit_status INTEGER,
+    heartbeat REAL,
+    started TEXT,
+    finished TEXT,
+    UNIQUE (workdir, stage)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, ncpus);
+"""
+
+def queue_path(output_dir):
+    return os.path.join(os.path.abspath(output_dir), QUEUE_NAME)
+
+def connect(path):
+    """Opens a queue, creating its table if needed. Transactions are explicit (BEGIN IMMEDIATE)."""
+    connection = sqlite3.connect(path, timeout=120, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def enqueue(path, tasks):
+    """
+    Adds stage tasks to the queue in one transaction, each one after the previous task of the same design.
+    Tasks already in the queue are queued again (with their new command), unless they are running.
+
+    Parameters:
+        path (str): Queue file.
+        tasks (list): Tuples (winglet directory, stage, command, ncpus), in stage order for each design.
+
+    Returns:
+        int: Number of tasks queued.
+    """
+    connection = connect(path)
+    previous = {}
+    queued = 0
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for workdir, stage, command, ncpus in tasks:
+            workdir = os.path.abspath(workdir)
+            after = previous.get(workdir)
+            cursor = connection.execute(
+                "INSERT INTO tasks (workdir, stage, command, ncpus, after) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (workdir, stage) DO UPDATE SET command = excluded.command, ncpus = excluded.ncpus, "
+                "after = excluded.after, status = 'queued', worker = NULL, exit_status = NULL, finished = NULL "
+                "WHERE status != 'running'", (workdir, stage, command, ncpus, after))
+            queued += cursor.rowcount
+            previous[workdir] = connection.execute("SELECT id FROM tasks WHERE workdir = ? AND stage = ?", (workdir, stage)).fetchone()['id']
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.close()
+    return queued
+
+def claim(connection, worker, free_cores, total_cores):
+    """
+    Takes the largest ready task that fits in the free cores: queued, and its previous stage done.
+    Tasks larger than the whole worker run on all its cores. Also puts back the tasks of dead workers,
+    and fails the tasks whose previous stage failed.
+
+    Returns:
+        sqlite3.Row: Claimed task, or None.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("UPDATE tasks SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?",
+                           (time.time() - STALE_S,))
+        connection.execute("UPDATE tasks SET status = 'failed', finished = ? WHERE status = 'queued' "
+                           "AND after IN (SELECT id FROM tasks WHERE status = 'failed')", (now(),))
+        task = connection.execute(
+            "SELECT t.* FROM tasks t LEFT JOIN tasks a ON a.id = t.after "
+            "WHERE t.status = 'queued' AND (t.after IS NULL OR a.status = 'done') AND MIN(t.ncpus, ?) <= ? "
+            "ORDER BY t.ncpus DESC, t.id LIMIT 1", (total_cores, free_cores)).fetchone()
+        if task:
+            connection.execute("UPDATE tasks SET status = 'running', worker = ?, attempts = attempts + 1, heartbeat = ?, started = ? "
+                               "WHERE id = ?", (worker, time.time(), now(), task['id']))
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    return task
+
+def set_status(connection, task_id, status, exit_status=None):
+    """Records the end of a task (done, failed), or puts it back in the queue (queued)."""
+    connection.execute("UPDATE tasks SET status = ?, exit_status = ?, finished = ?, worker = CASE WHEN ? = 'queued' THEN NULL ELSE worker END "
+                       "WHERE id = ?", (status, exit_status, None if status == 'queued' else now(), status, task_id))
+
+def heartbeat(connection, worker):
+    connection.execute("UPDATE tasks SET heartbeat = ? WHERE worker = ? AND status = 'running'", (time.time(), worker))
+
+def unfinished(connection):
+    """Number of queued and running tasks of every worker."""
+    return connection.execute("SELECT COUNT(*) FROM tasks WHERE status IN ('queued', 'running')").fetchone()[0]
+
+def start_task(task, ncpus, bin_dir):
+    """Starts a task in its design directory, in its own session, logging to <stage>.log."""
+    env = dict(os.environ, BIN_DIR=bin_dir, NP=str(ncpus), NCPUS=str(ncpus))
+    # The task only gets its share of the node: the ranks of the node file belong to the whole pilot
+    env.pop('PBS_NODEFILE', None)
+    with open(os.path.join(task['workdir'], f"{task['stage']}.log"), 'a') as log:
+        return subprocess.Popen(task['command'], cwd=task['workdir'], shell=True, env=env,
+                                stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+def release(task):
+    """Marks a stopped stage as submitted again in the run index, so that it is not taken for failed."""
+    try:
+        import run_index
+        run_index.reset_stage(run_index.index_path(task['workdir']), task['workdir'], task['stage'])
+    except Exception as e:
+        print(f"Error updating the run index of {task['workdir']}: {e}")
+
+def work(path, total_cores=None, script=None, margin_min=requeue.DEFAULT_MARGIN_MIN, poll_interval=5.0, bin_dir=BIN_DIR):
+    """
+    Runs the tasks of a queue until it is drained or the walltime of the pilot job is near.
+
+    Parameters:
+        path (str): Queue file.
+        total_cores (int, optional): Cores shared by the tasks. Defaults to NCPUS, or the cores of the machine.
+        script (str, optional): PBS script of the pilot job, whose walltime bounds the worker.
+        margin_min (float): Minutes before the walltime at which running tasks are stopped and queued again.
+        poll_interval (float): Seconds between two checks of the running tasks and the queue.
+        bin_dir (str): Directory of the stage scripts.
+
+    Returns:
+        dict: Number of tasks done, failed and put back in the queue by this worker.
+    """
+    worker = os.environ.get('PBS_JOBID') or f"{socket.gethostname()}:{os.getpid()}"
+    if total_cores is None:
+        total_cores = int(os.environ['NCPUS']) if os.environ.get('NCPUS', '').isdigit() else os.cpu_count() or 1
+    deadline = requeue.deadline(script, margin_min) if script else None
+    connection = connect(path)
+    running = {}
+    counts = {'done': 0, 'failed': 0, 'queued': 0}
+    free_cores = total_cores
+    print(f"Worker {worker}: {total_cores} cores" + (f", until {datetime.fromtimestamp(deadline):%H:%M:%S}" if deadline else ""))
+
+    while True:
+        for task_id, (task, process, ncpus) in list(running.items()):
+            returncode = process.poll()
+            if returncode is not None:
+                status = 'done' if returncode == 0 else 'failed'
+                set_status(connection, task_id, status, returncode)
+                counts[status] += 1
+                free_cores += ncpus
+                del running[task_id]
+                print(f"{status}: {task['stage']} of {os.path.basename(task['workdir'])} ({returncode})")
+
+        if deadline is not None and time.time() >= deadline:
+            for task_id, (task, process, _) in running.items():
+                convergence_monitor.stop_process(process)
+                set_status(connection, task_id, 'queued')
+                release(task)
+                counts['queued'] += 1
+                print(f"queued again: {task['stage']} of {os.path.basename(task['workdir'])}")
+            break
+
+        while free_cores > 0:
+            task = claim(connection, worker, free_cores, total_cores)
+            if task is None:
+                break
+            ncpus = min(task['ncpus'], total_cores)
+            running[task['id']] = (task, start_task(task, ncpus, bin_dir), ncpus)
+            free_cores -= ncpus
+            print(f"started: {task['stage']} of {os.path.basename(task['workdir'])} on {ncpus} cores")
+
+        # Nothing left here: stop once no other worker has tasks this one could wait for
+        if not running and unfinished(connection) == 0:
+            break
+        heartbeat(connection, worker)
+        time.sleep(poll_interval)
+
+    connection.close()
+    print(f"Worker {worker} finished: {counts['done']} done, {counts['failed']} failed, {counts['queued']} queued again")
+    return counts
+
+def print_status(path):
+    """Prints the number of tasks of each stage in each status."""
+    connection = connect(path)
+    rows = connection.execute("SELECT stage, status, COUNT(*) AS n FROM tasks GROUP BY stage, status").fetchall()
+    connection.close()
+    counts = {}
+    for row in rows:
+        counts.setdefault(row['stage'], {})[row['status']] = row['n']
+    print(f"{'stage':<8}" + "".join(f"{status:>10}" for status in STATUSES))
+    for stage, stage_counts in counts.items():
+        print(f"{stage:<8}" + "".join(f"{stage_counts.get(status, 0):>10}" for status in STATUSES))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Drain a queue of stage tasks inside one allocation, or show its status.')
+    subparsers = parser.add_subparsers(dest='command_name', required=True)
+    work_parser = subparsers.add_parser('work', help='Run the tasks of the queue until it is drained or the walltime is near')
+    work_parser.add_argument('queue', type=str, help='Queue file')
+    work_parser.add_argument('--cores', type=int, help='Cores shared by the tasks (NCPUS if not given)', default=None)
+    work_parser.add_argument('--script', type=str, help='PBS script of the pilot job, whose walltime bounds the worker', default=None)
+    work_parser.add_argument('--margin', type=float, help='Minutes before the walltime at which the tasks are stopped and queued again',
+                             default=requeue.DEFAULT_MARGIN_MIN)
+    work_parser.add_argument('--poll', type=float, help='Seconds between two checks of the tasks and the queue', default=5.0)
+    status_parser = subparsers.add_parser('status', help='Number of tasks of each stage in each status')
+    status_parser.add_argument('queue', type=str, help='Queue file')
+    args = parser.parse_args()
+
+    if args.command_name == 'work':
+        counts = work(args.queue, args.cores, args.script, args.margin, args.poll)
+        sys.exit(1 if counts['failed'] else 0)
+    print_status(args.queue)
@@ -0,0 +1,122 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Automatic requeue of long stages (RANS CFD, ASO) that would exceed the walltime of
+                 their PBS job. The stage is stopped a margin before the walltime and its job script is
+                 submitted again. The new job skips the completed stages (see checkpoint.py), and the CFD
+                 and ASO resume from their restart file and optimiser state. Queued jobs that depended on
+                 the stopped job (the next stage, warm-start recipients) are re-pointed at the new one,
+                 keeping their other dependencies, and the run index follows the new job ID.
+"""
+
+import os
+import re
+import time
+import subprocess
+import run_index
+import stage_jobs
+import tool_paths
+
+# Exit status of a stage that was stopped and requeued. The job scripts exit successfully on it.
+REQUEUE_STATUS = 99
+DEFAULT_MARGIN_MIN = 15
+# Set by the job scripts to the start time of the job (seconds since the epoch)
+START_ENV = 'JOB_START'
+WALLTIME = re.compile(r'^#PBS -l walltime=(\d+):(\d+):(\d+)')
+
+def script_walltime(script_path):
+    """Walltime requested by a PBS script in seconds, or None."""
+    try:
+        with open(script_path, 'r') as file:
+            for line in file:
+                match = WALLTIME.match(line.strip())
+                if match:
+                    hours, minutes, seconds = (int(value) for value in match.groups())
+                    return 3600 * hours + 60 * minutes + seconds
+    except OSError:
+        pass
+    return None
+
+def deadline(script_path, margin_min=DEFAULT_MARGIN_MIN):
+    """
+    Time (seconds since the epoch) at which a stage of the job must stop to leave margin_min minutes
+    before the walltime, or None when not running under PBS or when the script is unknown.
+    """
+    walltime = script_walltime(script_path)
+    if walltime is None or not os.environ.get('PBS_JOBID'):
+        return None
+    start = float(os.environ.get(START_ENV, time.time()))
+    return start + walltime - 60 * margin_min
+
+def moved_dependency(depend, old_job_id, new_job_id):
+    """
+    Dependency list of a job (PBS depend attribute) with the old job replaced by the new one, keeping the
+    other dependencies, or None if the job does not depend on the old job.
+    """
+    old_number = old_job_id.split('.')[0]
+    dependencies = []
+    moved = False
+    for dependency in depend.split(','):
+        kind, *job_ids = dependency.split(':')
+        moved = moved or any(job_id.split('.')[0] == old_number for job_id in job_ids)
+        # qstat reports job@server, qalter takes the job ID
+        job_ids = [new_job_id if job_id.split('.')[0] == old_number else job_id.split('@')[0] for job_id in job_ids]
+        dependencies.append(':'.join([kind] + job_ids))
+    return ','.join(dependencies) if moved else None
+
+def repoint_dependants(old_job_id, new_job_id, job_ids):
+    """
+    Moves the dependencies of queued jobs on the stopped job to the new job: the next stage of a DAG chain
+    (afterok) and the warm-start recipients waiting for a donor (afterany), which must not start before the
+    donor has actually finished.
+
+    Returns:
+        list: Job IDs re-pointed.
+    """
+    import executors
+    repointed = []
+    for job_id, depend in executors.qstat_dependencies(sorted(job_ids)).items():
+        updated = moved_dependency(depend, old_job_id, new_job_id)
+        if updated is None:
+            continue
+        try:
+            subprocess.run([tool_paths.QALTER, '-W', f"depend={updated}", job_id], check=True)
+            repointed.append(job_id)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Error moving the dependency of job {job_id} to {new_job_id}: {e}")
+    return repointed
+
+def resubmit(script_path, workdir, stage):
+    """
+    Submits the job script again, re-points the next stage of the design (if it is a separate job) at
+    the new job, and moves the stages of the old job to the new one in the run index.
+    stage is the key of the requeued stage in the run index (e.g. cfd_rans, see run_index.stage_key).
+
+    Returns:
+        str: New job ID, or None if the submission failed.
+    """
+    old_job_id = os.environ.get('PBS_JOBID')
+    try:
+        result = subprocess.run([tool_paths.QSUB, os.path.basename(script_path)], cwd=os.path.dirname(script_path),
+                                check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error requeuing {script_path}: {e}")
+        return None
+    new_job_id = result.stdout.strip()
+    print(f"Requeued {stage} of {workdir} as job {new_job_id}")
+
+    index = run_index.index_path(workdir)
+    connection = run_index.connect(index)
+    rows = run_index.stage_status(connection)
+    connection.close()
+    later = stage_jobs.STAGE_ORDER[stage_jobs.STAGE_ORDER.index(run_index.split_key(stage)[0]) + 1:]
+    later_rows = [row for row in rows if row['workdir'] == os.path.abspath(workdir) and run_index.split_key(row['stage'])[0] in later]
+    if old_job_id:
+        # Queued jobs of the sweep that may wait on the stopped job
+        queued = {row['job_id'] for row in rows if row['status'] == 'submitted' and row['job_id']
+                  and not row['job_id'].endswith('.local')} - {old_job_id, new_job_id}
+        repoint_dependants(old_job_id, new_job_id, queued)
+        run_index.replace_job(index, old_job_id, new_job_id, [stage] + [row['stage'] for row in later_rows])
+    return new_job_id
@@ -0,0 +1,219 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Predicts the walltime and memory of each stage of a design point from the completed runs
+                 of the sweep (the ledgers, see stage_ledger.py), so that each job requests tight but safe
+                 resources instead of the same -mem/-time for every design.
+
+                 For every stage and solver, the log of the wall time and the log of the peak memory per
+                 rank are fitted by least squares on the log of the mesh cells, the log of the MPI ranks,
+                 and the cant and sweep angles. Runs that restored their outputs from the artefact cache
+                 are left out, as a cache miss takes far longer. A request is the prediction plus twice the
+                 standard deviation of the residuals, times (1 + margin). It is bounded by the -mem/-time
+                 given to main_runAutomation, which are still used when there is too little history.
+
+    Usage:  python3 resource_model.py <output directory>
+"""
+
+import os
+import math
+import argparse
+import numpy as np
+import run_index
+import stage_ledger
+import mpi_layout
+
+FEATURES = ['log_cells', 'log_ranks', 'cant', 'sweep']
+# Completed runs needed before a stage is predicted
+MIN_RUNS = 3
+# Standard deviations of the log residuals added to a prediction, and their value with too few runs to estimate them
+SIGMAS = 2.0
+DEFAULT_SIGMA = 0.25
+DEFAULT_MARGIN = 0.2
+# Requests are rounded up to these steps
+WALLTIME_STEP_H = 1 / 6
+MIN_MEM_GB = 2
+
+# Fitted models keyed by sweep directory
+_MODELS = {}
+
+def design_features(cells, ranks, cant, sweep):
+    """Features of a run. Unknown values are None."""
+    return {
+        'log_cells': math.log(cells) if cells else None,
+        'log_ranks': math.log(ranks) if ranks else None,
+        'cant': cant / 90.0 if cant is not None else None,
+        'sweep': sweep / 20.0 if sweep is not None else None,
+    }
+
+def used_cache(metrics):
+    """Whether a run restored its outputs (geometry, mesh) or its preprocessed mesh (CFD, ASO) instead of producing them."""
+    return bool(metrics.get('cache_hit')) or any(metrics.get(step) in ('cache', 'reused') for step in ('native_mesh', 'su2_def'))
+
+def training_rows(records):
+    """
+    Completed runs of a sweep as training rows. Skipped, requeued, resumed and cache-hit runs are left
+    out, since their wall time only covers part of the stage.
+
+    Returns:
+        dict: (stage, solver) to list of (features, log wall time, log peak RSS per rank).
+    """
+    # Cell count of the latest mesh of every design, with and without prism layer
+    cells = {}
+    for record in records:
+        metrics = record.get('metrics', {})
+        if record['stage'] == 'mesh' and record['exit_status'] == 0 and metrics.get('cells'):
+            cells[(record['design'], metrics.get('prism_layer'))] = metrics['cells']
+
+    rows = {}
+    for record in records:
+        metrics = record.get('metrics', {})
+        if record['exit_status'] != 0 or record['wall_s'] <= 0 or record['max_rss_mb'] <= 0:
+            continue
+        if metrics.get('skipped') or metrics.get('requeued') or metrics.get('resumed') or used_cache(metrics):
+            continue
+        match = run_index.DESIGN_NAME.search(record['design'])
+        cant, sweep = (float(match.group(1)), float(match.group(2))) if match else (None, None)
+        solver = metrics.get('solver')
+        if record['stage'] == 'mesh':
+            design_cells = metrics.get('cells')
+        else:
+            design_cells = cells.get((record['design'], 1 if solver == 'RANS' else 0))
+        ranks = record.get('ranks') or record.get('ncpus')
+        features = design_features(design_cells, ranks, cant, sweep)
+        rows.setdefault((record['stage'], solver), []).append((features, math.log(record['wall_s']), math.log(record['max_rss_mb'])))
+    return rows
+
+def fit_target(rows, index):
+    """
+    Least-squares fit of one target (1: log wall time, 2: log RSS) on the features known for every run
+    and that vary between runs, keeping at least two more runs than coefficients.
+
+    Returns:
+        dict: Columns, coefficients, feature means (used for unknown features) and residual standard deviation.
+    """
+    columns = [name for name in FEATURES
+               if all(row[0][name] is not None for row in rows) and len({row[0][name] for row in rows}) > 1]
+    columns = columns[:max(0, len(rows) - 3)]
+    means = {name: float(np.mean([row[0][name] for row in rows])) for name in columns}
+    matrix = np.array([[1.0] + [row[0][name] for name in columns] for row in rows])
+    target = np.array([row[index] for row in rows])
+    coefficients = np.linalg.lstsq(matrix, target, rcond=None)[0]
+    dof = len(rows) - len(coefficients)
+    residuals = target - matrix @ coefficients
+    sigma = float(np.sqrt(residuals @ residuals / dof)) if dof > 0 else DEFAULT_SIGMA
+    return {'columns': columns, 'coefficients': coefficients.tolist(), 'means': means, 'sigma': max(sigma, 0.05), 'runs': len(rows)}
+
+def fit(records):
+    """
+    Fits the wall time and memory models of every stage and solver with at least MIN_RUNS completed runs.
+
+    Returns:
+        dict: (stage, solver) to {'wall': model, 'rss': model}.
+    """
+    models = {}
+    for key, rows in training_rows(records).items():
+        if len(rows) >= MIN_RUNS:
+            models[key] = {'wall': fit_target(rows, 1), 'rss': fit_target(rows, 2)}
+    return models
+
+def evaluate(model, features):
+    """Upper prediction (in log units) of a model: fitted value plus SIGMAS standard deviations."""
+    values = [1.0] + [features[name] if features[name] is not None else model['means'][name] for name in model['columns']]
+    return float(np.dot(model['coefficients'], values)) + SIGMAS * model['sigma']
+
+def predict(models, stage, solver, cells, ranks, ranks_per_node, cant=None, sweep=None, margin=DEFAULT_MARGIN):
+    """
+    Predicts the walltime and memory per node of a stage.
+
+    Parameters:
+        models (dict): Models returned by fit.
+        stage (str): Name of the stage (geo, mesh, cfd, aso).
+        solver (str): Solver of the CFD/ASO (None for geo and mesh).
+        cells (int): Cells of the mesh (None if unknown).
+        ranks (int): Total MPI ranks of the job.
+        ranks_per_node (int): MPI ranks on each node.
+        cant (float, optional): Cant angle (degrees).
+        sweep (float, optional): Sweep angle (degrees).
+        margin (float): Safety margin added to the upper predictions (0.2 is 20%).
+
+    Returns:
+        tuple: (walltime in hours, memory per node in GB), or None without a model for the stage.
+    """
+    model = models.get((stage, solver if stage in ('cfd', 'aso') else None))
+    if model is None:
+        return None
+    features = design_features(cells, ranks, cant, sweep)
+    hours = math.exp(evaluate(model['wall'], features)) * (1 + margin) / 3600
+    hours = WALLTIME_STEP_H * math.ceil(hours / WALLTIME_STEP_H)
+    mem = math.exp(evaluate(model['rss'], features)) * (1 + margin) * ranks_per_node / 1024
+    return hours, max(MIN_MEM_GB, math.ceil(mem))
+
+def sweep_models(sweep_dir):
+    """Models fitted on the ledgers of a sweep directory, fitted once per process."""
+    sweep_dir = os.path.abspath(sweep_dir)
+    if sweep_dir not in _MODELS:
+        _MODELS[sweep_dir] = fit(stage_ledger.load_sweep(sweep_dir))
+    return _MODELS[sweep_dir]
+
+def stage_resources(stage, workdir, steps, resources):
+    """
+    Resources of a stage job of a design point, predicted from the history of its sweep.
+
+    Parameters:
+        stage (str): Name of the stage.
+        workdir (str): Winglet directory of the design point.
+        steps (dict): Stages to run and solvers to use, with the resource_margin.
+        resources (tuple): Requested (ncpus, mem, walltime[, nodes]). ncpus and nodes are kept, mem and walltime
+                           are upper bounds, and are kept if the stage cannot be predicted.
+
+    Returns:
+        tuple: (ncpus, mem, walltime, nodes).
+    """
+    ncpus, mem, time = resources[:3]
+    nodes = resources[3] if len(resources) > 3 else 1
+    solver = steps.get(f'{stage}_solver') if stage in ('cfd', 'aso') else None
+    mesh_path = mpi_layout.solver_mesh(workdir, solver or ('RANS' if steps.get('prism_layer') == 1 else 'Euler'))
+    cells = mpi_layout.mesh_cells(mesh_path) if mesh_path and stage != 'geo' else None
+    match = run_index.DESIGN_NAME.search(os.path.basename(os.path.abspath(workdir)))
+    cant, sweep = (float(match.group(1)), float(match.group(2))) if match else (None, None)
+
+    # The geometry stage is a single process whatever the cores of the job
+    ranks, ranks_per_node = (1, 1) if stage == 'geo' else (ncpus * nodes, ncpus)
+    prediction = predict(sweep_models(os.path.dirname(os.path.abspath(workdir))), stage, solver, cells, ranks, ranks_per_node,
+                         cant, sweep, steps.get('resource_margin', DEFAULT_MARGIN))
+    if prediction is None:
+        return (ncpus, mem, time, nodes)
+    hours, stage_mem = prediction
+    return (ncpus, min(mem, stage_mem), min(time, hours), nodes)
+
+def job_resources(stages, workdir, steps, resources):
+    """
+    Resources of a job running several stages one after the other (serial and array modes): the sum of
+    their walltimes and the largest of their memories. Same parameters as stage_resources.
+    """
+    predictions = [stage_resources(stage, workdir, steps, resources) for stage in stages]
+    if not predictions:
+        return tuple(resources[:3]) + (resources[3] if len(resources) > 3 else 1,)
+    ncpus, nodes = predictions[0][0], predictions[0][3]
+    # A stage without prediction keeps the full walltime, so the sum is bounded by it
+    return (ncpus, max(prediction[1] for prediction in predictions), min(resources[2], sum(prediction[2] for prediction in predictions)), nodes)
+
+def print_models(models):
+    """Prints the fitted models: runs, features used and residual spread of every stage and solver."""
+    print(f"{'stage':<8}{'solver':<8}{'runs':>6}  {'wall features':<38}{'wall sigma':>11}  {'RSS features':<38}{'RSS sigma':>10}")
+    for (stage, solver), model in sorted(models.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+        print(f"{stage:<8}{solver or '-':<8}{model['wall']['runs']:>6}  {', '.join(model['wall']['columns']) or '-':<38}"
+              f"{model['wall']['sigma']:>11.3f}  {', '.join(model['rss']['columns']) or '-':<38}{model['rss']['sigma']:>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fit the walltime and memory models of the stages of a sweep and print them.')
+    parser.add_argument('output_dir', type=str, help='Directory containing the winglet directories')
+    args = parser.parse_args()
+    models = sweep_models(args.output_dir)
+    if not models:
+        print(f"Fewer than {MIN_RUNS} completed runs of every stage below {args.output_dir}")
+    else:
+        print_models(models)
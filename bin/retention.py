@@ -0,0 +1,438 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Retention policy of the winglet directories, run after the post-processing so that a sweep
+                 fits in its storage quota. Each file is matched against the policy (first pattern wins):
+                    keep:     left as it is (history, logs, ASCII restarts used by warm starts, ...).
+                    vtu:      VTU rewritten with VTK zlib compression, still readable by ParaView and VTK.
+                    compress: stream-compressed (zstd if the zstandard module is installed, else gzip) to
+                              <file>.zst/.gz and removed.
+                    archive:  directory streamed into <directory>.tar.zst/.tar.gz and removed.
+                    drop:     removed, as its stage regenerates it (STAR-CCM+ sim files, native SU2 meshes).
+
+                 Every action is recorded in retention_manifest.json in the winglet directory, with the
+                 SHA-256 of the original, before the original is removed. restore decompresses files back
+                 (with their hard links and modification time), and the stage wrapper restores the inputs
+                 and artefacts of a stage before running it, but not of a completed stage it skips (see
+                 stage_ledger.py and checkpoint.py). Hard-linked files are compressed once, and files also
+                 linked from outside the design (the artefact cache) are kept, as removing them would free
+                 nothing. Design points with a stage submitted or running
+                 in the run index are left alone.
+
+    Usage:  python3 retention.py apply <output directory> [-j WORKERS] [--policy FILE] [--codec zstd|gzip]
+            python3 retention.py restore <winglet directory> [pattern ...]
+            python3 retention.py status <output directory>
+"""
+
+import os
+import glob
+import gzip
+import json
+import shutil
+import fnmatch
+import tarfile
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import run_index
+
+MANIFEST_NAME = 'retention_manifest.json'
+ACTIONS = ['keep', 'vtu', 'compress', 'archive', 'drop']
+# Patterns relative to the winglet directory, the first match decides
+DEFAULT_POLICY = [
+    ('CFD/*/restart_flow.csv', 'keep'),
+    ('CFD/*/*.vtu', 'vtu'),
+    ('ASO/*/*.vtu', 'vtu'),
+    ('MESH/*/mesh.cga', 'compress'),
+    ('CFD/*/mesh.cga', 'compress'),
+    ('ASO/*/mesh.cga', 'compress'),
+    ('CFD/*/restart_flow.dat', 'compress'),
+    ('MESH/*/*.sim', 'drop'),
+    ('CFD/*/mesh_native.su2', 'drop'),
+    ('ASO/*/DESIGNS', 'archive'),
+]
+# Files below this size are not worth compressing
+MIN_SIZE = 1 << 20
+CHUNK_SIZE = 1 << 20
+SUFFIXES = {'zstd': '.zst', 'gzip': '.gz'}
+# Stage that regenerates the files of each top-level directory
+DIRECTORY_STAGES = {'GEOMETRY': 'geo', 'MESH': 'mesh', 'CFD': 'cfd', 'ASO': 'aso'}
+
+def default_codec():
+    """zstd if the zstandard module is installed, else gzip."""
+    try:
+        import zstandard  # noqa: F401
+        return 'zstd'
+    except ImportError:
+        return 'gzip'
+
+def load_policy(path):
+    """Reads a policy file: a JSON list of [pattern, action] pairs."""
+    with open(path, 'r') as file:
+        policy = [tuple(rule) for rule in json.load(file)]
+    for pattern, action in policy:
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown retention action {action} for {pattern}")
+    return policy
+
+def manifest_path(workdir):
+    return os.path.join(workdir, MANIFEST_NAME)
+
+def load_manifest(workdir):
+    try:
+        with open(manifest_path(workdir), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+def save_manifest(workdir, entries):
+    path = manifest_path(workdir)
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump(entries, file, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+class HashingReader:
+    """File wrapper computing the SHA-256 of what is read through it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+def compress_file(src, dest, codec):
+    """
+    Streams a file into a compressed file, without holding it in memory.
+
+    Returns:
+        str: SHA-256 of the original.
+    """
+    with open(src, 'rb') as raw, open(f"{dest}.tmp", 'wb') as output:
+        source = HashingReader(raw)
+        if codec == 'zstd':
+            import zstandard
+            zstandard.ZstdCompressor(level=3, threads=-1).copy_stream(source, output, read_size=CHUNK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=output, mode='wb', compresslevel=6, mtime=0) as compressed:
+                shutil.copyfileobj(source, compressed, CHUNK_SIZE)
+    os.replace(f"{dest}.tmp", dest)
+    return source.digest.hexdigest()
+
+def decompress_file(src, dest, codec):
+    """
+    Streams a compressed file back into dest.
+
+    Returns:
+        str: SHA-256 of the restored file.
+    """
+    digest = hashlib.sha256()
+    with open(src, 'rb') as source, open(f"{dest}.tmp", 'wb') as output:
+        if codec == 'zstd':
+            import zstandard
+            stream = zstandard.ZstdDecompressor().stream_reader(source)
+        else:
+            stream = gzip.GzipFile(fileobj=source, mode='rb')
+        with stream:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                output.write(chunk)
+    os.replace(f"{dest}.tmp", dest)
+    return digest.hexdigest()
+
+def archive_directory(path, dest, codec):
+    """Streams a directory into a compressed tar archive."""
+    with open(f"{dest}.tmp", 'wb') as output:
+        if codec == 'zstd':
+            import zstandard
+            with zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(output, closefd=False) as writer:
+                with tarfile.open(fileobj=writer, mode='w|') as tar:
+                    tar.add(path, arcname=os.path.basename(path))
+        else:
+            with tarfile.open(fileobj=output, mode='w|gz') as tar:
+                tar.add(path, arcname=os.path.basename(path))
+    os.replace(f"{dest}.tmp", dest)
+
+def extract_archive(src, parent, codec):
+    """Extracts a compressed tar archive into its parent directory."""
+    # Regular files and directories only, where the tarfile module supports extraction filters
+    options = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+    with open(src, 'rb') as source:
+        if codec == 'zstd':
+            import zstandard
+            with zstandard.ZstdDecompressor().stream_reader(source) as reader:
+                with tarfile.open(fileobj=reader, mode='r|') as tar:
+                    tar.extractall(parent, **options)
+        else:
+            with tarfile.open(fileobj=source, mode='r|gz') as tar:
+                tar.extractall(parent, **options)
+
+def compress_vtu(path):
+    """
+    Rewrites a VTU file with zlib-compressed appended data, keeping its modification time.
+    VTU files already compressed, or that would not shrink, are left as they are.
+
+    Returns:
+        int: Size of the file after the rewrite.
+    """
+    import vtk
+    with open(path, 'rb') as file:
+        if b'compressor=' in file.read(4096):
+            return os.path.getsize(path)
+    stat = os.stat(path)
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(path)
+    reader.Update()
+    writer = vtk.vtkXMLUnstructuredGridWriter()
+    writer.SetInputData(reader.GetOutput())
+    writer.SetFileName(f"{path}.tmp")
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    writer.SetCompressorTypeToZLib()
+    if not writer.Write() or os.path.getsize(f"{path}.tmp") >= stat.st_size:
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+        return stat.st_size
+    os.replace(f"{path}.tmp", path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return os.path.getsize(path)
+
+def match_action(relative_path, policy):
+    for pattern, action in policy:
+        if fnmatch.fnmatch(relative_path, pattern):
+            return action
+    return 'keep'
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+               if not os.path.islink(os.path.join(root, name)))
+
+def plan(workdir, policy):
+    """
+    Files and directories of a design point with an action other than keep.
+
+    Returns:
+        list: (relative path, action), with the hard links of a file grouped under compress as
+              (list of relative paths, 'compress').
+    """
+    actions = []
+    links = {}
+    archived = set()
+    for root, directories, names in os.walk(workdir):
+        relative_root = os.path.relpath(root, workdir)
+        for name in list(directories):
+            relative = os.path.normpath(os.path.join(relative_root, name))
+            if match_action(relative, policy) == 'archive':
+                actions.append((relative, 'archive'))
+                archived.add(os.path.join(root, name))
+        directories[:] = [name for name in directories if os.path.join(root, name) not in archived]
+        for name in names:
+            relative = os.path.normpath(os.path.join(relative_root, name))
+            path = os.path.join(workdir, relative)
+            action = match_action(relative, policy)
+            if action == 'keep' or os.path.islink(path):
+                continue
+            if action == 'drop':
+                actions.append((relative, action))
+                continue
+            stat = os.stat(path)
+            if stat.st_size < MIN_SIZE:
+                continue
+            if action == 'compress':
+                links.setdefault((stat.st_dev, stat.st_ino), (stat.st_nlink, []))[1].append(relative)
+            else:
+                actions.append((relative, action))
+    for nlink, paths in links.values():
+        # Removing the links of this design would not free a file that is also linked from elsewhere
+        if len(paths) == nlink:
+            actions.append((sorted(paths), 'compress'))
+    return actions
+
+def apply_design(task):
+    """
+    Applies the retention policy to one design point.
+
+    Parameters:
+        task (tuple): (winglet directory, policy, codec).
+
+    Returns:
+        tuple: (winglet directory, bytes before, bytes after, number of actions).
+    """
+    workdir, policy, codec = task
+    entries = load_manifest(workdir)
+    before = after = 0
+    done = 0
+    for target, action in plan(workdir, policy):
+        paths = target if isinstance(target, list) else [target]
+        primary = os.path.join(workdir, paths[0])
+        stat = os.stat(primary)
+        entry = {'path': paths[0], 'action': action, 'time': datetime.now().isoformat(timespec='seconds'), 'mtime_ns': stat.st_mtime_ns}
+        try:
+            if action == 'drop':
+                entry.update(size=stat.st_size, stored_size=0, stage=DIRECTORY_STAGES.get(paths[0].split(os.sep)[0]))
+            elif action == 'vtu':
+                try:
+                    entry.update(size=stat.st_size, stored_size=compress_vtu(primary))
+                    if entry['stored_size'] >= entry['size']:
+                        continue
+                except ImportError:
+                    # Without VTK the file is compressed as any other
+                    action = entry['action'] = 'compress'
+            if action == 'compress':
+                archive = paths[0] + SUFFIXES[codec]
+                sha256 = compress_file(primary, os.path.join(workdir, archive), codec)
+                entry.update(size=stat.st_size, stored_size=os.path.getsize(os.path.join(workdir, archive)),
+                             archive=archive, codec=codec, sha256=sha256, links=paths[1:])
+            elif action == 'archive':
+                archive = paths[0] + '.tar' + SUFFIXES[codec]
+                size = directory_size(primary)
+                archive_directory(primary, os.path.join(workdir, archive), codec)
+                entry.update(size=size, stored_size=os.path.getsize(os.path.join(workdir, archive)), archive=archive, codec=codec)
+        except Exception as e:
+            print(f"Error applying {action} to {primary}: {e}")
+            continue
+
+        # The manifest records the archive before the original is removed
+        entries.append(entry)
+        save_manifest(workdir, entries)
+        if action == 'archive':
+            shutil.rmtree(primary)
+        elif action in ('compress', 'drop'):
+            for path in paths:
+                os.remove(os.path.join(workdir, path))
+        before += entry['size']
+        after += entry['stored_size']
+        done += 1
+    return workdir, before, after, done
+
+def busy_designs(output_dir):
+    """Winglet directories with a stage submitted or running in the run index of the sweep."""
+    path = run_index.sweep_index_path(output_dir)
+    if not os.path.exists(path):
+        return set()
+    connection = run_index.connect(path)
+    rows = run_index.stage_status(connection)
+    connection.close()
+    return {row['workdir'] for row in rows if row['status'] in ('submitted', 'running')}
+
+def apply(output_dir, policy=DEFAULT_POLICY, codec=None, workers=None):
+    """
+    Applies the retention policy to every idle design point of a sweep, one design per worker process.
+
+    Returns:
+        tuple: (bytes before, bytes after) of the files acted on.
+    """
+    output_dir = os.path.abspath(output_dir)
+    codec = codec or default_codec()
+    busy = busy_designs(output_dir)
+    workdirs = sorted(path for path in glob.glob(os.path.join(output_dir, 'winglet_c*_s*')) if os.path.isdir(path))
+    skipped = [path for path in workdirs if path in busy]
+    tasks = [(path, policy, codec) for path in workdirs if path not in busy]
+    before = after = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for workdir, design_before, design_after, done in executor.map(apply_design, tasks):
+            if done:
+                print(f"{os.path.basename(workdir)}: {done} files, {design_before / 1024**3:.2f} GB -> {design_after / 1024**3:.2f} GB")
+            before += design_before
+            after += design_after
+    if skipped:
+        print(f"{len(skipped)} design points with a stage submitted or running left alone")
+    print(f"Retention: {before / 1024**3:.2f} GB -> {after / 1024**3:.2f} GB")
+    return before, after
+
+def restore(workdir, patterns=None):
+    """
+    Restores the compressed and archived files of a design point that match any of the patterns (all if None),
+    and reports the dropped ones, which their stage regenerates.
+
+    Returns:
+        int: Number of files and directories restored.
+    """
+    workdir = os.path.abspath(workdir)
+    entries = load_manifest(workdir)
+    remaining = []
+    restored = 0
+    for entry in entries:
+        names = [entry['path']] + entry.get('links', [])
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for name in names for pattern in patterns):
+            remaining.append(entry)
+            continue
+        archive = os.path.join(workdir, entry['archive']) if entry.get('archive') else None
+        if entry['action'] == 'drop':
+            if patterns:
+                print(f"{entry['path']} was dropped: run the {entry.get('stage') or 'corresponding'} stage to regenerate it")
+            remaining.append(entry)
+            continue
+        if archive is None or not os.path.exists(archive):
+            remaining.append(entry)
+            continue
+        path = os.path.join(workdir, entry['path'])
+        try:
+            if entry['action'] == 'archive':
+                extract_archive(archive, os.path.dirname(path), entry['codec'])
+            else:
+                if decompress_file(archive, path, entry['codec']) != entry['sha256']:
+                    raise ValueError("SHA-256 of the restored file does not match the original")
+                os.utime(path, ns=(entry['mtime_ns'], entry['mtime_ns']))
+                for link in entry.get('links', []):
+                    if not os.path.exists(os.path.join(workdir, link)):
+                        os.link(path, os.path.join(workdir, link))
+        except Exception as e:
+            print(f"Error restoring {path}: {e}")
+            remaining.append(entry)
+            continue
+        os.remove(archive)
+        restored += 1
+    if restored:
+        save_manifest(workdir, remaining)
+    return restored
+
+def restore_stage(stage, workdir):
+    """Restores the inputs and artefacts of a stage key that is about to run (see checkpoint.stage_inputs)."""
+    if not os.path.exists(manifest_path(workdir)):
+        return 0
+    import checkpoint
+    patterns = [pattern for pattern in checkpoint.stage_inputs(stage) if not pattern.startswith('templates/')]
+    return restore(workdir, patterns + run_index.stage_artefacts(stage))
+
+def print_status(output_dir):
+    """Prints the space saved by each action over the sweep."""
+    totals = {}
+    for workdir in sorted(glob.glob(os.path.join(os.path.abspath(output_dir), 'winglet_c*_s*'))):
+        for entry in load_manifest(workdir):
+            total = totals.setdefault(entry['action'], [0, 0, 0])
+            total[0] += 1
+            total[1] += entry['size']
+            total[2] += entry['stored_size']
+    print(f"{'action':<10}{'files':>8}{'before GB':>12}{'after GB':>12}")
+    for action in ACTIONS:
+        if action in totals:
+            count, before, after = totals[action]
+            print(f"{action:<10}{count:>8}{before / 1024**3:>12.2f}{after / 1024**3:>12.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compress, archive or drop the large artefacts of the winglet directories, or restore them.')
+    subparsers = parser.add_subparsers(dest='command_name', required=True)
+    apply_parser = subparsers.add_parser('apply', help='Apply the retention policy to the idle design points of a sweep')
+    apply_parser.add_argument('output_dir', type=str, help='Directory containing the winglet directories')
+    apply_parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: all cores)', default=None)
+    apply_parser.add_argument('--policy', type=str, help='JSON list of [pattern, action] pairs replacing the default policy', default=None)
+    apply_parser.add_argument('--codec', type=str, choices=list(SUFFIXES), help='Compression of the compress and archive actions', default=None)
+    restore_parser = subparsers.add_parser('restore', help='Restore the compressed and archived files of a design point')
+    restore_parser.add_argument('workdir', type=str, help='Winglet directory')
+    restore_parser.add_argument('patterns', nargs='*', help='Paths or patterns relative to the winglet directory (all if none)')
+    status_parser = subparsers.add_parser('status', help='Space saved by each action over a sweep')
+    status_parser.add_argument('output_dir', type=str, help='Directory containing the winglet directories')
+    args = parser.parse_args()
+
+    if args.command_name == 'apply':
+        apply(args.output_dir, load_policy(args.policy) if args.policy else DEFAULT_POLICY, args.codec, args.workers)
+    elif args.command_name == 'restore':
+        print(f"{restore(args.workdir, args.patterns or None)} files restored")
+    else:
+        print_status(args.output_dir)
@@ -10,12 +10,21 @@ import subprocess
 import os
 import sys
 import argparse
+import tool_paths
+import artifact_staging
+import artifact_cache
+import su2_mesh
+import stage_ledger
 
-def main(np, solver, directory):
-    """Main function to set up and run SU2 shape optimization."""
+def main(np, solver, directory, cache_dir=None, cache_size=artifact_cache.DEFAULT_CACHE_SIZE_GB):
+    """
+    Main function to set up and run SU2 shape optimization.
+    The SU2_DEF preprocessing and SU2_GEO evaluation are reused from a previous launch or from the
+    artefact cache (cache_dir) when the mesh and configuration did not change.
+    """
     try:
         # Set environment variables for SU2
-        os.environ['SU2_RUN'] = '/path/to/SU2_v7.2.0_Binaries'
+        os.environ['SU2_RUN'] = tool_paths.SU2_BIN
         os.environ['SU2_HOME'] = '/path/to/SU2_v8.0.0_Source'
         os.environ['PATH'] += ':' + os.environ['SU2_RUN']
         os.environ['PYTHONPATH'] = os.environ.get('PYTHONPATH', '') + ':' + os.environ['SU2_RUN']
@@ -32,29 +41,41 @@ def main(np, solver, directory):
             print(f"Input mesh file '{mesh_file}' not found. Please generate the mesh first.")
             sys.exit(1)  # Exit if input file is missing
 
-        # Copy the mesh file to the working directory
-        subprocess.run(['cp', mesh_file, work_dir])
+        # Link the mesh file into the working directory
+        artifact_staging.stage_file(mesh_file, work_dir)
 
         # Check for configuration file
         cfg_file = os.path.join(args.directory, 'ASO', args.solver, f'{args.solver.lower()}-shapeOptimisation.py')
         if os.path.exists(cfg_file):
-            # Run SU2_DEF to preprocess the configuration
-            cmd_str = f"mpiexec /path/to/SU2_v7.2.0_Binaries/SU2_DEF {cfg_file}"
-            subprocess.run(cmd_str, cwd=work_dir, shell=True)
+            def preprocess():
+                # Run SU2_DEF to preprocess the configuration
+                cmd_str = f"{tool_paths.MPIEXEC} -n {np} {tool_paths.su2('SU2_DEF')} {cfg_file}"
+                subprocess.run(cmd_str, cwd=work_dir, shell=True)
 
-            # Remove existing mesh file
-            if os.path.exists(os.path.join(work_dir, 'mesh.su2')):
-                os.remove(os.path.join(work_dir, 'mesh.su2'))
+                # Remove existing mesh file
+                if os.path.exists(os.path.join(work_dir, 'mesh.su2')):
+                    os.remove(os.path.join(work_dir, 'mesh.su2'))
 
-            # Rename the output mesh
-            os.rename(os.path.join(work_dir, 'mesh_out.su2'), os.path.join(work_dir, 'mesh.su2'))
+                # Rename the output mesh
+                os.rename(os.path.join(work_dir, 'mesh_out.su2'), os.path.join(work_dir, 'mesh.su2'))
 
-            # Run SU2_GEO to evaluate geometry
-            cmd_str = f"mpiexec /path/to/SU2_v7.2.0_Binaries/SU2_GEO {cfg_file}"
-            subprocess.run(cmd_str, cwd=work_dir, shell=True)
+            def evaluate_geometry():
+                # Run SU2_GEO to evaluate geometry
+                cmd_str = f"{tool_paths.MPIEXEC} -n {np} {tool_paths.su2('SU2_GEO')} {cfg_file}"
+                subprocess.run(cmd_str, cwd=work_dir, shell=True)
+
+            # Both steps only depend on the mesh and the configuration
+            key = artifact_cache.cache_key('su2_def', files=[os.path.join(work_dir, 'mesh.cga'), cfg_file])
+            su2_def = su2_mesh.cached_outputs(key, ['mesh.su2'], work_dir, preprocess, cache_dir, cache_size)
+            key = su2_mesh.geometry_key(cfg_file, os.path.join(work_dir, 'mesh.su2'))
+            su2_geo = su2_mesh.cached_outputs(key, su2_mesh.geometry_outputs(cfg_file), work_dir, evaluate_geometry, cache_dir, cache_size)
+            stage_ledger.report_metrics(su2_def=su2_def, su2_geo=su2_geo)
+
+            # shape_optimization.py continues from its project file when a previous job was stopped before the end
+            stage_ledger.report_metrics(solver=solver, resumed=os.path.exists(os.path.join(work_dir, 'project.pkl')))
 
             # Run the shape optimization
-            cmd_str = f"python3 /path/to/SU2_v7.2.0_Binaries/shape_optimization.py -np {np} -g DISCRETE_ADJOINT -f {cfg_file}"
+            cmd_str = f"python3 {tool_paths.su2('shape_optimization.py')} -np {np} -g DISCRETE_ADJOINT -f {cfg_file}"
             subprocess.run(cmd_str, cwd=work_dir, shell=True)
         else:
             print(f"Input configuration file '{cfg_file}' not found. Please provide the configuration file.")
@@ -69,6 +90,8 @@ if __name__ == "__main__":
     parser.add_argument('np', type=int, help='Number of parallel processes')
     parser.add_argument('solver', choices=['Euler', 'RANS'], help='Choose the solver type: Euler or RANS')
     parser.add_argument('directory', help='Directory to run the simulation in')
+    parser.add_argument('--cache-dir', type=str, help='Artefact cache directory for the SU2_DEF and SU2_GEO outputs (disabled if not given)', default=None)
+    parser.add_argument('--cache-size', type=float, help='Size limit of the artefact cache in GB', default=artifact_cache.DEFAULT_CACHE_SIZE_GB)
 
     args = parser.parse_args()
-    main(args.np, args.solver, args.directory)
\ No newline at end of file
+    main(args.np, args.solver, args.directory, args.cache_dir, args.cache_size)
\ No newline at end of file
@@ -9,66 +9,172 @@
 import subprocess
 import os
 import sys
+import json
+import signal
 import argparse
-import math
 import vtk
 from vtk.util.numpy_support import vtk_to_numpy
+import file_waiter
+import su2_config
+import convergence_monitor
+import warm_start
+import yplus_estimator
+import mesh_generation
+import tool_paths
+import artifact_staging
+import artifact_cache
+import su2_mesh
+import stage_ledger
+import mpi_layout
+import surface_loads
+
+# State of an unfinished SU2_CFD run: ITER of the configuration and iterations already run
+RESUME_STATE = '.cfd_resume.json'
 
 def read_vtu(file_path):
     """
-    Reads the VTU file and extracts the y+ values.
+    Reads the VTU file and returns the maximum y+ value.
     """
     reader = vtk.vtkXMLUnstructuredGridReader()
     reader.SetFileName(file_path)
     reader.Update()
     output = reader.GetOutput()
     yplus = output.GetPointData().GetArray("Y_Plus")
-    yp = vtk_to_numpy(yplus)
-    return max(yp)
+    return float(vtk_to_numpy(yplus).max())
+
+def volume_path(cfg_file, work_dir):
+    """Volume output of a CFD run (VOLUME_FILENAME of its configuration, flow by default)."""
+    options = su2_config.read_config(cfg_file) if os.path.exists(cfg_file) else {}
+    return os.path.join(work_dir, options.get('VOLUME_FILENAME', 'flow') + '.vtu')
+
+def ensure_history_output(cfg_file):
+    """
+    Adds the aerodynamic coefficients to the history output of a configuration that does not write them
+    (SU2 writes ITER and RMS_RES only by default). The monitor and the coefficient extraction read CL and CD there.
+    """
+    options = su2_config.read_config(cfg_file)
+    groups = [group.strip() for group in options.get('HISTORY_OUTPUT', '').strip('()').split(',') if group.strip()]
+    if 'AERO_COEFF' in (group.upper() for group in groups):
+        return
+    groups = (groups or ['ITER', 'RMS_RES']) + ['AERO_COEFF']
+    su2_config.update_config(cfg_file, {'HISTORY_OUTPUT': f"({', '.join(groups)})"})
 
-def update_prism_layer(macro_path, max_yplus):
+def run_su2_cfd(cfg_file, work_dir, flow_output, timeout=None, criteria=None):
     """
-    Updates the prism layer configuration in the macro file based on the max y+ value.
+    Runs SU2_CFD until it exits, then checks the flow output.
+    With termination criteria, the history is monitored and the solver is stopped as soon as they are met.
+    A run that SU2_CFD ended by itself is converged only if its history meets the convergence criterion of
+    the configuration (see convergence_monitor.history_converged), else it merely reached ITER.
+
+    Returns:
+        str: 'finished', 'converged' or 'stalled'.
     """
-    with open(macro_path, "r") as file:
-        content = file.readlines()
-
-    current_near_wall = None
-    for line in content:
-        if "PrismWallThickness.class).setValue" in line.strip():
-            line = line.strip()
-            line = line.strip("autoMeshOperation_0.getDefaultValues().get(PrismWallThickness.class).setValue(")
-            line = line.strip(");")
-            current_near_wall = float(line)
-            break
-
-    if current_near_wall is None:
-        raise ValueError("PrismWallThickness.class).setValue not found in macro file.")
-
-    new_near_wall = current_near_wall / (max_yplus * 1.1)
-    num_prism_layers = math.ceil((math.log(1 + (0.2 * 0.01 / new_near_wall)) / math.log(1.2)))
-
-    new_content = []
-    for line in content:
-        if "PrismWallThickness.class).setValue" in line.strip():
-            new_line = "autoMeshOperation_0.getDefaultValues().get(PrismWallThickness.class).setValue({0});".format(str(new_near_wall))
-            new_content.append(new_line + "\n")
-        elif "integerValue_0.getQuantity().setValue" in line.strip():
-            new_line = "integerValue_0.getQuantity().setValue({0});".format(str(num_prism_layers))
-            new_content.append(new_line + "\n")
-        else:
-            new_content.append(line)
-
-    with open(macro_path, "w") as file:
-        file.writelines(new_content)
-
-def run_cfd(solver, directory):
+    cmd_str = f"{mpi_layout.mpiexec()} {tool_paths.su2('SU2_CFD')} {cfg_file}"
+    options = su2_config.read_config(cfg_file)
+    history_path = os.path.join(work_dir, options.get('CONV_FILENAME', 'history') + '.csv')
+    if criteria is None:
+        # Own session, so that every rank is stopped on a timeout. SU2 rewrites the flow output while it
+        # runs, so the solver must exit before the output is final.
+        process = subprocess.Popen(cmd_str, cwd=work_dir, shell=True, start_new_session=True)
+        file_waiter.wait_for_exit(process, flow_output, timeout)
+        return 'converged' if convergence_monitor.history_converged(history_path, options) else 'finished'
+
+    if os.path.exists(history_path):
+        os.remove(history_path)
+
+    # Own session so that the monitor can signal mpiexec and every rank
+    process = subprocess.Popen(cmd_str, cwd=work_dir, shell=True, start_new_session=True)
+    try:
+        status, history = convergence_monitor.monitor(process, history_path, criteria, timeout)
+    except BaseException:
+        # The solver is outside the process group of the stage: stop it too when the stage is stopped
+        convergence_monitor.stop_process(process)
+        raise
+    if status == 'diverged':
+        raise RuntimeError(f"SU2_CFD diverged after {len(history)} iterations")
+    if status == 'timeout':
+        raise TimeoutError(f"SU2_CFD did not converge within {timeout} s")
+
+    # An early stop keeps the flow output of the last solution write
+    file_waiter.wait_for_output(flow_output, None, timeout=600)
+    if status == 'finished' and convergence_monitor.history_converged(history_path, options):
+        return 'converged'
+    return status
+
+def history_iterations(cfg_file, work_dir):
+    """Number of iterations written to the history file of the last SU2_CFD run."""
+    options = su2_config.read_config(cfg_file)
+    history_path = os.path.join(work_dir, options.get('CONV_FILENAME', 'history') + '.csv')
+    if not os.path.exists(history_path):
+        return 0
+    with open(history_path, 'r') as file:
+        return max(0, sum(1 for line in file if line.strip()) - 1)
+
+def resume_cfd(cfg_file, work_dir, native_mesh_source):
+    """
+    Sets up SU2_CFD to continue a run that was stopped before its end (walltime, requeue) from its restart
+    file, for the remaining iterations only. Otherwise sets up a fresh run.
+
+    Parameters:
+        cfg_file (str): Configuration file of the CFD.
+        work_dir (str): CFD working directory.
+        native_mesh_source (str): Source of the native mesh (see su2_mesh.prepare_native_mesh). The restart
+            only matches the mesh when the mesh was reused.
+
+    Returns:
+        int: Iterations already run, 0 for a fresh run.
+    """
+    options = su2_config.read_config(cfg_file)
+    state_path = os.path.join(work_dir, RESUME_STATE)
+    state = None
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as file:
+            state = json.load(file)
+    restart = os.path.join(work_dir, options.get('RESTART_FILENAME', 'restart_flow.dat'))
+
+    if state and native_mesh_source == 'reused' and os.path.exists(restart):
+        state['done'] += history_iterations(cfg_file, work_dir)
+        print(f"Resuming SU2_CFD from {restart} after {state['done']} iterations")
+        su2_config.update_config(cfg_file, {
+            'RESTART_SOL': 'YES',
+            'READ_BINARY_RESTART': 'YES',
+            'SOLUTION_FILENAME': os.path.basename(restart),
+            'ITER': max(1, state['iter'] - state['done']),
+        })
+    else:
+        state = {'iter': state['iter'] if state else int(float(options.get('ITER', 999999))), 'done': 0}
+        su2_config.update_config(cfg_file, {'RESTART_SOL': 'NO', 'ITER': state['iter']})
+    with open(state_path, 'w') as file:
+        json.dump(state, file)
+    return state['done']
+
+def finish_cfd(cfg_file, work_dir):
+    """Restores the ITER of a resumed configuration once its run has completed."""
+    state_path = os.path.join(work_dir, RESUME_STATE)
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as file:
+            state = json.load(file)
+        su2_config.update_config(cfg_file, {'ITER': state['iter']})
+        os.remove(state_path)
+
+def run_cfd(solver, directory, timeout=None, criteria=None, warm=False, max_yplus_iter=3, cache_dir=None,
+            cache_size=artifact_cache.DEFAULT_CACHE_SIZE_GB):
     """
     Main function to set up and run SU2 CFD simulation.
+
+    Parameters:
+    solver (str): Solver type (Euler or RANS).
+    directory (str): Output directory of the design point.
+    timeout (float, optional): Maximum time in seconds to wait for each SU2_CFD run.
+    criteria (dict, optional): Early termination criteria of the convergence monitor (no monitoring if None).
+    warm (bool): Restart from the solution of the nearest converged neighbouring design, interpolated onto this mesh.
+    max_yplus_iter (int): Maximum number of RANS re-meshing iterations to bring y+ below the target.
+    cache_dir (str, optional): Artefact cache directory, where the native SU2 meshes are shared.
+    cache_size (float, optional): Size limit of the artefact cache in GB.
     """
     try:
         # Set environment variables for SU2
-        os.environ['SU2_RUN'] = '/path/to/SU2_v7.2.0_Binaries'
+        os.environ['SU2_RUN'] = tool_paths.SU2_BIN
         os.environ['SU2_HOME'] = '/path/to/SU2_v7.2.0_Source'
         os.environ['PATH'] += ':' + os.environ['SU2_RUN']
         os.environ['PYTHONPATH'] = os.environ.get('PYTHONPATH', '') + ':' + os.environ['SU2_RUN']
@@ -77,10 +183,15 @@ def run_cfd(solver, directory):
         work_dir = os.path.join(directory, 'CFD', solver)
         os.makedirs(work_dir, exist_ok=True)
 
+        # Determine the configuration file based on the solver type
+        cfg_file = os.path.join(directory, 'CFD', solver, f'{solver.upper()}-cfd.cfg')
+
         # Remove existing flow output file if it exists in the working directory
-        flow_output = os.path.join(work_dir, 'flow_winglet.vtu')
+        flow_output = volume_path(cfg_file, work_dir)
         if os.path.exists(flow_output):
             os.remove(flow_output)
+        if os.path.exists(os.path.join(work_dir, warm_start.DONOR_MARKER)):
+            os.remove(os.path.join(work_dir, warm_start.DONOR_MARKER))
 
          # Set mesh file path based on solver type
         mesh_subdir = 'with_prism' if solver == 'RANS' else 'without_prism'
@@ -89,50 +200,76 @@ def run_cfd(solver, directory):
             print(f"Input mesh file '{mesh_file}' not found. Please generate the mesh first.")
             sys.exit(1)  # Exit if input file is missing
 
-        # Copy the mesh file to the working directory
-        subprocess.run(['cp', mesh_file, work_dir])
+        # Link the mesh file into the working directory
+        artifact_staging.stage_file(mesh_file, work_dir)
 
-        # Determine the configuration file based on the solver type
-        cfg_file = os.path.join(directory, 'CFD', solver, f'{solver.upper()}-CFD.cfg')
+        # Convert the mesh to SU2 native format once per mesh, so that SU2_CFD does not import the CGNS mesh at every launch
+        native_mesh = su2_mesh.prepare_native_mesh(cfg_file, work_dir, os.path.basename(mesh_file), cache_dir, cache_size)
+        stage_ledger.report_metrics(native_mesh=native_mesh)
 
-        # Run SU2_CFD with the chosen configuration file
-        cmd_str = f"mpiexec /path/to/SU2_v7.2.0_Binaries/SU2_CFD {cfg_file}"
-        subprocess.run(cmd_str, cwd=work_dir, shell=True)
+        # Continue a run stopped at the walltime of the previous job, else start afresh
+        resumed_iterations = resume_cfd(cfg_file, work_dir, native_mesh)
+        stage_ledger.report_metrics(resumed=resumed_iterations > 0, resumed_iterations=resumed_iterations)
 
-        # Wait until the flow file is generated
-        while not os.path.exists(flow_output):
-            pass
+        if warm and not resumed_iterations:
+            warm_start.prepare_warm_start(cfg_file, work_dir, solver, directory)
+
+        # Run SU2_CFD with the chosen configuration file
+        ensure_history_output(cfg_file)
+        status = run_su2_cfd(cfg_file, work_dir, flow_output, timeout, criteria)
+        iterations = history_iterations(cfg_file, work_dir)
+        stage_ledger.report_metrics(solver=solver, solver_runs=1, iterations=iterations, status=status, warm_start=bool(warm))
 
         # If the solver is RANS, check y+ values and iterate if necessary
         if solver == 'RANS':
+            macro_path = os.path.join(directory, 'MESH', 'with_prism', 'macro_with_prism.java')
+            yplus_history = []
             while True:
-                # Read the maximum y+ value from the flow output
-                max_yplus = read_vtu(flow_output)
+                # Read the maximum y+ value from the surface output, much smaller than the volume output
+                surface_output = surface_loads.surface_path(cfg_file, work_dir)
+                max_yplus = read_vtu(surface_output if os.path.exists(surface_output) else flow_output)
+                yplus_history.append((mesh_generation.read_prism_wall_thickness(macro_path), max_yplus))
 
-                if max_yplus < 1:
+                stage_ledger.report_metrics(remesh_iterations=len(yplus_history) - 1, max_yplus=max_yplus)
+
+                if max_yplus < yplus_estimator.TARGET_YPLUS:
                     print("Simulations complete with acceptable y+ value.")
                     break
-                else:
-                    print("Y+ > 1 ... Re-calculating prism layer...")
-                    update_prism_layer(os.path.join(directory, 'MESH', 'with_prism', 'macro_with_prism.java'), max_yplus)
+                if len(yplus_history) > max_yplus_iter:
+                    print(f"Y+ = {max_yplus:.2f} after {max_yplus_iter} re-meshing iterations. Keeping the last solution.")
+                    break
+
+                # Secant correction of the first-cell height from all previous meshes
+                near_wall = yplus_estimator.corrected_height(yplus_history)
+                print(f"Y+ = {max_yplus:.2f} > {yplus_estimator.TARGET_YPLUS} ... Re-meshing with first-cell height {near_wall:.3e} m...")
 
-                    # Remove existing mesh files
-                    if os.path.exists(mesh_file):
-                        os.remove(mesh_file)
-                    if os.path.exists('./star@meshed.sim'):
-                        os.remove('./star@meshed.sim')
+                # Remove existing mesh files
+                if os.path.exists(mesh_file):
+                    os.remove(mesh_file)
+                if os.path.exists(os.path.join(os.path.dirname(mesh_file), 'star@meshed.sim')):
+                    os.remove(os.path.join(os.path.dirname(mesh_file), 'star@meshed.sim'))
 
-                    # Regenerate the mesh
-                    cmd_str = f"python3 {os.path.join(directory, 'MESH', 'mesh_generation.py')} -np 8 -i {os.path.join(directory, 'GEOMETRY')} -o {os.path.join(directory, 'MESH', 'with_prism')} -pl 1 -my {max_yplus}"
-                    subprocess.run(cmd_str, shell=True)
+                # Regenerate the mesh
+                mesh_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mesh_generation.py')
+                cmd_str = f"python3 {mesh_script} -np {mpi_layout.allocated_ranks(8)} -i {os.path.join(directory, 'GEOMETRY')} -o {os.path.join(directory, 'MESH')} -pl 1 --first-cell-height {near_wall}"
+                subprocess.run(cmd_str, shell=True, check=True)
+                artifact_staging.stage_file(mesh_file, work_dir)
+                native_mesh = su2_mesh.prepare_native_mesh(cfg_file, work_dir, os.path.basename(mesh_file), cache_dir, cache_size)
+                resume_cfd(cfg_file, work_dir, native_mesh)
 
-                    # Rerun the CFD simulation
-                    cmd_str = f"mpiexec /path/to/SU2_v7.2.0_Binaries/SU2_CFD {cfg_file}"
-                    subprocess.run(cmd_str, cwd=work_dir, shell=True)
+                # Rerun the CFD simulation, restarting from the solution on the previous mesh
+                if warm:
+                    warm_start.prepare_warm_start(cfg_file, work_dir, solver, directory, donor_dir=work_dir)
+                if os.path.exists(flow_output):
+                    os.remove(flow_output)
+                status = run_su2_cfd(cfg_file, work_dir, flow_output, timeout, criteria)
+                iterations += history_iterations(cfg_file, work_dir)
+                stage_ledger.report_metrics(solver_runs=len(yplus_history) + 1, iterations=iterations, status=status)
 
-                    # Wait until the flow file is generated
-                    while not os.path.exists(flow_output):
-                        pass
+        finish_cfd(cfg_file, work_dir)
+        # Only a converged solution that met its y+ target can warm-start the neighbouring designs
+        if status == 'converged' and (solver != 'RANS' or max_yplus < yplus_estimator.TARGET_YPLUS):
+            warm_start.mark_donor(work_dir)
 
     except Exception as e:
         print("An error occurred:", e)
@@ -142,6 +279,22 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run SU2 CFD simulation with either Euler or RANS solver.')
     parser.add_argument('solver', choices=['Euler', 'RANS'], help='Choose the solver type: Euler or RANS')
     parser.add_argument('directory', help='Directory to run the simulation in')
+    parser.add_argument('--timeout', type=float, help='Maximum time in hours to wait for each SU2_CFD run', default=None)
+    parser.add_argument('--monitor', action='store_true', help='Stop SU2_CFD early once the tolerances are met or the run stalls/diverges')
+    parser.add_argument('--cl-tol', type=float, help='Maximum relative variation of CL over the window', default=convergence_monitor.DEFAULT_CRITERIA['cl_tol'])
+    parser.add_argument('--cd-tol', type=float, help='Maximum relative variation of CD over the window', default=convergence_monitor.DEFAULT_CRITERIA['cd_tol'])
+    parser.add_argument('--window', type=int, help='Number of iterations assessed by the monitor', default=convergence_monitor.DEFAULT_CRITERIA['window'])
+    parser.add_argument('--min-iter', type=int, help='Iterations run before any early termination', default=convergence_monitor.DEFAULT_CRITERIA['min_iter'])
+    parser.add_argument('--warm-start', action='store_true', help='Restart from the nearest converged neighbouring design')
+    parser.add_argument('--max-yplus-iter', type=int, help='Maximum number of RANS re-meshing iterations for y+', default=3)
+    parser.add_argument('--cache-dir', type=str, help='Artefact cache directory for the native SU2 meshes (disabled if not given)', default=None)
+    parser.add_argument('--cache-size', type=float, help='Size limit of the artefact cache in GB', default=artifact_cache.DEFAULT_CACHE_SIZE_GB)
 
     args = parser.parse_args()
-    run_cfd(args.solver, args.directory)
\ No newline at end of file
+    # Stopped before the walltime (see requeue.py): stop the solver too and keep its restart for the next job
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    criteria = None
+    if args.monitor:
+        criteria = {'cl_tol': args.cl_tol, 'cd_tol': args.cd_tol, 'window': args.window, 'min_iter': args.min_iter}
+    run_cfd(args.solver, args.directory, args.timeout * 3600 if args.timeout else None, criteria, args.warm_start, args.max_yplus_iter,
+            args.cache_dir, args.cache_size)
\ No newline at end of file
@@ -0,0 +1,393 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: SQLite index of the design points and their stages. Each stage row holds its status
+                 (submitted, running, done, failed), job ID, exit status, CL/CD, solver iterations and
+                 the paths and SHA-256 digests of its artefacts. Rows are updated as jobs are submitted
+                 and as stages start and finish, so that status queries and re-submissions do not
+                 walk the output directories. By default the index lives in the output directory
+                 (output/run_index.sqlite); set RUN_INDEX to share one index between several sweeps.
+
+                 The CFD and ASO stages are kept per solver (cfd_euler, cfd_rans, aso_rans, ...), since the
+                 screening runs the Euler and the RANS CFD of a design in the same winglet directory.
+
+    Usage:  python3 run_index.py status <index> [--stage cfd] [--status done]
+            python3 run_index.py pending <index> <stage> [--after cfd_rans]
+            python3 run_index.py refresh <index>
+            python3 run_index.py scan <output directory> [--index file]
+"""
+
+import os
+import re
+import glob
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+import artifact_staging
+import extract_coefficients
+
+INDEX_NAME = 'run_index.sqlite'
+INDEX_ENV = 'RUN_INDEX'
+STATUSES = ['submitted', 'running', 'done', 'failed']
+DESIGN_NAME = re.compile(r'winglet_c(-?\d+(?:\.\d+)?)_s(-?\d+(?:\.\d+)?)$')
+
+# Artefacts of each stage, relative to the winglet directory
+STAGE_ARTEFACTS = {
+    'geo': ['GEOMETRY/wing.stp'],
+    'mesh': ['MESH/*/mesh.cga'],
+    # SU2 names the volume output after VOLUME_FILENAME (flow, flow_T7, ...)
+    'cfd': ['CFD/*/flow*.vtu', 'CFD/*/history*.csv'],
+    'aso': ['ASO/*/mesh.su2', 'ASO/*/history_project.*'],
+}
+SOLVER_STAGES = ('cfd', 'aso')
+SOLVERS = ('Euler', 'RANS')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS designs (
+    id INTEGER PRIMARY KEY,
+    workdir TEXT NOT NULL UNIQUE,
+    sweep_dir TEXT NOT NULL,
+    cant REAL,
+    sweep REAL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    design_id INTEGER NOT NULL REFERENCES designs (id),
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    job_id TEXT,
+    exit_status INTEGER,
+    solver TEXT,
+    cl REAL,
+    cd REAL,
+    iterations INTEGER,
+    updated TEXT NOT NULL,
+    PRIMARY KEY (design_id, stage)
+);
+CREATE TABLE IF NOT EXISTS artefacts (
+    design_id INTEGER NOT NULL REFERENCES designs (id),
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    PRIMARY KEY (design_id, stage, path)
+);
+CREATE INDEX IF NOT EXISTS stages_by_status ON stages (stage, status);
+CREATE INDEX IF NOT EXISTS designs_by_point ON designs (cant, sweep);
+"""
+
+# Indexes written before the stages were keyed by solver: rows of a known solver are moved to their stage key
+MIGRATION = """
+UPDATE OR IGNORE artefacts SET stage = stage || '_' || lower((SELECT s.solver FROM stages s WHERE s.design_id = artefacts.design_id
+    AND s.stage = artefacts.stage)) WHERE stage IN ('cfd', 'aso') AND EXISTS (SELECT 1 FROM stages s WHERE s.design_id = artefacts.design_id
+    AND s.stage = artefacts.stage AND s.solver IS NOT NULL);
+UPDATE OR IGNORE stages SET stage = stage || '_' || lower(solver) WHERE stage IN ('cfd', 'aso') AND solver IS NOT NULL;
+"""
+
+def stage_key(stage, solver=None):
+    """
+    Name of a stage in the index and in its completion marker (see checkpoint.py): the CFD and ASO
+    stages are suffixed with their solver (cfd_euler, aso_rans), the other stages keep their name.
+    """
+    if stage in SOLVER_STAGES and solver:
+        return f"{stage}_{solver.lower()}"
+    return stage
+
+def split_key(key):
+    """(stage, solver) of a stage key, with solver None for the stages that are not run per solver."""
+    stage, _, suffix = key.partition('_')
+    return stage, next((solver for solver in SOLVERS if solver.lower() == suffix), None)
+
+def stage_artefacts(key):
+    """Artefact patterns of a stage key, in the directory of its solver (e.g. CFD/RANS/flow*.vtu)."""
+    stage, solver = split_key(key)
+    return [pattern.replace('/*/', f'/{solver}/', 1) if solver else pattern for pattern in STAGE_ARTEFACTS.get(stage, [])]
+
+def sweep_index_path(output_dir):
+    """Index of an output directory: $RUN_INDEX, or run_index.sqlite in the output directory."""
+    return os.environ.get(INDEX_ENV) or os.path.join(os.path.abspath(output_dir), INDEX_NAME)
+
+def index_path(workdir):
+    """Index of a winglet directory, that of the output directory containing it."""
+    return sweep_index_path(os.path.dirname(os.path.abspath(workdir)))
+
+def connect(path):
+    """Opens an index, creating its tables if needed. Writers wait for each other instead of failing."""
+    connection = sqlite3.connect(path, timeout=120)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA + MIGRATION)
+    return connection
+
+def design_point(workdir):
+    """(cant, sweep) of a winglet directory, as written in its name, or (None, None)."""
+    match = DESIGN_NAME.search(os.path.basename(os.path.normpath(workdir)))
+    if not match:
+        return None, None
+    return tuple(int(value) if float(value).is_integer() else float(value) for value in match.groups())
+
+def design_id(connection, workdir):
+    """Row ID of a design point, inserting it on first use."""
+    workdir = os.path.abspath(workdir)
+    row = connection.execute("SELECT id FROM designs WHERE workdir = ?", (workdir,)).fetchone()
+    if row:
+        return row['id']
+    cant, sweep = design_point(workdir)
+    return connection.execute("INSERT INTO designs (workdir, sweep_dir, cant, sweep) VALUES (?, ?, ?, ?)",
+                              (workdir, os.path.dirname(workdir), cant, sweep)).lastrowid
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def record_submissions(path, submissions):
+    """
+    Marks stages as submitted, in a single transaction.
+
+    Parameters:
+        path (str): Index file.
+        submissions (list): (winglet directory, stage key, job ID) tuples (see stage_key).
+    """
+    if not submissions:
+        return
+    connection = connect(path)
+    with connection:
+        for workdir, stage, job_id in submissions:
+            connection.execute(
+                "INSERT INTO stages (design_id, stage, status, job_id, updated) VALUES (?, ?, 'submitted', ?, ?) "
+                "ON CONFLICT (design_id, stage) DO UPDATE SET status = 'submitted', job_id = excluded.job_id, "
+                "exit_status = NULL, cl = NULL, cd = NULL, iterations = NULL, updated = excluded.updated",
+                (design_id(connection, workdir), stage, job_id, now()))
+    connection.close()
+
+def hash_artefacts(connection, design, stage, workdir):
+    """
+    Updates the artefact rows of a stage. Files whose size and modification time did not change keep their digest.
+    """
+    previous = {row['path']: row for row in connection.execute(
+        "SELECT path, sha256, size, mtime FROM artefacts WHERE design_id = ? AND stage = ?", (design, stage))}
+    connection.execute("DELETE FROM artefacts WHERE design_id = ? AND stage = ?", (design, stage))
+    for pattern in stage_artefacts(stage):
+        for artefact in sorted(glob.glob(os.path.join(workdir, pattern))):
+            stat = os.stat(artefact)
+            entry = previous.get(artefact)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                digest = entry['sha256']
+            else:
+                digest = artifact_staging.hash_file(artefact)
+            connection.execute("INSERT INTO artefacts (design_id, stage, path, sha256, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+                               (design, stage, artefact, digest, stat.st_size, stat.st_mtime))
+
+def record_stage(path, workdir, stage, status, exit_status=None, job_id=None, metrics=None):
+    """
+    Records the status of a stage. Finished stages also record their artefacts and, for CFD, CL/CD and iterations.
+
+    Parameters:
+        path (str): Index file.
+        workdir (str): Winglet directory of the design point.
+        stage (str): Stage key (geo, mesh, cfd_euler, cfd_rans, aso_rans, ..., see stage_key).
+        status (str): One of STATUSES.
+        exit_status (int, optional): Exit status of the stage.
+        job_id (str, optional): Job ID (kept from the submission if None).
+        metrics (dict, optional): Metrics reported by the stage (see stage_ledger.report_metrics).
+    """
+    workdir = os.path.abspath(workdir)
+    metrics = metrics or {}
+    base_stage, key_solver = split_key(stage)
+    solver = metrics.get('solver') or key_solver
+    cl = cd = None
+    if base_stage == 'cfd' and status == 'done' and solver:
+        work_dir = os.path.join(workdir, 'CFD', solver)
+        cl, cd = extract_coefficients.read_history_coefficients(work_dir, os.path.join(work_dir, f'{solver.upper()}-cfd.cfg'))
+
+    connection = connect(path)
+    with connection:
+        design = design_id(connection, workdir)
+        connection.execute(
+            "INSERT INTO stages (design_id, stage, status, job_id, exit_status, solver, cl, cd, iterations, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (design_id, stage) DO UPDATE SET status = excluded.status, job_id = COALESCE(excluded.job_id, job_id), "
+            "exit_status = excluded.exit_status, solver = COALESCE(excluded.solver, solver), cl = excluded.cl, cd = excluded.cd, "
+            "iterations = excluded.iterations, updated = excluded.updated",
+            (design, stage, status, job_id, exit_status, solver, cl, cd, metrics.get('iterations'), now()))
+        if status in ('done', 'failed'):
+            hash_artefacts(connection, design, stage, workdir)
+    connection.close()
+
+def replace_job(path, old_job_id, new_job_id, stages=None):
+    """
+    Moves the stages of a requeued job to its new job ID, as submitted.
+
+    Parameters:
+        stages (list, optional): Only these stages (the requeued stage and the ones after it), so that the
+            stages the old job completed stay done.
+    """
+    query = "UPDATE stages SET job_id = ?, status = 'submitted', updated = ? WHERE job_id = ?"
+    values = [new_job_id, now(), old_job_id]
+    if stages is not None:
+        query += f" AND stage IN ({', '.join('?' * len(stages))})"
+        values.extend(stages)
+    connection = connect(path)
+    with connection:
+        connection.execute(query, values)
+    connection.close()
+
+def reset_stage(path, workdir, stage):
+    """Marks a stage that was stopped to be run again later (e.g. by another pilot worker) as submitted, without job."""
+    connection = connect(path)
+    with connection:
+        connection.execute("UPDATE stages SET status = 'submitted', job_id = NULL, exit_status = NULL, updated = ? "
+                           "WHERE stage = ? AND design_id = (SELECT id FROM designs WHERE workdir = ?)",
+                           (now(), stage, os.path.abspath(workdir)))
+    connection.close()
+
+def stage_status(connection, stage=None, status=None, sweep_dir=None):
+    """
+    Lists the stages of the indexed design points. A stage run per solver (cfd, aso) selects it for every solver.
+
+    Returns:
+        list: sqlite3.Row objects with the design point, stage, status, job ID, exit status, CL, CD and iterations.
+    """
+    conditions, values = [], []
+    if stage in SOLVER_STAGES:
+        conditions.append("(s.stage = ? OR s.stage GLOB ?)")
+        values.extend([stage, f"{stage}_*"])
+        stage = None
+    for column, value in [('s.stage', stage), ('s.status', status), ('d.sweep_dir', sweep_dir and os.path.abspath(sweep_dir))]:
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return connection.execute(
+        "SELECT d.workdir, d.cant, d.sweep, s.stage, s.status, s.job_id, s.exit_status, s.solver, s.cl, s.cd, s.iterations, s.updated "
+        f"FROM stages s JOIN designs d ON d.id = s.design_id {where} ORDER BY d.sweep_dir, d.cant, d.sweep, s.stage", values).fetchall()
+
+def pending(connection, stage, after=None, sweep_dir=None):
+    """
+    Design points whose stage has to be (re-)submitted: never run or failed, and not queued or running.
+
+    Parameters:
+        stage (str): Stage key to run (e.g. aso_rans, see stage_key).
+        after (str, optional): Only design points whose after stage key is done (e.g. cfd_rans for the ASO after a converged RANS CFD).
+        sweep_dir (str, optional): Only design points of this output directory.
+
+    Returns:
+        list: sqlite3.Row objects with the workdir, cant and sweep of the design points.
+    """
+    values = [stage]
+    query = ("SELECT d.workdir, d.cant, d.sweep FROM designs d "
+             "LEFT JOIN stages s ON s.design_id = d.id AND s.stage = ? ")
+    if after:
+        query += "JOIN stages a ON a.design_id = d.id AND a.stage = ? AND a.status = 'done' "
+        values.append(after)
+    query += "WHERE (s.status IS NULL OR s.status = 'failed') "
+    if sweep_dir:
+        query += "AND d.sweep_dir = ? "
+        values.append(os.path.abspath(sweep_dir))
+    return connection.execute(query + "ORDER BY d.cant, d.sweep", values).fetchall()
+
+def refresh(connection):
+    """
+    Marks as failed the PBS jobs that finished without the stage recording its end (e.g. killed at walltime,
+    or deleted after a failed dependency), with one qstat call for all of them.
+
+    Returns:
+        int: Number of stages marked as failed.
+    """
+    import executors
+    rows = connection.execute("SELECT design_id, stage, job_id FROM stages WHERE status IN ('submitted', 'running') "
+                              "AND job_id IS NOT NULL AND job_id NOT LIKE '%.local'").fetchall()
+    if not rows:
+        return 0
+    status = executors.qstat_status(sorted({row['job_id'] for row in rows}))
+    failed = 0
+    with connection:
+        for row in rows:
+            if row['job_id'] not in status:
+                continue
+            state, exit_status = status[row['job_id']]
+            if executors.job_finished(state):
+                connection.execute("UPDATE stages SET status = 'failed', exit_status = ?, updated = ? WHERE design_id = ? AND stage = ? "
+                                   "AND status IN ('submitted', 'running')", (exit_status, now(), row['design_id'], row['stage']))
+                failed += 1
+    return failed
+
+def scan(output_dir, path=None):
+    """
+    Indexes an existing output directory from the ledgers of its design points, or from the artefacts found
+    for designs run before the ledger existed.
+
+    Returns:
+        int: Number of stages recorded.
+    """
+    import stage_ledger
+    recorded = 0
+    for workdir in sorted(glob.glob(os.path.join(os.path.abspath(output_dir), 'winglet_c*_s*'))):
+        index = path or index_path(workdir)
+        latest = {}
+        ledger_path = os.path.join(workdir, stage_ledger.LEDGER_NAME)
+        if os.path.exists(ledger_path):
+            for record in stage_ledger.read_ledger(ledger_path):
+                latest[stage_key(record['stage'], record.get('metrics', {}).get('solver'))] = record
+        keys = [stage for stage in STAGE_ARTEFACTS if stage not in SOLVER_STAGES]
+        keys += [stage_key(stage, solver) for stage in SOLVER_STAGES for solver in SOLVERS]
+        for key in keys:
+            if key in latest:
+                record = latest[key]
+                status = 'done' if record['exit_status'] == 0 else 'failed'
+                record_stage(index, workdir, key, status, record['exit_status'], record.get('job_id'), record.get('metrics'))
+            elif any(glob.glob(os.path.join(workdir, stage_artefacts(key)[0]))):
+                record_stage(index, workdir, key, 'done')
+            else:
+                continue
+            recorded += 1
+    return recorded
+
+def print_rows(rows):
+    print(f"{'cant':>8}{'sweep':>8}  {'stage':<10}{'status':<11}{'job ID':<20}{'exit':>6}{'CL':>11}{'CD':>11}{'iter':>7}")
+    for row in rows:
+        cl = f"{row['cl']:.5f}" if row['cl'] is not None else '-'
+        cd = f"{row['cd']:.5f}" if row['cd'] is not None else '-'
+        print(f"{row['cant']:>8g}{row['sweep']:>8g}  {row['stage']:<10}{row['status']:<11}{row['job_id'] or '-':<20}"
+              f"{'-' if row['exit_status'] is None else row['exit_status']:>6}{cl:>11}{cd:>11}{row['iterations'] or '-':>7}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query and maintain the run index of the design points.')
+    subparsers = parser.add_subparsers(dest='command_name', required=True)
+    status_parser = subparsers.add_parser('status', help='List the stages of the indexed design points')
+    status_parser.add_argument('index', type=str, help='Index file')
+    status_parser.add_argument('--stage', type=str, help='Only this stage', default=None)
+    status_parser.add_argument('--status', type=str, choices=STATUSES, help='Only stages with this status', default=None)
+    status_parser.add_argument('--sweep-dir', type=str, help='Only design points of this output directory', default=None)
+    status_parser.add_argument('--json', action='store_true', help='Print the rows as JSON')
+    pending_parser = subparsers.add_parser('pending', help='List the design points whose stage never ran or failed')
+    pending_parser.add_argument('index', type=str, help='Index file')
+    pending_parser.add_argument('stage', type=str, help='Stage to run, with its solver for the CFD and ASO (e.g. aso_rans)')
+    pending_parser.add_argument('--after', type=str, help='Only design points whose AFTER stage is done (e.g. cfd_rans)', default=None)
+    pending_parser.add_argument('--sweep-dir', type=str, help='Only design points of this output directory', default=None)
+    refresh_parser = subparsers.add_parser('refresh', help='Mark PBS jobs that ended without recording their stage as failed')
+    refresh_parser.add_argument('index', type=str, help='Index file')
+    scan_parser = subparsers.add_parser('scan', help='Index an existing output directory')
+    scan_parser.add_argument('output_dir', type=str, help='Directory containing the winglet directories')
+    scan_parser.add_argument('--index', type=str, help='Index file (default: run_index.sqlite in the output directory)', default=None)
+    args = parser.parse_args()
+    if args.command_name == 'pending' and (args.stage in SOLVER_STAGES or args.after in SOLVER_STAGES):
+        parser.error("Give the solver of the CFD and ASO stages, e.g. cfd_euler or aso_rans")
+
+    if args.command_name == 'scan':
+        print(f"Indexed {scan(args.output_dir, args.index)} stages.")
+    else:
+        connection = connect(args.index)
+        if args.command_name == 'status':
+            rows = stage_status(connection, args.stage, args.status, args.sweep_dir)
+            if args.json:
+                print(json.dumps([dict(row) for row in rows], indent=2))
+            else:
+                print_rows(rows)
+        elif args.command_name == 'pending':
+            for row in pending(connection, args.stage, args.after, args.sweep_dir):
+                print(f"{row['cant']:g} {row['sweep']:g} {row['workdir']}")
+        elif args.command_name == 'refresh':
+            print(f"Marked {refresh(connection)} stages as failed.")
+        connection.close()
@@ -0,0 +1,78 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Multi-fidelity screening of a cant/sweep grid. Every design is solved with the Euler
+                 path (mesh without prism layer, EULER-cfd.cfg), ranked by a metric of its Euler CL and CD,
+                 and only the best designs go on to the prism-layer mesh, RANS CFD and optionally ASO.
+
+                 Metrics (higher is better):
+                    ld: L/D.
+                    cd: -CD (drag at the fixed CL of the configuration).
+                    k:  -CD/CL^2, the induced-drag factor 1/(pi AR e). The Euler drag of these subsonic
+                        cases is essentially induced drag, so this ranks span efficiency independently
+                        of the lift each winglet produces.
+"""
+
+import csv
+import adaptive_sampling
+
+METRICS = adaptive_sampling.OBJECTIVES
+SCREENING_FILE = 'screening.csv'
+DEFAULT_TOP = 5
+
+def rank(results, name='ld'):
+    """
+    Ranks the solved designs by a metric.
+
+    Parameters:
+        results (dict): (cant, sweep) to (CL, CD), with None for designs that were not solved.
+        name (str): Metric (see METRICS and adaptive_sampling.objective).
+
+    Returns:
+        list: (point, CL, CD, metric value) from best to worst, designs without a value left out.
+    """
+    ranked = []
+    for point, (cl, cd) in results.items():
+        value = adaptive_sampling.objective(cl, cd, name) if cl is not None and cd is not None else None
+        if value is not None:
+            ranked.append((point, cl, cd, value))
+    return sorted(ranked, key=lambda row: row[3], reverse=True)
+
+def select(ranked, top=None, margin=None):
+    """
+    Designs passed on to the high-fidelity stages: the top best, and those whose metric is within
+    margin (a fraction, 0.05 is 5%) of the best. Without top nor margin, the DEFAULT_TOP best.
+
+    Returns:
+        list: Selected points, best first.
+    """
+    if not ranked:
+        return []
+    if top is None and margin is None:
+        top = DEFAULT_TOP
+    best = ranked[0][3]
+    selected = []
+    for position, (point, _, _, value) in enumerate(ranked):
+        if (top is not None and position < top) or (margin is not None and value >= best - margin * abs(best)):
+            selected.append(point)
+    return selected
+
+def write_screening(path, ranked, failed, selected, name):
+    """Writes the ranking of the screening: one row per design, best first, then the designs that were not solved."""
+    chosen = set(selected)
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['rank', 'cant', 'sweep', 'cl', 'cd', name, 'selected'])
+        for position, (point, cl, cd, value) in enumerate(ranked, 1):
+            writer.writerow([position, point[0], point[1], cl, cd, value, int(point in chosen)])
+        for point in failed:
+            writer.writerow(['', point[0], point[1], '', '', '', 0])
+
+def print_ranking(ranked, selected, name, limit=10):
+    """Prints the best designs of the screening."""
+    chosen = set(selected)
+    print(f"{'rank':>4}  {'cant':>6}{'sweep':>7}{'CL':>11}{'CD':>11}{name:>11}  selected")
+    for position, (point, cl, cd, value) in enumerate(ranked[:max(limit, len(selected))], 1):
+        print(f"{position:>4}  {point[0]:>6}{point[1]:>7}{cl:>11.5f}{cd:>11.5f}{value:>11.4f}  {'yes' if point in chosen else ''}")
@@ -0,0 +1,166 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Submits each stage of a design point (geometry, mesh, CFD, ASO) as a separate job
+                 with its own resource request, chained with afterok dependencies.
+"""
+
+import os
+import subprocess
+import template_renderer
+import tool_paths
+import mpi_layout
+import resource_model
+import run_index
+
+STAGE_ORDER = ['geo', 'mesh', 'cfd', 'aso']
+
+# Default resources per stage: (ncpus, memory in GB, walltime in hours).
+# CFD and ASO default to the -np/-mem/-time given to main_runAutomation.
+DEFAULT_STAGE_RESOURCES = {
+    'geo': (1, 8, 1),
+    'mesh': (8, 32, 4),
+}
+
+def parse_stage_resources(specs, np, mem, time):
+    """
+    Builds the resource profile of every stage.
+
+    Parameters:
+        specs (list): Overrides in the form STAGE=NCPUS:MEM:HOURS (e.g. mesh=16:64:4).
+        np (int): Default number of processors of the CFD and ASO stages.
+        mem (int): Default memory of the CFD and ASO stages in GB.
+        time (int): Default walltime of the CFD and ASO stages in hours.
+
+    Returns:
+        dict: Stage name to (ncpus, mem, walltime) tuple.
+    """
+    resources = dict(DEFAULT_STAGE_RESOURCES)
+    resources['cfd'] = (np, mem, time)
+    resources['aso'] = (np, mem, time)
+    for spec in specs or []:
+        try:
+            stage, values = spec.split('=')
+            ncpus, stage_mem, hours = (int(value) for value in values.split(':'))
+        except ValueError:
+            raise ValueError(f"Invalid stage resources '{spec}'. Expected STAGE=NCPUS:MEM:HOURS.")
+        if stage not in STAGE_ORDER:
+            raise ValueError(f"Unknown stage '{stage}'. Expected one of {', '.join(STAGE_ORDER)}.")
+        resources[stage] = (ncpus, stage_mem, hours)
+    return resources
+
+def stage_command(stage, steps, workdir, cant, sweep):
+    """Returns the command line that runs a stage inside its job, recorded in the ledger of the design."""
+    cache_args = ""
+    if steps.get('cache_dir'):
+        cache_args = f" --cache-dir {steps['cache_dir']} --cache-size {steps.get('cache_size', 50)}"
+    if stage == 'geo':
+        command = f"python3 $BIN_DIR/geometry_generation.py -c {cant} -s {sweep} -o {workdir}/GEOMETRY{cache_args}"
+    elif stage == 'mesh':
+        command = f"python3 $BIN_DIR/mesh_generation.py -np $NP -i {workdir}/GEOMETRY -o {workdir}/MESH -pl {steps['prism_layer']}{cache_args}"
+        if steps.get('cells_per_rank'):
+            # Resize the queued CFD/ASO jobs of the design to the new mesh
+            command += f" --cells-per-rank {steps['cells_per_rank']} --cores-per-node {steps.get('cores_per_node', mpi_layout.DEFAULT_CORES_PER_NODE)}"
+            if steps.get('max_nodes'):
+                command += f" --max-nodes {steps['max_nodes']}"
+    elif stage == 'cfd':
+        command = f"python3 $BIN_DIR/run_CFD.py {steps['cfd_solver']} {workdir} {steps.get('cfd_args', '')}".rstrip() + cache_args
+    elif stage == 'aso':
+        command = f"python3 $BIN_DIR/run_ASO.py $NP {steps['aso_solver']} {workdir}{cache_args}"
+    else:
+        raise ValueError(f"Unknown stage '{stage}'")
+    ledger_args = ""
+    if steps.get('requeue') and stage in ('cfd', 'aso'):
+        # Stopped before the walltime and resubmitted (see requeue.py)
+        ledger_args = f"--requeue {workdir}/submit_{stage}.pbs "
+    if stage in ('cfd', 'aso'):
+        ledger_args += f"--solver {steps[f'{stage}_solver']} "
+    return f"python3 $BIN_DIR/stage_ledger.py run {ledger_args}{stage} {workdir} -- {command}"
+
+def index_key(stage, steps):
+    """Key of a stage in the run index and its completion marker, with the solver of steps for the CFD and ASO."""
+    return run_index.stage_key(stage, steps.get(f'{stage}_solver'))
+
+def write_stage_script(template_path, script_path, stage, resources, command):
+    """
+    Writes the PBS script of one stage from the stage template.
+
+    Parameters:
+        template_path (str): Path to the stage template.
+        script_path (str): Path to the stage script to write.
+        stage (str): Name of the stage.
+        resources (tuple): (ncpus, mem, walltime) of the stage, and optionally the number of nodes
+                           (ncpus and mem are then per node).
+        command (str): Command that runs the stage.
+    """
+    ncpus, mem, time = resources[:3]
+    rules = template_renderer.PBS_RESOURCE_RULES + (('command', r'^# Run the stage'),)
+    values = template_renderer.pbs_values(ncpus, mem, time, {}, resources[3] if len(resources) > 3 else 1)
+    values['command'] = f"# Run the {stage} stage\n{command}"
+    template_renderer.render_template_file(template_path, script_path, rules, values)
+
+def submit_stage(script_path, depends_on=None, after=None):
+    """
+    Submits a stage script, optionally after another job completes successfully (afterok)
+    and after another job has ended, whatever its exit status (afterany).
+
+    Returns:
+        str: Job ID of the stage, or None if the submission failed.
+    """
+    cmd = [tool_paths.QSUB]
+    dependencies = [f"afterok:{depends_on}"] if depends_on else []
+    if after:
+        dependencies.append(f"afterany:{after}")
+    if dependencies:
+        cmd += ["-W", f"depend={','.join(dependencies)}"]
+    cmd.append(os.path.basename(script_path))
+    try:
+        result = subprocess.run(cmd, cwd=os.path.dirname(script_path), check=True, capture_output=True, text=True)
+        return result.stdout.strip()
+    except subprocess.CalledProcessError as e:
+        print(f"Error executing qsub: {e}")
+        return None
+
+def submit_design_stages(executor, workdir, cant, sweep, steps, resources, donor_job=None):
+    """
+    Submits the chain of stage jobs of one design point.
+
+    Parameters:
+        executor (PBSExecutor or LocalExecutor): Executor that runs the stages (see executors.py).
+        workdir (str): Output directory of the design point.
+        cant (int): Cant angle (degrees).
+        sweep (int): Sweep angle (degrees).
+        steps (dict): Stages to run and solvers to use.
+        resources (dict): Stage name to (ncpus, mem, walltime) tuple.
+                          The CFD and ASO are sized from their mesh instead when steps has cells_per_rank
+                          and the mesh already exists (see mpi_layout.py). With predict_resources, the
+                          memory and walltime are predicted from the history of the sweep (see resource_model.py).
+        donor_job (str, optional): CFD job of the warm-start donor of the design point, which the CFD waits for.
+
+    Returns:
+        dict: Stage name to job ID of the submitted stages.
+    """
+    job_ids = {}
+    previous = None
+    for stage in STAGE_ORDER:
+        if steps.get(stage) != 1:
+            continue
+        stage_resources = resources[stage]
+        if stage in ('cfd', 'aso') and steps.get('mesh') != 1:
+            layout = mpi_layout.design_layout(workdir, steps[f'{stage}_solver'], steps)
+            if layout:
+                stage_resources = mpi_layout.resources(layout, stage_resources[2])
+        if steps.get('predict_resources'):
+            # Walltime and memory learnt from the completed runs of the sweep
+            stage_resources = resource_model.stage_resources(stage, workdir, steps, stage_resources)
+        job_id = executor.submit(stage, workdir, stage_command(stage, steps, workdir, cant, sweep), stage_resources, previous,
+                                 donor_job if stage == 'cfd' else None)
+        if job_id is None:
+            # Later stages would never be released, so stop the chain here
+            print(f"Stopping stage chain of {workdir} at {stage}")
+            break
+        job_ids[stage] = job_id
+        previous = job_id
+    return job_ids
@@ -0,0 +1,293 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Runs a stage of a design point and appends a record of its resource usage to the
+                 ledger of the design (ledger.jsonl in the winglet directory): wall time, CPU time,
+                 peak RSS and block I/O of the stage's processes, exit status, and the metrics the
+                 stage reports itself (solver iterations, y+ loop count, cache hits, ...).
+                 The status of the stage is also kept up to date in the run index (see run_index.py), and
+                 stages that already completed with the same inputs are skipped (see checkpoint.py).
+                 The summary command aggregates the ledgers of a whole sweep.
+
+    Usage:  python3 stage_ledger.py run [--requeue <job script>] [--solver <solver>] <stage> <winglet directory> -- <command> [arguments]
+            python3 stage_ledger.py summary <output directory> [--top N] [--csv file]
+"""
+
+import os
+import sys
+import csv
+import json
+import glob
+import time
+import socket
+import argparse
+import resource
+import subprocess
+from datetime import datetime
+import mpi_layout
+
+LEDGER_NAME = 'ledger.jsonl'
+# Set for the stage's processes: file in which report_metrics stores the stage's own metrics
+METRICS_ENV = 'STAGE_METRICS'
+
+def report_metrics(**metrics):
+    """
+    Records metrics of the running stage (e.g. iterations=1200) for its ledger entry.
+    Does nothing when the stage is not run through the ledger.
+    """
+    metrics_path = os.environ.get(METRICS_ENV)
+    if not metrics_path:
+        return
+    try:
+        with open(metrics_path, 'r') as file:
+            current = json.load(file)
+    except (OSError, ValueError):
+        current = {}
+    current.update(metrics)
+    with open(metrics_path, 'w') as file:
+        json.dump(current, file)
+
+def append_record(workdir, record):
+    """Appends a record to the ledger of a design point with a single write."""
+    line = json.dumps(record, sort_keys=True) + "\n"
+    with open(os.path.join(workdir, LEDGER_NAME), 'a') as file:
+        file.write(line)
+
+def read_ledger(ledger_path):
+    """Reads the records of a ledger, skipping truncated lines."""
+    records = []
+    with open(ledger_path, 'r') as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def update_index(workdir, stage, status, exit_status=None, metrics=None):
+    """Records the status of the stage key in the run index. An unavailable index never fails the stage."""
+    try:
+        import run_index
+        run_index.record_stage(run_index.index_path(workdir), workdir, stage, status, exit_status, os.environ.get('PBS_JOBID'), metrics)
+    except Exception as e:
+        print(f"Error updating the run index of {workdir}: {e}")
+
+def last_metrics(workdir, stage, solver=None):
+    """Metrics of the last successful run of a stage (with this solver) in the ledger of the design, or an empty dict."""
+    ledger_path = os.path.join(workdir, LEDGER_NAME)
+    if not os.path.exists(ledger_path):
+        return {}
+    runs = [record for record in read_ledger(ledger_path) if record['stage'] == stage and record['exit_status'] == 0
+            and (solver is None or record.get('metrics', {}).get('solver') == solver)]
+    return runs[-1].get('metrics', {}) if runs else {}
+
+def run_stage(stage, workdir, command, requeue_script=None, margin_min=None, solver=None):
+    """
+    Runs a stage and appends its record to the ledger.
+    A stage that already completed with the same command and inputs is skipped (see checkpoint.py).
+    Otherwise its inputs and artefacts compressed by the retention policy are restored first (see retention.py).
+
+    Parameters:
+        stage (str): Name of the stage (geo, mesh, cfd, aso).
+        workdir (str): Winglet directory of the design point.
+        command (list): Command line of the stage.
+        requeue_script (str, optional): PBS script of the job. The stage is stopped before the walltime of
+            the job and the script submitted again (see requeue.py).
+        margin_min (float, optional): Minutes left before the walltime when the stage is stopped.
+        solver (str, optional): Solver of a CFD or ASO stage. Its completion marker and run index row
+            are kept per solver (see run_index.stage_key).
+
+    Returns:
+        int: Exit status of the stage (requeue.REQUEUE_STATUS if it was stopped and requeued).
+    """
+    import checkpoint
+    import requeue
+    import retention
+    import run_index
+    workdir = os.path.abspath(workdir)
+    key = run_index.stage_key(stage, solver)
+    metrics_path = os.path.join(workdir, f".metrics_{key}_{os.getpid()}.json")
+    env = dict(os.environ, **{METRICS_ENV: metrics_path})
+
+    if checkpoint.is_complete(key, workdir, command):
+        print(f"Stage {key} of {workdir} already complete, skipping (set {checkpoint.FORCE_ENV}=1 to run it again)")
+        metrics = dict(last_metrics(workdir, stage, solver), skipped=True)
+        append_record(workdir, {
+            'design': os.path.basename(workdir), 'stage': stage, 'start': datetime.now().isoformat(timespec='seconds'),
+            'wall_s': 0.0, 'cpu_user_s': 0.0, 'cpu_sys_s': 0.0, 'max_rss_mb': 0.0, 'read_bytes': 0, 'write_bytes': 0,
+            'exit_status': 0, 'host': socket.gethostname(), 'job_id': os.environ.get('PBS_JOBID'), 'ncpus': None, 'metrics': metrics,
+        })
+        update_index(workdir, key, 'done', 0, metrics)
+        return 0
+    # Inputs and artefacts compressed by the retention policy are restored only for a stage that runs
+    retention.restore_stage(key, workdir)
+    checkpoint.clear(key, workdir)
+
+    deadline = None
+    if requeue_script:
+        deadline = requeue.deadline(requeue_script, requeue.DEFAULT_MARGIN_MIN if margin_min is None else margin_min)
+
+    update_index(workdir, key, 'running')
+    started = datetime.now().isoformat(timespec='seconds')
+    start = time.monotonic()
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    requeued = False
+    try:
+        if deadline is None:
+            exit_status = subprocess.call(command, env=env)
+        elif deadline <= time.time():
+            # Not enough walltime left to start the stage
+            exit_status, requeued = requeue.REQUEUE_STATUS, True
+        else:
+            # Own session, so that the whole MPI job can be stopped at the deadline
+            process = subprocess.Popen(command, env=env, start_new_session=True)
+            try:
+                exit_status = process.wait(timeout=deadline - time.time())
+            except subprocess.TimeoutExpired:
+                print(f"Stopping stage {stage} before the walltime of job {os.environ.get('PBS_JOBID')}")
+                from convergence_monitor import stop_process
+                stop_process(process)
+                exit_status, requeued = requeue.REQUEUE_STATUS, True
+    except OSError as e:
+        print(f"Error starting stage {stage}: {e}")
+        exit_status = 127
+    wall_time = time.monotonic() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    metrics = {}
+    if os.path.exists(metrics_path):
+        try:
+            with open(metrics_path, 'r') as file:
+                metrics = json.load(file)
+        except (OSError, ValueError):
+            pass
+        os.remove(metrics_path)
+    if requeued:
+        metrics['requeued'] = True
+
+    record = {
+        'design': os.path.basename(workdir),
+        'stage': stage,
+        'start': started,
+        'wall_s': round(wall_time, 3),
+        'cpu_user_s': round(after.ru_utime - before.ru_utime, 3),
+        'cpu_sys_s': round(after.ru_stime - before.ru_stime, 3),
+        # ru_maxrss of the children is the peak of the largest process waited for, in kB on Linux
+        'max_rss_mb': round(after.ru_maxrss / 1024, 1),
+        # Block I/O, in 512-byte units
+        'read_bytes': (after.ru_inblock - before.ru_inblock) * 512,
+        'write_bytes': (after.ru_oublock - before.ru_oublock) * 512,
+        'exit_status': exit_status,
+        'host': socket.gethostname(),
+        'job_id': os.environ.get('PBS_JOBID'),
+        'ncpus': int(os.environ['NCPUS']) if os.environ.get('NCPUS', '').isdigit() else None,
+        # MPI ranks over every node of the job
+        'ranks': mpi_layout.allocated_ranks(),
+        'metrics': metrics,
+    }
+    append_record(workdir, record)
+    if requeued:
+        if requeue.resubmit(requeue_script, workdir, key) is None:
+            update_index(workdir, key, 'failed', exit_status, metrics)
+            return 1
+        return exit_status
+    if exit_status == 0:
+        checkpoint.mark_complete(key, workdir, command)
+    update_index(workdir, key, 'done' if exit_status == 0 else 'failed', exit_status, metrics)
+    return exit_status
+
+def load_sweep(output_dir):
+    """Reads the ledgers of every winglet directory below output_dir."""
+    records = []
+    for ledger_path in sorted(glob.glob(os.path.join(output_dir, '*', LEDGER_NAME))):
+        records.extend(read_ledger(ledger_path))
+    return records
+
+def summarize(records):
+    """
+    Aggregates ledger records per stage.
+
+    Returns:
+        dict: Stage name to totals (runs, failures, wall and CPU hours, mean and max wall time, max RSS, I/O).
+    """
+    summary = {}
+    for record in records:
+        stage = summary.setdefault(record['stage'], {
+            'runs': 0, 'failures': 0, 'wall_h': 0.0, 'cpu_h': 0.0, 'core_h': 0.0,
+            'max_wall_s': 0.0, 'max_rss_mb': 0.0, 'read_gb': 0.0, 'write_gb': 0.0,
+        })
+        stage['runs'] += 1
+        stage['failures'] += record['exit_status'] != 0
+        stage['wall_h'] += record['wall_s'] / 3600
+        stage['cpu_h'] += (record['cpu_user_s'] + record['cpu_sys_s']) / 3600
+        # Allocation actually charged: wall time times the cores held
+        stage['core_h'] += record['wall_s'] * (record.get('ncpus') or 1) / 3600
+        stage['max_wall_s'] = max(stage['max_wall_s'], record['wall_s'])
+        stage['max_rss_mb'] = max(stage['max_rss_mb'], record['max_rss_mb'])
+        stage['read_gb'] += record['read_bytes'] / 1024**3
+        stage['write_gb'] += record['write_bytes'] / 1024**3
+    for stage in summary.values():
+        stage['mean_wall_s'] = 3600 * stage['wall_h'] / stage['runs']
+        stage['cpu_utilisation'] = stage['cpu_h'] / stage['core_h'] if stage['core_h'] else None
+    return summary
+
+def print_summary(records, top=10):
+    """Prints the per-stage totals and the designs that used the most core-hours."""
+    summary = summarize(records)
+    print(f"{'stage':<8}{'runs':>6}{'failed':>8}{'wall h':>10}{'core h':>10}{'CPU util':>10}{'mean wall s':>13}{'max wall s':>12}{'max RSS MB':>12}{'read GB':>9}{'write GB':>10}")
+    for name, stage in summary.items():
+        utilisation = f"{100 * stage['cpu_utilisation']:.0f}%" if stage['cpu_utilisation'] is not None else '-'
+        print(f"{name:<8}{stage['runs']:>6}{stage['failures']:>8}{stage['wall_h']:>10.2f}{stage['core_h']:>10.2f}{utilisation:>10}"
+              f"{stage['mean_wall_s']:>13.1f}{stage['max_wall_s']:>12.1f}{stage['max_rss_mb']:>12.1f}{stage['read_gb']:>9.2f}{stage['write_gb']:>10.2f}")
+
+    designs = {}
+    for record in records:
+        designs[record['design']] = designs.get(record['design'], 0.0) + record['wall_s'] * (record.get('ncpus') or 1) / 3600
+    if designs:
+        print(f"\nTop {min(top, len(designs))} designs by core-hours:")
+        for design, core_hours in sorted(designs.items(), key=lambda item: -item[1])[:top]:
+            print(f"  {design:<30}{core_hours:>10.2f}")
+
+def write_csv(records, csv_path):
+    """Writes every ledger record, with its metrics flattened, to a CSV file."""
+    metric_names = sorted({name for record in records for name in record.get('metrics', {})})
+    columns = ['design', 'stage', 'start', 'wall_s', 'cpu_user_s', 'cpu_sys_s', 'max_rss_mb', 'read_bytes',
+               'write_bytes', 'exit_status', 'host', 'job_id', 'ncpus', 'ranks']
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns + metric_names)
+        for record in records:
+            writer.writerow([record.get(name) for name in columns] + [record.get('metrics', {}).get(name) for name in metric_names])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a stage with resource accounting, or summarise the ledgers of a sweep.')
+    subparsers = parser.add_subparsers(dest='command_name', required=True)
+    run_parser = subparsers.add_parser('run', help='Run a stage and append its record to the ledger of the design')
+    run_parser.add_argument('--requeue', type=str, help='PBS script of the job, submitted again if the stage reaches the walltime', default=None)
+    run_parser.add_argument('--margin', type=float, help='Minutes before the walltime at which the stage is stopped and requeued', default=None)
+    run_parser.add_argument('--solver', type=str, help='Solver of a CFD or ASO stage (Euler or RANS)', default=None)
+    run_parser.add_argument('stage', type=str, help='Name of the stage (geo, mesh, cfd, aso)')
+    run_parser.add_argument('workdir', type=str, help='Winglet directory of the design point')
+    run_parser.add_argument('stage_command', nargs=argparse.REMAINDER, help='Command of the stage, after --')
+    summary_parser = subparsers.add_parser('summary', help='Aggregate the ledgers of every design in an output directory')
+    summary_parser.add_argument('output_dir', type=str, help='Directory containing the winglet directories')
+    summary_parser.add_argument('--top', type=int, help='Number of most expensive designs to list', default=10)
+    summary_parser.add_argument('--csv', type=str, help='Also write every record to this CSV file', default=None)
+    args = parser.parse_args()
+
+    if args.command_name == 'run':
+        stage_command = args.stage_command[1:] if args.stage_command[:1] == ['--'] else args.stage_command
+        if not stage_command:
+            parser.error("Provide the command of the stage after --")
+        sys.exit(run_stage(args.stage, args.workdir, stage_command, args.requeue, args.margin, args.solver))
+
+    records = load_sweep(args.output_dir)
+    if not records:
+        print(f"No ledger found below {args.output_dir}")
+        sys.exit(1)
+    print_summary(records, args.top)
+    if args.csv:
+        write_csv(records, args.csv)
+        print(f"Records saved to {args.csv}")
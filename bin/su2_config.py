@@ -0,0 +1,60 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Reads and updates options of SU2 configuration (.cfg) files.
+"""
+
+def read_config(cfg_path):
+    """
+    Reads the options of an SU2 configuration file.
+
+    Parameters:
+        cfg_path (str): Path to the configuration file.
+
+    Returns:
+        dict: Option name (upper case) to its raw value as a string.
+    """
+    options = {}
+    with open(cfg_path, 'r') as file:
+        for line in file:
+            stripped_line = line.strip()
+            if not stripped_line or stripped_line.startswith('%') or '=' not in stripped_line:
+                continue
+            name, value = stripped_line.split('=', 1)
+            options[name.strip().upper()] = value.strip()
+    return options
+
+def get_float(options, name, default=None):
+    """Returns a numerical option, or the default if it is missing or not a number."""
+    try:
+        return float(options[name])
+    except (KeyError, ValueError):
+        return default
+
+def update_config(cfg_path, values):
+    """
+    Sets options of an SU2 configuration file, appending the ones that are not present.
+
+    Parameters:
+        cfg_path (str): Path to the configuration file.
+        values (dict): Option name to its new value.
+    """
+    with open(cfg_path, 'r') as file:
+        lines = file.read().splitlines()
+
+    remaining = {name.upper(): value for name, value in values.items()}
+    for i, line in enumerate(lines):
+        stripped_line = line.strip()
+        if stripped_line.startswith('%') or '=' not in stripped_line:
+            continue
+        name = stripped_line.split('=', 1)[0].strip().upper()
+        if name in remaining:
+            lines[i] = f"{name}= {remaining.pop(name)}"
+
+    for name, value in remaining.items():
+        lines.append(f"{name}= {value}")
+
+    with open(cfg_path, 'w') as file:
+        file.write("\n".join(lines) + "\n")
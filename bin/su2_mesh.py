@@ -0,0 +1,151 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Converts meshes to the SU2 native format with SU2_DEF and reads native SU2 meshes.
+                 The native mesh of a CGNS mesh and the SU2_GEO outputs of a mesh are produced once per
+                 mesh hash, and reused from the working directory or from the artefact cache.
+"""
+
+import os
+import shutil
+import subprocess
+import numpy as np
+import artifact_cache
+import su2_config
+import tool_paths
+
+NATIVE_MESH = 'mesh_native.su2'
+# Written next to reusable outputs: cache key they were produced for
+KEY_SUFFIX = '.key'
+
+def convert_to_native(cfg_file, work_dir, output_name=NATIVE_MESH, mesh_name=None):
+    """
+    Writes the mesh of a configuration in SU2 native format by running SU2_DEF without deformation.
+
+    Parameters:
+        cfg_file (str): Configuration file whose MESH_FILENAME/MESH_FORMAT describe the input mesh.
+        work_dir (str): Directory in which SU2_DEF runs (and where the mesh is read from).
+        output_name (str): Name of the native mesh written in work_dir.
+        mesh_name (str, optional): CGNS mesh in work_dir to convert instead of MESH_FILENAME.
+
+    Returns:
+        str: Path to the native mesh.
+    """
+    # SU2_DEF only writes the mesh when no design variable is defined
+    def_cfg = os.path.join(work_dir, 'convert_mesh.cfg')
+    shutil.copyfile(cfg_file, def_cfg)
+    values = {'DV_KIND': 'NO_DEFORMATION', 'MESH_OUT_FILENAME': output_name}
+    if mesh_name:
+        values.update({'MESH_FILENAME': mesh_name, 'MESH_FORMAT': 'CGNS'})
+    su2_config.update_config(def_cfg, values)
+
+    cmd_str = f"{tool_paths.su2('SU2_DEF')} {def_cfg}"
+    subprocess.run(cmd_str, cwd=work_dir, shell=True, check=True)
+
+    output_path = os.path.join(work_dir, output_name)
+    if not os.path.exists(output_path):
+        raise RuntimeError(f"SU2_DEF did not write '{output_path}'")
+    return output_path
+
+def native_mesh(cfg_file, work_dir, output_name=NATIVE_MESH):
+    """Path to the mesh of a configuration in native format, converting it only if the configuration reads a CGNS mesh."""
+    options = su2_config.read_config(cfg_file)
+    if options.get('MESH_FORMAT', 'SU2').upper() == 'SU2':
+        return os.path.join(work_dir, options.get('MESH_FILENAME', 'mesh.su2'))
+    return convert_to_native(cfg_file, work_dir, output_name)
+
+def cached_outputs(key, names, work_dir, run, cache_dir=None, cache_size=artifact_cache.DEFAULT_CACHE_SIZE_GB):
+    """
+    Produces the outputs of a step unless they are already available for the same key.
+    The outputs are reused from work_dir if they were produced there for the key (e.g. by a previous
+    launch of the stage), then restored from the artefact cache, and only then produced by run.
+
+    Parameters:
+        key (str): Cache key of the step (see artifact_cache.cache_key).
+        names (list): Names of the outputs in work_dir. The first one carries the key file.
+        work_dir (str): Directory of the outputs.
+        run (callable): Produces the outputs in work_dir.
+        cache_dir (str, optional): Artefact cache directory.
+        cache_size (float): Size limit of the artefact cache in GB.
+
+    Returns:
+        str: 'reused', 'cache' or 'run'.
+    """
+    key_path = os.path.join(work_dir, f".{names[0]}{KEY_SUFFIX}")
+    if all(os.path.exists(os.path.join(work_dir, name)) for name in names) and os.path.exists(key_path):
+        with open(key_path, 'r') as file:
+            if file.read().strip() == key:
+                return 'reused'
+
+    if os.path.exists(key_path):
+        os.remove(key_path)
+    if artifact_cache.lookup(cache_dir, key, names, work_dir):
+        source = 'cache'
+    else:
+        # Stale outputs may be links to cache entries of another key, which the tools would overwrite in place
+        for name in names:
+            if os.path.lexists(os.path.join(work_dir, name)):
+                os.remove(os.path.join(work_dir, name))
+        run()
+        artifact_cache.store(cache_dir, key, names, work_dir, int(cache_size * 1024**3))
+        source = 'run'
+    with open(key_path, 'w') as file:
+        file.write(key + "\n")
+    return source
+
+def prepare_native_mesh(cfg_file, work_dir, mesh_name, cache_dir=None, cache_size=artifact_cache.DEFAULT_CACHE_SIZE_GB):
+    """
+    Converts a CGNS mesh to SU2 native format once per mesh content and points the configuration at it,
+    so that the solver does not import the CGNS mesh at every launch.
+
+    Parameters:
+        cfg_file (str): Configuration file of the run, updated to read the native mesh.
+        work_dir (str): Directory containing the CGNS mesh, where the native mesh is placed.
+        mesh_name (str): Name of the CGNS mesh in work_dir.
+        cache_dir (str, optional): Artefact cache directory shared between design points and runs.
+        cache_size (float): Size limit of the artefact cache in GB.
+
+    Returns:
+        str: 'reused', 'cache' or 'run'.
+    """
+    key = artifact_cache.cache_key('native_mesh', files=[os.path.join(work_dir, mesh_name)])
+    source = cached_outputs(key, [NATIVE_MESH], work_dir,
+                            lambda: convert_to_native(cfg_file, work_dir, NATIVE_MESH, mesh_name), cache_dir, cache_size)
+    su2_config.update_config(cfg_file, {'MESH_FILENAME': NATIVE_MESH, 'MESH_FORMAT': 'SU2'})
+    return source
+
+def geometry_outputs(cfg_file):
+    """Names of the files written by SU2_GEO for a configuration."""
+    options = su2_config.read_config(cfg_file)
+    extension = '.csv' if options.get('TABULAR_FORMAT', 'CSV').upper() == 'CSV' else '.dat'
+    return ['of_func' + extension]
+
+def geometry_key(cfg_file, mesh_path):
+    """Cache key of SU2_GEO: the mesh content and the GEO_ options of the configuration."""
+    options = su2_config.read_config(cfg_file)
+    params = {name: value for name, value in options.items() if name.startswith('GEO_')}
+    return artifact_cache.cache_key('su2_geo', files=[mesh_path], params=params)
+
+def read_points(su2_path):
+    """
+    Reads the node coordinates of a native (ASCII) SU2 mesh.
+
+    Parameters:
+        su2_path (str): Path to the .su2 mesh.
+
+    Returns:
+        numpy.ndarray: Coordinates with shape (NPOIN, NDIME).
+    """
+    with open(su2_path, 'r') as file:
+        n_dim = None
+        for line in file:
+            stripped_line = line.strip()
+            if stripped_line.startswith('NDIME='):
+                n_dim = int(stripped_line.split('=')[1])
+            elif stripped_line.startswith('NPOIN='):
+                n_points = int(stripped_line.split('=')[1].split()[0])
+                points = np.loadtxt(file, max_rows=n_points, usecols=range(n_dim or 3))
+                return points.reshape(n_points, -1)
+    raise ValueError(f"No NPOIN section found in '{su2_path}'")
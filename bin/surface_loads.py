@@ -0,0 +1,336 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Reduces the SU2 surface output (surface_flow.vtu) of every design point to compact spanwise
+                 load arrays, so that winglets can be compared without opening the VTU files.
+
+                 The surface of each design is split into the wing (up to the wing span of the geometry
+                 stage) and the blended winglet, and each section into spanwise stations. Surface cells are
+                 split between the stations they overlap. For every station the sectional lift and drag
+                 coefficients are integrated from the pressure (and skin friction for RANS) of its strip
+                 of surface, the chord is cut through the cell edges at mid-station, and the Cp is averaged
+                 over chordwise bins of each side. The maximum and mean y+ are kept for RANS runs.
+
+                 The surface arrays are read zero-copy with vtk_to_numpy and every reduction is vectorised.
+                 Design points are processed by a pool of worker processes, one design per task. Each
+                 design is written as float32 to CFD/<solver>/surface_loads.npz, and the whole sweep
+                 is stacked into one archive. Designs whose loads are newer than their surface output are
+                 not read again.
+
+    Usage:  python3 surface_loads.py <base dir> <cant angles> <sweep angles> [-s SOLVER] [-o OUTPUT] [-j WORKERS]
+"""
+
+import os
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import su2_config
+import geometry_generation
+
+LOADS_NAME = 'surface_loads.npz'
+# Version of the reduction written with the loads: loads of another version are recomputed
+LOADS_VERSION = 2
+DEFAULT_STATIONS = 40
+DEFAULT_CHORD_BINS = 50
+# Distance (m) from the wing plane beyond which a surface cell belongs to the winglet, above the half thickness of the wing
+WING_PLANE_TOL = 0.05
+SECTIONS = ['wing', 'winglet']
+SECTION_ARRAYS = ['span', 'chord', 'cl', 'cd', 'cp']
+
+def surface_path(cfg_file, work_dir):
+    """Surface output of a CFD run (SURFACE_FILENAME of its configuration, surface_flow by default)."""
+    options = su2_config.read_config(cfg_file) if os.path.exists(cfg_file) else {}
+    return os.path.join(work_dir, options.get('SURFACE_FILENAME', 'surface_flow') + '.vtu')
+
+def read_surface(file_path):
+    """
+    Reads a surface VTU file without copying its arrays.
+
+    Returns:
+        tuple: (points (n, 3), cell offsets (cells + 1), cell connectivity, dict of point arrays by name).
+    """
+    import vtk
+    from vtk.util.numpy_support import vtk_to_numpy
+    reader = vtk.vtkXMLUnstructuredGridReader()
+    reader.SetFileName(file_path)
+    reader.Update()
+    grid = reader.GetOutput()
+    cells = grid.GetCells()
+    point_data = grid.GetPointData()
+    arrays = {point_data.GetArrayName(i): vtk_to_numpy(point_data.GetArray(i)) for i in range(point_data.GetNumberOfArrays())}
+    return vtk_to_numpy(grid.GetPoints().GetData()), vtk_to_numpy(cells.GetOffsetsArray()), vtk_to_numpy(cells.GetConnectivityArray()), arrays
+
+def cell_geometry(points, offsets, connectivity):
+    """
+    Area vectors (Newell's formula, any polygon) and centres of the surface cells.
+
+    Returns:
+        tuple: (area vectors (cells, 3), centres (cells, 3)).
+    """
+    starts, sizes = offsets[:-1], np.diff(offsets)
+    following = np.arange(1, len(connectivity) + 1)
+    following[offsets[1:] - 1] = starts
+    corners = points[connectivity]
+    area = 0.5 * np.add.reduceat(np.cross(corners, points[connectivity[following]]), starts)
+    centre = np.add.reduceat(corners, starts) / sizes[:, None]
+    return area, centre
+
+def cell_mean(values, offsets, connectivity):
+    """Mean over the corners of every cell of a point array (scalar or vector)."""
+    sizes = np.diff(offsets)
+    sums = np.add.reduceat(values[connectivity], offsets[:-1])
+    return sums / (sizes[:, None] if sums.ndim > 1 else sizes)
+
+def flow_axes(aoa):
+    """Drag and lift directions for an angle of attack in degrees (x streamwise, z up)."""
+    alpha = math.radians(aoa)
+    return np.array([math.cos(alpha), 0.0, math.sin(alpha)]), np.array([-math.sin(alpha), 0.0, math.cos(alpha)])
+
+def binned_mean(index, values, weights, size):
+    """Weighted mean of values in each of size bins, NaN in empty bins."""
+    total = np.bincount(index, weights=weights, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, np.bincount(index, weights=values * weights, minlength=size) / total, np.nan)
+
+def expand_ranges(first, counts):
+    """
+    Expands ranges of consecutive integers: element j of the range of item i is first[i] + j.
+
+    Returns:
+        tuple: (item of every element, integer of every element).
+    """
+    item = np.repeat(np.arange(len(counts)), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return item, first[item] + step
+
+def section_loads(corner_span, corner_x, offsets, area, force, cp, up, drag_axis, lift_axis, stations, chord_bins):
+    """
+    Spanwise loads of a wing section. Each cell is split between the stations it overlaps in proportion
+    to its spanwise extent, so that the loads of a station are those of its strip of surface. The chord
+    of a station is cut through the cell edges at the middle of the station.
+
+    Parameters:
+        corner_span (numpy.ndarray): Spanwise coordinate of the corners of the cells (m), cell after cell.
+        corner_x (numpy.ndarray): Streamwise coordinate of the corners of the cells (m), cell after cell.
+        offsets (numpy.ndarray): Start of every cell in the corner arrays, and their length (cells + 1).
+        area (numpy.ndarray): Outward area vectors of the cells.
+        force (numpy.ndarray): Force of the cells divided by the dynamic pressure (m^2).
+        cp (numpy.ndarray): Pressure coefficient of the cells.
+        up (numpy.ndarray): Direction normal to the section plane, from the lower to the upper side.
+        drag_axis, lift_axis (numpy.ndarray): Flow directions.
+        stations (int): Number of spanwise stations.
+        chord_bins (int): Number of chordwise Cp bins of each side.
+
+    Returns:
+        dict: span (stations), chord (stations), cl (stations), cd (stations), cp (stations, 2, chord_bins),
+              side 0 being the lower side. Empty stations are NaN.
+    """
+    starts, sizes = offsets[:-1], np.diff(offsets)
+    low, high = np.minimum.reduceat(corner_span, starts), np.maximum.reduceat(corner_span, starts)
+    start = low.min()
+    width = max(high.max() - start, 1e-12) / stations
+
+    # Fraction of every cell in each station it overlaps (cells in a plane of constant span count whole)
+    first = np.minimum(((low - start) / width).astype(np.int64), stations - 1)
+    last = np.minimum(((high - start) / width).astype(np.int64), stations - 1)
+    cell, station = expand_ranges(first, last - first + 1)
+    edge = start + station * width
+    extent = high[cell] - low[cell]
+    overlap = np.clip(np.minimum(high[cell], edge + width) - np.maximum(low[cell], edge), 0.0, None)
+    fraction = np.where(extent > 0, overlap / np.where(extent > 0, extent, 1.0), 1.0)
+
+    # Section cut at the middle of every station: streamwise position where the cell edges cross it
+    following = np.arange(1, len(corner_span) + 1)
+    following[offsets[1:] - 1] = starts
+    span_a, span_b = corner_span, corner_span[following]
+    lowest = np.maximum(np.ceil((np.minimum(span_a, span_b) - start) / width - 0.5).astype(np.int64), 0)
+    highest = np.minimum(np.floor((np.maximum(span_a, span_b) - start) / width - 0.5).astype(np.int64), stations - 1)
+    crossing, cut = expand_ranges(lowest, np.maximum(highest - lowest + 1, 0))
+    rise = span_b[crossing] - span_a[crossing]
+    t = np.where(rise != 0, (start + (cut + 0.5) * width - span_a[crossing]) / np.where(rise != 0, rise, 1.0), 0.0)
+    x_cut = corner_x[crossing] + t * (corner_x[following][crossing] - corner_x[crossing])
+    leading = np.full(stations, np.inf)
+    trailing = np.full(stations, -np.inf)
+    np.minimum.at(leading, cut, x_cut)
+    np.maximum.at(trailing, cut, x_cut)
+    chord = np.where(np.isfinite(leading) & np.isfinite(trailing), trailing - leading, np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cl = np.bincount(station, weights=(force @ lift_axis)[cell] * fraction, minlength=stations) / (chord * width)
+        cd = np.bincount(station, weights=(force @ drag_axis)[cell] * fraction, minlength=stations) / (chord * width)
+        x = np.add.reduceat(corner_x, starts) / sizes
+        position = np.clip((x[cell] - leading[station]) / chord[station], 0.0, 1.0)
+    position = np.nan_to_num(position)
+    side = (area @ up > 0).astype(np.int64)[cell]
+    chordwise = np.minimum((position * chord_bins).astype(np.int64), chord_bins - 1)
+    weights = np.linalg.norm(area, axis=1)[cell] * fraction
+    cp_bins = binned_mean((station * 2 + side) * chord_bins + chordwise, cp[cell], weights, stations * 2 * chord_bins)
+    empty = np.bincount(station, weights=fraction, minlength=stations) == 0
+    cl[empty] = cd[empty] = np.nan
+    return {
+        'span': start + (np.arange(stations) + 0.5) * width,
+        'chord': chord,
+        'cl': cl,
+        'cd': cd,
+        'cp': cp_bins.reshape(stations, 2, chord_bins),
+    }
+
+def design_loads(surface_file, cfg_file, cant, sweep, stations=DEFAULT_STATIONS, chord_bins=DEFAULT_CHORD_BINS):
+    """
+    Spanwise loads of the wing and winglet of a design point, from its surface output.
+
+    Returns:
+        dict: Arrays <section>_<span|chord|cl|cd|cp> (see section_loads), CL and CD of the surface,
+              and yplus_max and yplus_mean (NaN without a Y_Plus array).
+    """
+    options = su2_config.read_config(cfg_file) if os.path.exists(cfg_file) else {}
+    drag_axis, lift_axis = flow_axes(su2_config.get_float(options, 'AOA', 0.0))
+    points, offsets, connectivity, arrays = read_surface(surface_file)
+    area, centre = cell_geometry(points, offsets, connectivity)
+    cp = cell_mean(arrays['Pressure_Coefficient'], offsets, connectivity)
+
+    # The wing lies in the plane y-x from the root to its span; beyond it, or away from that plane, is the winglet
+    wing_span = float(geometry_generation.xsec_parameters(cant, sweep)['wing_span'])
+    magnitude = np.linalg.norm(area, axis=1)
+    on_wing = (centre[:, 1] <= wing_span)
+    plane = np.average(centre[on_wing, 2], weights=magnitude[on_wing]) if on_wing.any() else 0.0
+    on_wing &= np.abs(centre[:, 2] - plane) <= WING_PLANE_TOL
+    # Spanwise coordinate of the corners: y on the wing, distance along the winglet from the wing tip beyond it
+    sizes = np.diff(offsets)
+    corners = points[connectivity]
+    corner_span = np.where(np.repeat(on_wing, sizes), corners[:, 1],
+                           wing_span + np.hypot(corners[:, 1] - wing_span, corners[:, 2] - plane))
+
+    # Outward area vectors enclose a positive volume, the sum of x A_x (the open root, in the plane y = 0, adds nothing)
+    if np.dot(centre[:, 0] - centre[:, 0].mean(), area[:, 0]) < 0:
+        area = -area
+
+    force = -cp[:, None] * area
+    if 'Skin_Friction_Coefficient' in arrays:
+        friction = cell_mean(arrays['Skin_Friction_Coefficient'], offsets, connectivity)
+        force += friction[:, :3] * magnitude[:, None]
+
+    ref_area = su2_config.get_float(options, 'REF_AREA', 0.0) or 0.5 * np.abs(area[:, 2]).sum()
+    loads = {'CL': float(force.sum(axis=0) @ lift_axis / ref_area), 'CD': float(force.sum(axis=0) @ drag_axis / ref_area)}
+
+    winglet = ~on_wing
+    direction = np.array([0.0, 0.0, 1.0])
+    if winglet.any():
+        tangent = np.average(np.stack([centre[winglet, 1] - wing_span, centre[winglet, 2] - plane]), axis=1, weights=magnitude[winglet])
+        tangent /= max(np.linalg.norm(tangent), 1e-30)
+        direction = np.array([0.0, -tangent[1], tangent[0]])
+    for name, mask, up in [('wing', on_wing, np.array([0.0, 0.0, 1.0])), ('winglet', winglet, direction)]:
+        if mask.any():
+            corner_mask = np.repeat(mask, sizes)
+            section_offsets = np.concatenate([[0], np.cumsum(sizes[mask])])
+            section = section_loads(corner_span[corner_mask], corners[corner_mask, 0], section_offsets, area[mask], force[mask], cp[mask],
+                                    up, drag_axis, lift_axis, stations, chord_bins)
+        else:
+            section = {key: np.full((stations, 2, chord_bins) if key == 'cp' else stations, np.nan) for key in SECTION_ARRAYS}
+        loads.update({f"{name}_{key}": value for key, value in section.items()})
+
+    yplus = arrays.get('Y_Plus')
+    loads['yplus_max'] = float(yplus.max()) if yplus is not None and yplus.size else np.nan
+    loads['yplus_mean'] = float(yplus.mean()) if yplus is not None and yplus.size else np.nan
+    return loads
+
+def write_loads(path, loads):
+    """Writes the loads of a design as float32, with the version of the reduction."""
+    np.savez(f"{path}.tmp.npz", version=LOADS_VERSION, **{key: np.asarray(value, dtype=np.float32) for key, value in loads.items()})
+    os.replace(f"{path}.tmp.npz", path)
+
+def read_loads(path):
+    with np.load(path) as archive:
+        return {key: archive[key] for key in archive.files}
+
+def process_design(task):
+    """
+    Loads of one design point, computed from its surface output or read back when they are up to date.
+
+    Parameters:
+        task (tuple): (cant, sweep, winglet directory, solver, stations, chord bins).
+
+    Returns:
+        tuple: (cant, sweep, loads dict or None when there is no surface output).
+    """
+    cant, sweep, directory, solver, stations, chord_bins = task
+    work_dir = os.path.join(directory, 'CFD', solver)
+    cfg_file = os.path.join(work_dir, f'{solver.upper()}-cfd.cfg')
+    surface_file = surface_path(cfg_file, work_dir)
+    loads_path = os.path.join(work_dir, LOADS_NAME)
+    if not os.path.exists(surface_file):
+        return cant, sweep, None
+    if os.path.exists(loads_path) and os.path.getmtime(loads_path) >= os.path.getmtime(surface_file):
+        loads = read_loads(loads_path)
+        if (loads.get('version') == LOADS_VERSION and loads.get('wing_cl', np.empty(0)).shape == (stations,)
+                and loads['wing_cp'].shape[-1] == chord_bins):
+            return cant, sweep, loads
+    try:
+        loads = design_loads(surface_file, cfg_file, cant, sweep, stations, chord_bins)
+    except Exception as e:
+        print(f"Error reading {surface_file}: {e}")
+        return cant, sweep, None
+    write_loads(loads_path, loads)
+    return cant, sweep, loads
+
+def stack_loads(results, stations, chord_bins):
+    """
+    Stacks the loads of the design points along a first axis, NaN for the designs without loads.
+
+    Returns:
+        dict: cant and sweep (designs), and every loads array with a leading designs axis.
+    """
+    template = {'CL': (), 'CD': (), 'yplus_max': (), 'yplus_mean': ()}
+    for section in SECTIONS:
+        template.update({f"{section}_{key}": (stations, 2, chord_bins) if key == 'cp' else (stations,) for key in SECTION_ARRAYS})
+    stacked = {key: np.full((len(results),) + shape, np.nan, dtype=np.float32) for key, shape in template.items()}
+    for i, (_, _, loads) in enumerate(results):
+        for key in template:
+            if loads is not None and key in loads:
+                stacked[key][i] = loads[key]
+    stacked['cant'] = np.array([result[0] for result in results], dtype=np.int32)
+    stacked['sweep'] = np.array([result[1] for result in results], dtype=np.int32)
+    return stacked
+
+def main(base_dir, list_cant, list_sweep, solver='Euler', output_prefix='surface_loads', workers=None,
+         stations=DEFAULT_STATIONS, chord_bins=DEFAULT_CHORD_BINS):
+    """
+    Computes the spanwise loads of every design point with a pool of worker processes and stacks them.
+
+    Parameters:
+        base_dir (str): Directory containing the output folder.
+        list_cant (list): Cant angles to process.
+        list_sweep (list): Sweep angles to process.
+        solver (str): Solver of the CFD runs (Euler or RANS).
+        output_prefix (str): Output path of the stacked loads without extension.
+        workers (int, optional): Number of worker processes (all cores if None).
+        stations (int): Number of spanwise stations of each section.
+        chord_bins (int): Number of chordwise Cp bins of each side.
+    """
+    tasks = [(cant, sweep, os.path.join(base_dir, f'output/winglet_c{cant}_s{sweep}'), solver, stations, chord_bins)
+             for cant in list_cant for sweep in list_sweep]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # One design per task: a surface file is large enough to amortise the dispatch
+        results = list(executor.map(process_design, tasks))
+
+    np.savez(f"{output_prefix}.npz", **stack_loads(results, stations, chord_bins))
+    found = sum(result[2] is not None for result in results)
+    print(f"Loads of {found} of {len(results)} design points saved to {output_prefix}.npz")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reduce the surface output of every winglet configuration to spanwise loads.')
+    parser.add_argument('base_dir', type=str, help='Directory containing the output folder')
+    parser.add_argument('cant_angles', type=str, help='Cant angles to process, separated by commas')
+    parser.add_argument('sweep_angles', type=str, help='Sweep angles to process, separated by commas')
+    parser.add_argument('-s', '--solver', type=str, choices=['Euler', 'RANS'], help='Solver of the CFD runs', default='Euler')
+    parser.add_argument('-o', '--output', type=str, help='Output path of the stacked loads without extension', default='surface_loads')
+    parser.add_argument('-j', '--workers', type=int, help='Number of worker processes (default: all cores)', default=None)
+    parser.add_argument('--stations', type=int, help='Spanwise stations of the wing and of the winglet', default=DEFAULT_STATIONS)
+    parser.add_argument('--chord-bins', type=int, help='Chordwise Cp bins of each side', default=DEFAULT_CHORD_BINS)
+    args = parser.parse_args()
+
+    main(args.base_dir, [int(value) for value in args.cant_angles.split(',')], [int(value) for value in args.sweep_angles.split(',')],
+         args.solver, args.output, args.workers, args.stations, args.chord_bins)
@@ -0,0 +1,146 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Renders PBS scripts, OpenVSP scripts and STAR-CCM+ macros from templates.
+                 Each template is parsed once into an index of the lines to replace, and every
+                 configuration is rendered from that index with a single write. Rules match the lines
+                 that carry the values (not markers that disappear), so rendering an already
+                 rendered file gives the same result.
+"""
+
+import os
+import re
+import math
+import shlex
+from collections import namedtuple
+
+CompiledTemplate = namedtuple('CompiledTemplate', ['lines', 'index'])
+
+# Compiled templates keyed by (path, mtime, size, rules)
+_CACHE = {}
+
+PBS_RESOURCE_RULES = (
+    ('walltime', r'^#PBS -l walltime='),
+    ('select', r'^#PBS -l select='),
+)
+
+def compile_text(text, rules):
+    """
+    Parses a template into its lines and the index of the lines to replace.
+
+    Parameters:
+        text (str): Content of the template.
+        rules (iterable): Tuples (name, regular expression). A line is replaced by the value of the
+                          first rule whose expression matches it (searched in the stripped line).
+
+    Returns:
+        CompiledTemplate: Lines of the template and tuples (line number, name) of the lines to replace.
+    """
+    patterns = [(name, re.compile(pattern)) for name, pattern in rules]
+    lines = text.splitlines()
+    index = []
+    for i, line in enumerate(lines):
+        stripped_line = line.strip()
+        for name, pattern in patterns:
+            if pattern.search(stripped_line):
+                index.append((i, name))
+                break
+    return CompiledTemplate(tuple(lines), tuple(index))
+
+def compile_template(template_path, rules):
+    """
+    Parses a template file, reusing the compiled template while the file is unchanged.
+
+    Parameters:
+        template_path (str): Path to the template.
+        rules (iterable): Tuples (name, regular expression), see compile_text.
+
+    Returns:
+        CompiledTemplate: Compiled template.
+    """
+    stat = os.stat(template_path)
+    key = (os.path.abspath(template_path), stat.st_mtime_ns, stat.st_size, tuple(rules))
+    if key not in _CACHE:
+        with open(template_path, 'r') as file:
+            _CACHE[key] = compile_text(file.read(), rules)
+    return _CACHE[key]
+
+def render(template, values):
+    """
+    Renders a compiled template.
+
+    Parameters:
+        template (CompiledTemplate): Compiled template.
+        values (dict): Rule name to replacement line(s). Lines of rules without a value are kept.
+
+    Returns:
+        str: Rendered content.
+    """
+    lines = list(template.lines)
+    for i, name in template.index:
+        if name in values:
+            lines[i] = values[name]
+    return "\n".join(lines) + "\n"
+
+def render_file(template, values, output_path):
+    """Renders a compiled template to a file with a single write."""
+    content = render(template, values)
+    temporary_path = f"{output_path}.tmp{os.getpid()}"
+    with open(temporary_path, 'w') as file:
+        file.write(content)
+    os.replace(temporary_path, output_path)
+    return content
+
+def render_template_file(template_path, output_path, rules, values):
+    """Compiles (or reuses) a template and renders it to output_path. output_path may be the template itself."""
+    return render_file(compile_template(template_path, rules), values, output_path)
+
+def assignment_rules(names):
+    """Rules matching the shell assignments NAME=... of the given variables."""
+    return tuple((name, rf'^{name}=') for name in names)
+
+def walltime(hours):
+    """PBS walltime (H:MM:SS) of a number of hours, rounded up to the minute."""
+    minutes = math.ceil(round(hours * 60, 6))
+    return f"{minutes // 60}:{minutes % 60:02d}:00"
+
+def pbs_values(ncpus, mem, time, variables, nodes=1):
+    """
+    Replacement lines of the resource directives and shell variables of a PBS script.
+
+    Parameters:
+        ncpus (int): Number of processors (per node).
+        mem (int): Memory in GB (per node).
+        time (float): Walltime in hours.
+        variables (dict): Shell variable name to value.
+        nodes (int): Number of chunks (nodes), each with ncpus MPI ranks.
+
+    Returns:
+        dict: Rule name to replacement line.
+    """
+    values = {
+        'walltime': f"#PBS -l walltime={walltime(time)}",
+        # mpiprocs: one line per rank in $PBS_NODEFILE, so that mpiexec starts ranks on every node
+        'select': f"#PBS -l select={nodes}:ncpus={ncpus}:mpiprocs={ncpus}:mem={mem}gb",
+    }
+    for name, value in variables.items():
+        values[name] = f"{name}={shlex.quote(str('' if value is None else value))}"
+    return values
+
+def step_variables(steps):
+    """Shell variables of the PBS templates that describe the stages to run."""
+    return {
+        'GEO': steps['geo'],
+        'MESH': steps['mesh'],
+        'PRISM_LAYER': steps['prism_layer'],
+        'CFD': steps['cfd'],
+        'CFD_SOLVER': steps['cfd_solver'],
+        'ASO': steps['aso'],
+        'ASO_SOLVER': steps['aso_solver'],
+        'CACHE_DIR': steps.get('cache_dir'),
+        'CACHE_SIZE': steps.get('cache_size', 50),
+        'CFD_ARGS': steps.get('cfd_args', ''),
+        'REQUEUE': steps.get('requeue', 0),
+    }
@@ -0,0 +1,23 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Locations of the external programs called by the pipeline. Each one can be overridden
+                 with the environment variable of the same name, e.g. to run the pipeline against the
+                 stand-in programs of benchmarks/fake_tools.
+"""
+
+import os
+
+VSPSCRIPT = os.environ.get('VSPSCRIPT', '/path/to/OpenVSP_v3.37.0_Compiled/vspscript')
+STARCCM = os.environ.get('STARCCM', 'starccm+')
+SU2_BIN = os.environ.get('SU2_BIN', '/path/to/SU2_v7.2.0_Binaries')
+MPIEXEC = os.environ.get('MPIEXEC', 'mpiexec')
+QSUB = os.environ.get('QSUB', 'qsub')
+QSTAT = os.environ.get('QSTAT', 'qstat')
+QALTER = os.environ.get('QALTER', 'qalter')
+
+def su2(program):
+    """Path to an SU2 program (SU2_CFD, SU2_DEF, SU2_GEO, shape_optimization.py, ...)."""
+    return os.path.join(SU2_BIN, program)
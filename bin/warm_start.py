@@ -0,0 +1,166 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Warm-starts the CFD of a design point from the nearest already-solved (cant, sweep) design.
+                 The donor's ASCII restart is interpolated onto the new mesh and used as initial solution.
+"""
+
+import os
+import re
+import glob
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+import su2_config
+import su2_mesh
+
+DONOR_MARKER = 'cfd_converged'
+DONOR_RESTART = 'restart_flow.csv'
+WARM_SOLUTION = 'solution_flow.csv'
+# Grid spacing of the sweeps (degrees), used to scale the distance between designs
+CANT_SPACING = 15.0
+SWEEP_SPACING = 10.0
+WINGLET_DIR = re.compile(r'winglet_c(-?\d+)_s(-?\d+)$')
+# Grid points between two cold-started seeds of a warm-started sweep
+SEED_STRIDE = 3
+
+def donor_plan(list_cant, list_sweep, stride=SEED_STRIDE):
+    """
+    Plans the warm starts of a cant/sweep grid. Every stride-th cant and sweep is a seed, cold-started;
+    every other point is assigned a grid neighbour (diagonals included) closer to a seed as its donor,
+    so that the sweep is solved in at most stride waves instead of one neighbour after the other.
+
+    Returns:
+        list: Tuples ((cant, sweep), donor (cant, sweep) or None for seeds), donors before the points they warm-start.
+    """
+    cants, sweeps = sorted(list_cant), sorted(list_sweep)
+    plan = [((cants[i], sweeps[j]), None) for i in range(0, len(cants), stride) for j in range(0, len(sweeps), stride)]
+    planned = {(i, j) for i in range(0, len(cants), stride) for j in range(0, len(sweeps), stride)}
+    wave = sorted(planned)
+    while wave:
+        following = []
+        for i, j in wave:
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    neighbour = (i + di, j + dj)
+                    if neighbour not in planned and 0 <= neighbour[0] < len(cants) and 0 <= neighbour[1] < len(sweeps):
+                        planned.add(neighbour)
+                        following.append(neighbour)
+                        plan.append(((cants[neighbour[0]], sweeps[neighbour[1]]), (cants[i], sweeps[j])))
+        wave = following
+    return plan
+
+def design_distance(cant_a, sweep_a, cant_b, sweep_b):
+    """Distance between two designs in grid units."""
+    return math.hypot((cant_a - cant_b) / CANT_SPACING, (sweep_a - sweep_b) / SWEEP_SPACING)
+
+def find_donor(directory, solver, max_distance=1.5):
+    """
+    Finds the nearest design point whose CFD with the same solver has converged.
+
+    Parameters:
+        directory (str): Output directory of the design point to warm-start.
+        solver (str): Solver type (Euler or RANS).
+        max_distance (float): Maximum distance in grid units of an acceptable donor.
+
+    Returns:
+        str: CFD working directory of the donor, or None if there is no suitable donor.
+    """
+    directory = os.path.abspath(directory)
+    match = WINGLET_DIR.search(directory)
+    if match is None:
+        return None
+    cant, sweep = int(match.group(1)), int(match.group(2))
+
+    best = None
+    for candidate in glob.glob(os.path.join(os.path.dirname(directory), 'winglet_c*_s*')):
+        candidate_match = WINGLET_DIR.search(candidate)
+        if candidate_match is None or os.path.abspath(candidate) == directory:
+            continue
+        work_dir = os.path.join(candidate, 'CFD', solver)
+        if not (os.path.exists(os.path.join(work_dir, DONOR_MARKER)) and os.path.exists(os.path.join(work_dir, DONOR_RESTART))):
+            continue
+        distance = design_distance(cant, sweep, int(candidate_match.group(1)), int(candidate_match.group(2)))
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, work_dir)
+    return None if best is None else best[1]
+
+def interpolate_restart(donor_restart, target_points, output_path, neighbours=4):
+    """
+    Interpolates an ASCII SU2 restart onto the nodes of another mesh by inverse-distance weighting.
+
+    Parameters:
+        donor_restart (str): Path to the donor restart (CSV with PointID, x, y, z and the solution fields).
+        target_points (numpy.ndarray): Node coordinates of the target mesh, shape (N, 3).
+        output_path (str): Path to the interpolated restart to write.
+        neighbours (int): Number of donor nodes used for each target node.
+    """
+    with open(donor_restart, 'r') as file:
+        header = file.readline().strip()
+    donor = np.loadtxt(donor_restart, delimiter=',', skiprows=1, ndmin=2)
+    n_dim = target_points.shape[1]
+    donor_points = donor[:, 1:1 + n_dim]
+    donor_fields = donor[:, 1 + n_dim:]
+
+    distances, indices = cKDTree(donor_points).query(target_points, k=min(neighbours, len(donor_points)))
+    if distances.ndim == 1:
+        distances = distances[:, None]
+        indices = indices[:, None]
+    weights = 1.0 / np.maximum(distances, 1e-12)
+    weights /= weights.sum(axis=1, keepdims=True)
+    fields = np.einsum('ij,ijk->ik', weights, donor_fields[indices])
+
+    point_ids = np.arange(len(target_points))[:, None]
+    np.savetxt(output_path, np.hstack([point_ids, target_points, fields]), delimiter=', ',
+               header=header, comments='', fmt=['%d'] + ['%.15e'] * (n_dim + fields.shape[1]))
+
+def enable_restart_output(cfg_file):
+    """Makes SU2 write an ASCII restart, so that the design can later serve as a donor."""
+    options = su2_config.read_config(cfg_file)
+    output_files = options.get('OUTPUT_FILES', '(RESTART)').strip('() ')
+    files = [name.strip() for name in output_files.split(',') if name.strip()]
+    if 'RESTART_ASCII' not in files:
+        files.append('RESTART_ASCII')
+        su2_config.update_config(cfg_file, {'OUTPUT_FILES': f"({', '.join(files)})"})
+
+def prepare_warm_start(cfg_file, work_dir, solver, directory, donor_dir=None):
+    """
+    Sets up the CFD of a design point to restart from its nearest converged neighbour.
+
+    Parameters:
+        cfg_file (str): Configuration file of the CFD.
+        work_dir (str): CFD working directory containing the mesh.
+        solver (str): Solver type (Euler or RANS).
+        directory (str): Output directory of the design point.
+        donor_dir (str, optional): CFD working directory of the donor (nearest converged neighbour if None).
+
+    Returns:
+        bool: True if the configuration was set to restart from an interpolated donor solution.
+    """
+    enable_restart_output(cfg_file)
+    if donor_dir is None:
+        donor_dir = find_donor(directory, solver)
+    if donor_dir is None or not os.path.exists(os.path.join(donor_dir, DONOR_RESTART)):
+        print("No converged neighbour found. Cold-starting the CFD.")
+        su2_config.update_config(cfg_file, {'RESTART_SOL': 'NO'})
+        return False
+
+    print(f"Warm-starting from {donor_dir}")
+    native_mesh = su2_mesh.native_mesh(cfg_file, work_dir, 'mesh_warm_start.su2')
+    target_points = su2_mesh.read_points(native_mesh)
+    interpolate_restart(os.path.join(donor_dir, DONOR_RESTART), target_points, os.path.join(work_dir, WARM_SOLUTION))
+
+    # SU2 replaces the extension of SOLUTION_FILENAME with .csv when reading ASCII restarts
+    su2_config.update_config(cfg_file, {
+        'RESTART_SOL': 'YES',
+        'READ_BINARY_RESTART': 'NO',
+        'SOLUTION_FILENAME': os.path.splitext(WARM_SOLUTION)[0] + '.dat',
+    })
+    return True
+
+def mark_donor(work_dir):
+    """Marks a converged CFD run as a donor for its neighbours (only runs that converged and met their y+ target)."""
+    with open(os.path.join(work_dir, DONOR_MARKER), 'w') as file:
+        file.write('converged\n')
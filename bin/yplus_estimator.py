@@ -0,0 +1,82 @@
+"""
+    FYP: Automated aerodynamic shape optimisation of winglets with SU2 on Imperial HPC cluster
+
+    Author: Jaime Galiana Herrera
+    Date: 2026-10-18
+    Description: Predicts the first-cell height of the prism layer for a target y+ from the freestream
+                 conditions of an SU2 configuration, and corrects it from previous (height, y+) results.
+"""
+
+import math
+import su2_config
+
+TARGET_YPLUS = 1.0
+SAFETY_FACTOR = 1.1
+
+def freestream(options):
+    """
+    Freestream velocity and kinematic viscosity from the options of an SU2 configuration.
+
+    Parameters:
+        options (dict): Options read with su2_config.read_config.
+
+    Returns:
+        tuple: (velocity in m/s, kinematic viscosity in m^2/s, Reynolds number, Reynolds length in m).
+    """
+    mach = su2_config.get_float(options, 'MACH_NUMBER')
+    temperature = su2_config.get_float(options, 'FREESTREAM_TEMPERATURE', 288.15)
+    gamma = su2_config.get_float(options, 'GAMMA_VALUE', 1.4)
+    gas_constant = su2_config.get_float(options, 'GAS_CONSTANT', 287.058)
+    length = su2_config.get_float(options, 'REYNOLDS_LENGTH', su2_config.get_float(options, 'REF_LENGTH', 1.0))
+    reynolds = su2_config.get_float(options, 'REYNOLDS_NUMBER')
+    if mach is None or reynolds is None:
+        raise ValueError("MACH_NUMBER and REYNOLDS_NUMBER are required to estimate the first-cell height.")
+
+    velocity = mach * math.sqrt(gamma * gas_constant * temperature)
+    # The Reynolds number of the configuration fixes the density, hence nu = U L / Re
+    kinematic_viscosity = velocity * length / reynolds
+    return velocity, kinematic_viscosity, reynolds, length
+
+def skin_friction(reynolds):
+    """Turbulent flat-plate skin-friction coefficient (White's 1/7 power-law correlation)."""
+    return 0.026 / reynolds ** (1 / 7)
+
+def first_cell_height(cfg_path, target_yplus=TARGET_YPLUS, safety_factor=SAFETY_FACTOR):
+    """
+    Predicts the first-cell height giving the target y+ on the wing.
+
+    Parameters:
+        cfg_path (str): SU2 configuration file of the RANS simulation.
+        target_yplus (float): Target maximum y+.
+        safety_factor (float): The height is aimed at target_yplus / safety_factor.
+
+    Returns:
+        float: First-cell height in m.
+    """
+    velocity, kinematic_viscosity, reynolds, _ = freestream(su2_config.read_config(cfg_path))
+    friction_velocity = velocity * math.sqrt(skin_friction(reynolds) / 2)
+    return (target_yplus / safety_factor) * kinematic_viscosity / friction_velocity
+
+def corrected_height(history, target_yplus=TARGET_YPLUS, safety_factor=SAFETY_FACTOR):
+    """
+    Corrects the first-cell height from the y+ obtained with previous meshes.
+    With one result the height is scaled by the y+ ratio; with two or more, a secant step on
+    log(y+) against log(height) accounts for the actual (non-linear) response of the mesh.
+
+    Parameters:
+        history (list): Tuples (first-cell height, maximum y+) of the previous meshes, oldest first.
+        target_yplus (float): Target maximum y+.
+        safety_factor (float): The height is aimed at target_yplus / safety_factor.
+
+    Returns:
+        float: New first-cell height in m.
+    """
+    aim = target_yplus / safety_factor
+    height, yplus = history[-1]
+    if len(history) >= 2:
+        previous_height, previous_yplus = history[-2]
+        if previous_height != height and previous_yplus > 0 and yplus > 0:
+            exponent = (math.log(yplus) - math.log(previous_yplus)) / (math.log(height) - math.log(previous_height))
+            if exponent > 0:
+                return height * math.exp((math.log(aim) - math.log(yplus)) / exponent)
+    return height * aim / yplus
@@ -12,8 +12,26 @@
 """
 
 import os
+import asyncio
 import subprocess
 import argparse
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bin'))
+import adaptive_sampling
+import artifact_staging
+import executors
+import job_array
+import mpi_layout
+import orchestrator
+import pilot
+import resource_model
+import run_index
+import screening
+import stage_jobs
+import template_renderer
+import tool_paths
+import warm_start
 
 def create_directory(path):
     """Creates a directory if it doesn't exist."""
@@ -30,94 +48,481 @@ def normalize_solver_name(solver):
     }
     return solver_mapping.get(solver.lower(), solver)
 
-def modify_script(filename, np, mem, time, cant, sweep, steps, workdir):
-    """Modifies a script by replacing specific lines with new values."""
+def submit_variables(cant, sweep, steps, workdir):
+    """Returns the shell variables of submit.pbs for one design point."""
+    variables = template_renderer.step_variables(steps)
+    variables.update({'WORKDIR': workdir, 'CANT': cant, 'SWEEP': sweep})
+    return variables
+
+def modify_script(filename, np, mem, time, cant, sweep, steps, workdir, template=None, layout=None):
+    """
+    Renders a PBS script with the resources and parameters of a design point.
+    The resource directives and the parameter assignments are replaced in place, so rendering the
+    same script again gives the same file.
+
+    Parameters:
+        template (str, optional): Template to render from. The script itself is re-rendered if None.
+        layout (mpi_layout.Layout, optional): Nodes, ranks and memory per node, replacing np and mem.
+    """
+    variables = submit_variables(cant, sweep, steps, workdir)
+    rules = template_renderer.PBS_RESOURCE_RULES + template_renderer.assignment_rules(variables)
+    nodes = 1
+    if layout:
+        nodes, np, mem = layout
     try:
-        with open(filename, "r") as file:
-            replaced_content = ""
-            for line in file:
-                stripped_line = line.strip()
-                if "#PBS -l walltime=" in stripped_line:
-                    new_line = f"#PBS -l walltime={time}:00:00"
-                elif "#PBS -l select=1:ncpus=" in stripped_line:
-                    new_line = f"#PBS -l select=1:ncpus={np}:mem={mem}gb"
-                elif stripped_line.startswith("# Read parameters from environment variables"):
-                    new_line = f'GEO={steps["geo"]}\nMESH={steps["mesh"]}\nPRISM_LAYER={steps["prism_layer"]}\nCFD={steps["cfd"]}\nCFD_SOLVER={steps["cfd_solver"]}\nASO={steps["aso"]}\nASO_SOLVER={steps["aso_solver"]}\nWORKDIR={workdir}'
-                else:
-                    new_line = line
-                replaced_content += new_line + "\n"
-            file.close()
-        with open(filename, "w") as write_file:
-            write_file.write(replaced_content)
-            write_file.close()
+        template_renderer.render_template_file(template or filename, filename, rules, template_renderer.pbs_values(np, mem, time, variables, nodes))
     except FileNotFoundError as e:
         print(f"Error: File not found - {filename} - {e}")
     except Exception as e:
         print(f"Error modifying script: {filename} - {e}")
 
-def main(np, mem, time, steps, list_cant, list_sweep):
+def copy_template(src, dest):
+    """Copies a template into a design directory, reporting (like cp) rather than failing when it is missing."""
+    try:
+        artifact_staging.copy_file(src, dest)
+    except FileNotFoundError as e:
+        print(f"Error copying template: {src} - {e}")
+
+def prepare_output_folder(main_folder, output_folder, steps):
+    """
+    Creates the output directory of a design point and copies the templates each requested step needs.
+    The artefacts of earlier stages (wing.stp, mesh.cga) are linked in by the stages that use them.
+    """
+    create_directory(os.path.join(main_folder, output_folder))
+
+    # Create subdirectories for each step and solver only when needed
+    if steps['geo'] == 1:
+        create_directory(os.path.join(main_folder, output_folder, "GEOMETRY"))
+        copy_template(os.path.join(main_folder, "templates/winggen.vspscript"), os.path.join(main_folder, output_folder, "GEOMETRY", "winggen.vspscript"))
+    if steps['mesh'] == 1:
+        create_directory(os.path.join(main_folder, output_folder, "MESH"))
+        mesh_subdir = "with_prism" if steps['prism_layer'] == 1 else "without_prism"
+        create_directory(os.path.join(main_folder, output_folder, "MESH", mesh_subdir))
+        macro_file = "macro_with_prism.java" if steps['prism_layer'] == 1 else "macro_without_prism.java"
+        copy_template(os.path.join(main_folder, "templates", macro_file), os.path.join(main_folder, output_folder, "MESH", mesh_subdir, macro_file))
+        artifact_staging.stage_file(os.path.join(main_folder, "templates", "domain.STEP"), os.path.join(main_folder, output_folder, "MESH", mesh_subdir, "domain.STEP"))
+    if steps['cfd'] == 1:
+        cfd_solver_dir = os.path.join(output_folder, "CFD", steps['cfd_solver'])
+        create_directory(os.path.join(main_folder, cfd_solver_dir))
+        copy_template(os.path.join(main_folder, f"templates/{steps['cfd_solver'].upper()}-cfd.cfg"), os.path.join(main_folder, cfd_solver_dir, f"{steps['cfd_solver'].upper()}-cfd.cfg"))
+    if steps['aso'] == 1:
+        aso_solver_dir = os.path.join(output_folder, "ASO", steps['aso_solver'])
+        create_directory(os.path.join(main_folder, aso_solver_dir))
+        copy_template(os.path.join(main_folder, f"templates/{steps['aso_solver']}-shapeOptimisation.cfg"), os.path.join(main_folder, aso_solver_dir, f"{steps['aso_solver']}-shapeOptimisation.cfg"))
+
+def design_points(list_cant, list_sweep, steps):
+    """Returns the (cant, sweep) points in submission order, donors before the designs they warm-start when warm-starting."""
+    if steps.get('warm_start'):
+        return [point for point, _ in warm_start.donor_plan(list_cant, list_sweep)]
+    return [(cant, sweep) for cant in list_cant for sweep in list_sweep]
+
+def design_donors(list_cant, list_sweep, steps):
+    """Returns the warm-start donor (cant, sweep) of each design point whose CFD waits for its donor's, empty without warm starts."""
+    if not (steps.get('warm_start') and steps.get('cfd') == 1):
+        return {}
+    return {point: donor for point, donor in warm_start.donor_plan(list_cant, list_sweep) if donor is not None}
+
+def check_steps(steps):
+    """Checks that the mesh type matches the CFD solver."""
     if steps['cfd_solver'] == 'RANS' and steps['prism_layer'] != 1:
         raise ValueError("RANS solver requires the mesh to be generated with a prism layer. Please set -prism-layer to 1.")
     if steps['cfd_solver'] == 'Euler' and steps['prism_layer'] != 0:
         raise ValueError("Euler solver requires the mesh to be generated without a prism layer. Please set -prism-layer to 0.")
 
-    main_folder = "/path/to/main"
-    template_folder = "templates/submit_template.pbs"
-
-    for cant in list_cant:
-        for sweep in list_sweep:
-            # Change directory to main
-            os.chdir(main_folder)
-
-            # Change to output directory for the specific configuration
-            output_folder = f"output/winglet_c{cant}_s{sweep}"
-            create_directory(output_folder)
-
-            # Create subdirectories for each step and solver only when needed
-            if steps['geo'] == 1:
-                create_directory(os.path.join(output_folder, "GEOMETRY"))
-                subprocess.run(['cp', os.path.join(main_folder, "templates/winggen.vspscript"), os.path.join(output_folder, "GEOMETRY", "winggen.vspscript")])
-            if steps['mesh'] == 1:
-                create_directory(os.path.join(output_folder, "MESH"))
-                mesh_subdir = "with_prism" if steps['prism_layer'] == 1 else "without_prism"
-                create_directory(os.path.join(output_folder, "MESH", mesh_subdir))
-                macro_file = "macro_with_prism.java" if steps['prism_layer'] == 1 else "macro_without_prism.java"
-                subprocess.run(['cp', os.path.join(main_folder, "templates", macro_file), os.path.join(output_folder, "MESH", mesh_subdir, macro_file)])
-                subprocess.run(['cp', os.path.join(main_folder, "templates", "domain.STEP"), os.path.join(output_folder, "MESH", mesh_subdir, "domain.STEP")])
-                subprocess.run(['cp', os.path.join(main_folder, output_folder, "GEOMETRY", "wing.stp"), os.path.join(main_folder, output_folder, "MESH", mesh_subdir, "wing.stp")])
-            if steps['cfd'] == 1:
-                cfd_solver_dir = os.path.join(output_folder, "CFD", steps['cfd_solver'])
-                mesh_file = "with_prism/mesh.cga" if steps['cfd_solver'] == "RANS" else "without_prism/mesh.cga"
-                create_directory(cfd_solver_dir)
-                subprocess.run(['cp', os.path.join(main_folder, f"templates/{steps['cfd_solver']}-cfd.cfg"), os.path.join(cfd_solver_dir, f"{steps['cfd_solver']}-cfd.cfg")])
-                subprocess.run(['cp', os.path.join(main_folder, output_folder, "MESH", mesh_file), os.path.join(main_folder, cfd_solver_dir, "mesh.cga")])
-            if steps['aso'] == 1:
-                aso_solver_dir = os.path.join(output_folder, "ASO", steps['aso_solver'])
-                create_directory(aso_solver_dir)
-                subprocess.run(['cp', os.path.join(main_folder, f"templates/{steps['aso_solver']}-shapeOptimisation.cfg"), os.path.join(aso_solver_dir, f"{steps['aso_solver']}-shapeOptimisation.cfg")])
-
-            # Copy template to output folder
-            subprocess.run(['cp', os.path.join(main_folder, template_folder), os.path.join(output_folder, "submit.pbs")])
-
-            # Change directory to output/winglet_c{cant}_s{sweep}
-            os.chdir(output_folder)
-            modify_script("submit.pbs", np, mem, time, cant, sweep, steps, output_folder)
-
-            try:
-                # Dynamically create the submit.pbs file with the correct parameters
-                with open("submit.pbs", "a") as file:
-                    file.write(f"\nGEO={steps['geo']}\n")
-                    file.write(f"MESH={steps['mesh']}\n")
-                    file.write(f"PRISM_LAYER={steps['prism_layer']}\n")
-                    file.write(f"CFD={steps['cfd']}\n")
-                    file.write(f"CFD_SOLVER={steps['cfd_solver']}\n")
-                    file.write(f"ASO={steps['aso']}\n")
-                    file.write(f"ASO_SOLVER={steps['aso_solver']}\n")
-                    file.write(f"WORKDIR={output_folder}\n")
-                    file.write(f"NP={np}\n")  # Add np parameter for parallel processes
-                subprocess.run(["qsub", "submit.pbs"], check=True)
-            except subprocess.CalledProcessError as e:
-                print(f"Error executing qsub: {e}")
+def render_design_script(np, mem, time, cant, sweep, steps, main_folder):
+    """
+    Prepares the output directory of a design point and renders its submit.pbs from the template,
+    with absolute paths only (no change of the working directory).
+
+    Returns:
+        str: Winglet directory of the design point.
+    """
+    output_folder = f"output/winglet_c{cant}_s{sweep}"
+    prepare_output_folder(main_folder, output_folder, steps)
+
+    workdir = os.path.join(main_folder, output_folder)
+    # Size the job from the mesh of a previous run, when there is one and the job does not remesh
+    layout = None
+    if steps['mesh'] != 1:
+        layout = mpi_layout.design_layout(workdir, steps['cfd_solver'] if steps['cfd'] == 1 else steps['aso_solver'], steps)
+    job_time = time
+    if steps.get('predict_resources'):
+        # Sum of the predicted walltimes of the stages of the job, largest predicted memory
+        ncpus, job_mem, job_time, nodes = resource_model.job_resources(
+            submitted_stages(steps), workdir, steps, mpi_layout.resources(layout, time) if layout else (np, mem, time))
+        layout = mpi_layout.Layout(nodes, ncpus, job_mem)
+    modify_script(os.path.join(workdir, "submit.pbs"), np, mem, job_time, cant, sweep, steps, workdir,
+                  os.path.join(main_folder, "templates/submit_template.pbs"), layout)
+    return workdir
+
+def main(np, mem, time, steps, list_cant, list_sweep, main_folder="/path/to/main"):
+    check_steps(steps)
+
+    submissions = []
+    # A warm-started design waits for its donor's job to end, so that the donor has converged (or failed) before
+    donors = design_donors(list_cant, list_sweep, steps)
+    job_ids = {}
+    for cant, sweep in design_points(list_cant, list_sweep, steps):
+        workdir = render_design_script(np, mem, time, cant, sweep, steps, main_folder)
+        cmd = [tool_paths.QSUB]
+        donor_job = job_ids.get(donors.get((cant, sweep)))
+        if donor_job:
+            cmd += ["-W", f"depend=afterany:{donor_job}"]
+        try:
+            result = subprocess.run(cmd + ["submit.pbs"], cwd=workdir, check=True, capture_output=True, text=True)
+            job_id = result.stdout.strip()
+            job_ids[(cant, sweep)] = job_id
+            print(job_id)
+            submissions.extend((workdir, stage_jobs.index_key(stage, steps), job_id) for stage in submitted_stages(steps))
+        except subprocess.CalledProcessError as e:
+            print(f"Error executing qsub: {e}")
+
+    run_index.record_submissions(run_index.sweep_index_path(os.path.join(main_folder, "output")), submissions)
+
+def main_async(np, mem, time, steps, list_cant, list_sweep, max_in_flight=50, poll_interval=60.0, main_folder="/path/to/main"):
+    """
+    Submits the design points one job each (as main does), keeping at most max_in_flight jobs queued or
+    running, and follows them until the whole sweep has finished (see bin/orchestrator.py).
+
+    Parameters:
+        max_in_flight (int): Maximum number of jobs queued or running at the same time.
+        poll_interval (float): Seconds between two qstat calls.
+        main_folder (str): Directory containing the templates and the output directory.
+
+    Returns:
+        list: Outcome of every design point (see orchestrator.design_outcome).
+    """
+    check_steps(steps)
+
+    output_dir = os.path.join(main_folder, "output")
+    return asyncio.run(orchestrator.run_sweep(
+        design_points(list_cant, list_sweep, steps),
+        lambda cant, sweep: render_design_script(np, mem, time, cant, sweep, steps, main_folder),
+        [stage_jobs.index_key(stage, steps) for stage in submitted_stages(steps)], run_index.sweep_index_path(output_dir),
+        os.path.join(output_dir, orchestrator.RESULTS_NAME), max_in_flight, poll_interval))
+
+def main_array(np, mem, time, steps, list_cant, list_sweep, max_concurrent=None, resubmit=False, main_folder="/path/to/main"):
+    """
+    Submits the whole sweep as one PBS job array.
+
+    Parameters:
+        max_concurrent (int, optional): Maximum number of design points running at the same time.
+        resubmit (bool): Resubmit only the failed points of the previous array instead of the full sweep.
+        main_folder (str): Directory containing the templates and the output directory.
+    """
+    check_steps(steps)
+
+    array_template = os.path.join(main_folder, "templates/submit_array_template.pbs")
+    array_dir = os.path.join(main_folder, "output", "array")
+    create_directory(array_dir)
+
+    if resubmit:
+        job_id = job_array.resubmit_failed(array_dir, array_template, np, mem, time, steps, max_concurrent)
+        index_array(main_folder, array_dir, job_id, steps)
+        return
+
+    points = []
+    for cant, sweep in design_points(list_cant, list_sweep, steps):
+        output_folder = f"output/winglet_c{cant}_s{sweep}"
+        prepare_output_folder(main_folder, output_folder, steps)
+        points.append((len(points), cant, sweep, os.path.join(main_folder, output_folder)))
+
+    job_array.write_manifest(os.path.join(array_dir, job_array.MANIFEST_NAME), points)
+    if steps.get('predict_resources') and points:
+        # One script for every point: the largest predicted request
+        requests = [resource_model.job_resources(submitted_stages(steps), point[3], steps, (np, mem, time)) for point in points]
+        mem, time = max(request[1] for request in requests), max(request[2] for request in requests)
+    job_array.write_array_script(array_template, os.path.join(array_dir, "submit_array.pbs"), len(points), np, mem, time, steps, max_concurrent)
+    job_id = job_array.submit_array(array_dir, "submit_array.pbs")
+    index_array(main_folder, array_dir, job_id, steps)
+
+def submitted_stages(steps):
+    """Stages run by the jobs of the design points."""
+    return [stage for stage in stage_jobs.STAGE_ORDER if steps.get(stage) == 1]
+
+def index_array(main_folder, array_dir, job_id, steps):
+    """Records the subjobs (ID[index]) of a submitted array in the run index."""
+    if not job_id:
+        return
+    points = job_array.read_manifest(os.path.join(array_dir, job_array.MANIFEST_NAME))
+    # The PBS index of a point is its position in the manifest
+    run_index.record_submissions(run_index.sweep_index_path(os.path.join(main_folder, "output")),
+                                 [(point[3], stage_jobs.index_key(stage, steps), job_id.replace('[]', f'[{position}]'))
+                                  for position, point in enumerate(points) for stage in submitted_stages(steps)])
+
+def main_dag(np, mem, time, steps, list_cant, list_sweep, stage_resources=None, executor=None, main_folder="/path/to/main"):
+    """
+    Submits every stage of every design point as a separate job chained with afterok dependencies,
+    so that each stage only holds the resources it needs.
+
+    Parameters:
+        stage_resources (list, optional): Overrides in the form STAGE=NCPUS:MEM:HOURS.
+        executor (PBSExecutor or LocalExecutor, optional): Executor of the stages (qsub if None).
+        main_folder (str): Directory containing the templates and the output directory.
+    """
+    check_steps(steps)
+
+    if executor is None:
+        executor = executors.PBSExecutor(os.path.join(main_folder, "templates/submit_stage_template.pbs"))
+    resources = stage_jobs.parse_stage_resources(stage_resources, np, mem, time)
+
+    submit_points(design_points(list_cant, list_sweep, steps), steps, resources, executor, main_folder,
+                  design_donors(list_cant, list_sweep, steps))
+    return executor.wait()
+
+def submit_points(points, steps, resources, executor, main_folder, donors=None):
+    """
+    Prepares the output folders of the design points and submits their stage chains.
+    With donors ((cant, sweep) to donor point), the CFD of a design waits for the CFD of its donor to end.
+    """
+    submissions = []
+    cfd_jobs = {}
+    for cant, sweep in points:
+        output_folder = f"output/winglet_c{cant}_s{sweep}"
+        prepare_output_folder(main_folder, output_folder, steps)
+        workdir = os.path.join(main_folder, output_folder)
+        donor_job = cfd_jobs.get((donors or {}).get((cant, sweep)))
+        job_ids = stage_jobs.submit_design_stages(executor, workdir, cant, sweep, steps, resources, donor_job)
+        if 'cfd' in job_ids:
+            cfd_jobs[(cant, sweep)] = job_ids['cfd']
+        print(f"winglet_c{cant}_s{sweep}: " + ", ".join(f"{stage}={job_id}" for stage, job_id in job_ids.items()))
+        submissions.extend((workdir, stage_jobs.index_key(stage, steps), job_id) for stage, job_id in job_ids.items())
+    run_index.record_submissions(run_index.sweep_index_path(os.path.join(main_folder, "output")), submissions)
+
+def main_pilot(np, mem, time, steps, list_cant, list_sweep, workers=1, stage_resources=None, local_cores=None, main_folder="/path/to/main"):
+    """
+    Queues the stages of every design point and submits pilot jobs that drain the queue (see bin/pilot.py),
+    instead of one job per design point or per stage.
+
+    Parameters:
+        np (int): Number of processors of each pilot job, shared by the stages it runs.
+        mem (int): Memory of each pilot job in GB.
+        time (int): Walltime of each pilot job in hours.
+        workers (int): Number of pilot jobs.
+        stage_resources (list, optional): Cores of the stages, in the form STAGE=NCPUS:MEM:HOURS.
+        local_cores (int, optional): Drain the queue on this machine with this many cores instead of submitting pilot jobs.
+        main_folder (str): Directory containing the templates and the output directory.
+
+    Returns:
+        dict: Tasks done, failed and queued again when run locally, else None.
+    """
+    check_steps(steps)
+
+    resources = stage_jobs.parse_stage_resources(stage_resources, np, mem, time)
+    # The pilot stops and queues its stages itself before the walltime
+    task_steps = dict(steps, requeue=0)
+    tasks, submissions = [], []
+    for cant, sweep in design_points(list_cant, list_sweep, steps):
+        output_folder = f"output/winglet_c{cant}_s{sweep}"
+        prepare_output_folder(main_folder, output_folder, steps)
+        workdir = os.path.join(main_folder, output_folder)
+        for stage in submitted_stages(steps):
+            key = stage_jobs.index_key(stage, steps)
+            tasks.append((workdir, key, stage_jobs.stage_command(stage, task_steps, workdir, cant, sweep), resources[stage][0]))
+            submissions.append((workdir, key, None))
+
+    output_dir = os.path.join(main_folder, "output")
+    queue = pilot.queue_path(output_dir)
+    print(f"{pilot.enqueue(queue, tasks)} stage tasks queued in {queue}")
+    run_index.record_submissions(run_index.sweep_index_path(output_dir), submissions)
+
+    if local_cores is not None:
+        return pilot.work(queue, local_cores or None)
+
+    pilot_dir = os.path.join(output_dir, "pilot")
+    create_directory(pilot_dir)
+    variables = {'QUEUE': queue}
+    rules = template_renderer.PBS_RESOURCE_RULES + template_renderer.assignment_rules(variables)
+    template_renderer.render_template_file(os.path.join(main_folder, "templates/submit_pilot_template.pbs"), os.path.join(pilot_dir, "submit_pilot.pbs"),
+                                           rules, template_renderer.pbs_values(np, mem, time, variables))
+    for _ in range(workers):
+        try:
+            result = subprocess.run([tool_paths.QSUB, "submit_pilot.pbs"], cwd=pilot_dir, check=True, capture_output=True, text=True)
+            print(result.stdout.strip())
+        except subprocess.CalledProcessError as e:
+            print(f"Error executing qsub: {e}")
+
+def main_pending(np, mem, time, steps, stage, after=None, stage_resources=None, executor=None, main_folder="/path/to/main"):
+    """
+    Submits only the design points of the run index whose stage never ran or failed, instead of a grid.
+    PBS jobs that ended without recording their stage are marked as failed first.
+
+    Parameters:
+        stage (str): Stage that has to be run (e.g. aso), with the solver of steps for the CFD and ASO.
+        after (str, optional): Only design points whose after stage is done (e.g. cfd). A CFD or ASO after
+                               stage without a solver in steps is taken with the solver of the stage to run.
+        stage_resources (list, optional): Overrides in the form STAGE=NCPUS:MEM:HOURS.
+        executor (PBSExecutor or LocalExecutor, optional): Executor of the stages (qsub if None).
+        main_folder (str): Directory containing the templates and the output directory.
+    """
+    check_steps(steps)
+
+    output_dir = os.path.join(main_folder, "output")
+    stage_key = stage_jobs.index_key(stage, steps)
+    # An Euler CFD does not count as done for a RANS ASO
+    after_key = after and run_index.stage_key(after, steps.get(f'{after}_solver') or steps.get(f'{stage}_solver'))
+    connection = run_index.connect(run_index.sweep_index_path(output_dir))
+    run_index.refresh(connection)
+    points = [run_index.design_point(row['workdir']) for row in run_index.pending(connection, stage_key, after_key, output_dir)]
+    connection.close()
+    if not points:
+        print(f"No design point needs the {stage_key} stage.")
+        return {}
+    print(f"Submitting {len(points)} design points without a completed {stage_key} stage.")
+
+    if executor is None:
+        executor = executors.PBSExecutor(os.path.join(main_folder, "templates/submit_stage_template.pbs"))
+    resources = stage_jobs.parse_stage_resources(stage_resources, np, mem, time)
+    submit_points(points, steps, resources, executor, main_folder)
+    return executor.wait()
+
+def main_adaptive(np, mem, time, steps, list_cant, list_sweep, stage_resources=None, executor=None, main_folder="/path/to/main",
+                  budget=20, batch_size=4, n_init=6, tol=1e-3, acquisition='ei', objective='ld'):
+    """
+    Solves the grid points chosen by a surrogate of the objective, batch after batch, instead of the whole grid.
+    Designs already solved count as observations without using the budget.
+
+    Parameters:
+        budget (int): Maximum number of CFD runs.
+        batch_size (int): Number of design points submitted at a time.
+        n_init (int): Number of space-filling points solved before the surrogate is used.
+        tol (float): Stop when the best expected improvement is below tol times the best objective.
+        acquisition (str): 'ei' (expected improvement) or 'std' (maximum uncertainty).
+        objective (str): 'ld' (maximise L/D) or 'cd' (minimise CD at the fixed CL of the configuration).
+
+    Returns:
+        tuple: Best (cant, sweep) point and its (CL, CD), or None if no design was solved.
+    """
+    check_steps(steps)
+    if steps['cfd'] != 1:
+        raise ValueError("Adaptive sampling needs the CFD results. Please set -cfd to 1.")
+
+    if executor is None:
+        executor = executors.PBSExecutor(os.path.join(main_folder, "templates/submit_stage_template.pbs"))
+    resources = stage_jobs.parse_stage_resources(stage_resources, np, mem, time)
+    study_path = os.path.join(main_folder, "output", adaptive_sampling.STUDY_FILE)
+    create_directory(os.path.dirname(study_path))
+
+    def result(point):
+        return adaptive_sampling.design_result(os.path.join(main_folder, f"output/winglet_c{point[0]}_s{point[1]}"), steps['cfd_solver'])
+
+    grid = [(cant, sweep) for cant in list_cant for sweep in list_sweep]
+    solved = {}
+    failed = set()
+    for point in grid:
+        cl, cd = result(point)
+        if cl is None:
+            continue
+        # Results without an objective (e.g. CD = 0) are dropped, not run again
+        if adaptive_sampling.objective(cl, cd, objective) is None:
+            failed.add(point)
+        else:
+            solved[point] = (cl, cd)
+    runs = 0
+    iteration = 0
+
+    while runs < budget:
+        remaining = [point for point in grid if point not in solved and point not in failed]
+        if not remaining:
+            break
+        size = min(batch_size, budget - runs)
+        if len(solved) < n_init:
+            batch = adaptive_sampling.initial_design(remaining, min(size, n_init - len(solved)))
+            scores = [None] * len(batch)
+            predictions = [(None, None)] * len(batch)
+        else:
+            values = [adaptive_sampling.objective(cl, cd, objective) for cl, cd in solved.values()]
+            batch, scores, predictions = adaptive_sampling.select_batch(remaining, list(solved), values, size, acquisition)
+            if acquisition == 'ei' and max(scores) < tol * abs(max(values)):
+                print(f"Expected improvement {max(scores):.3e} below tolerance. Stopping.")
+                break
+
+        iteration += 1
+        print(f"Iteration {iteration}: solving " + ", ".join(f"c{cant}_s{sweep}" for cant, sweep in batch))
+        submit_points(batch, steps, resources, executor, main_folder)
+        executor.wait(block=True)
+        runs += len(batch)
+
+        rows = []
+        for point, score, (mean, std) in zip(batch, scores, predictions):
+            cl, cd = result(point)
+            value = adaptive_sampling.objective(cl, cd, objective) if cl is not None else None
+            if value is None:
+                failed.add(point)
+            else:
+                solved[point] = (cl, cd)
+            rows.append([iteration, point[0], point[1], cl, cd, value, mean, std, score])
+        adaptive_sampling.append_study(study_path, rows)
+
+    if not solved:
+        print("No design point was solved.")
+        return None
+    best = max(solved, key=lambda point: adaptive_sampling.objective(*solved[point], objective))
+    cl, cd = solved[best]
+    # CD may be 0 with the 'cd' objective, so the objective is printed rather than L/D
+    print(f"Best design after {runs} CFD runs: cant {best[0]}, sweep {best[1]} "
+          f"(CL = {cl:.5f}, CD = {cd:.5f}, {objective} objective = {adaptive_sampling.objective(cl, cd, objective):.5f})")
+    return best, solved[best]
+
+def main_screening(np, mem, time, steps, list_cant, list_sweep, stage_resources=None, executor=None, main_folder="/path/to/main",
+                   metric='ld', top=None, margin=None):
+    """
+    Solves the whole grid with Euler, ranks the designs by a metric of their CL and CD, and runs the
+    prism-layer mesh, RANS CFD and (with -aso 1) the ASO only for the best of them (see bin/screening.py).
+    Designs already solved with Euler are not submitted again.
+
+    Parameters:
+        stage_resources (list, optional): Overrides in the form STAGE=NCPUS:MEM:HOURS.
+        executor (PBSExecutor or LocalExecutor, optional): Executor of the stages (qsub if None).
+        main_folder (str): Directory containing the templates and the output directory.
+        metric (str): Ranking metric: 'ld', 'cd' or 'k' (induced-drag factor CD/CL^2).
+        top (int, optional): Number of best designs run with RANS.
+        margin (float, optional): Also run with RANS the designs within this fraction of the best metric.
+
+    Returns:
+        list: (cant, sweep) points run with RANS, best first.
+    """
+    euler_steps = dict(steps, geo=1, mesh=1, prism_layer=0, cfd=1, cfd_solver='Euler', aso=0)
+    rans_steps = dict(steps, geo=0, mesh=1, prism_layer=1, cfd=1, cfd_solver='RANS', aso=1 if steps.get('aso') == 1 else 0,
+                      aso_solver=steps.get('aso_solver') or 'RANS')
+    check_steps(euler_steps)
+    check_steps(rans_steps)
+
+    if executor is None:
+        executor = executors.PBSExecutor(os.path.join(main_folder, "templates/submit_stage_template.pbs"))
+    resources = stage_jobs.parse_stage_resources(stage_resources, np, mem, time)
+
+    # Completed CFD stages count as solved, whether or not they can warm-start their neighbours
+    def result(point, solver):
+        return adaptive_sampling.design_result(os.path.join(main_folder, f"output/winglet_c{point[0]}_s{point[1]}"), solver)
+
+    grid = [(cant, sweep) for cant in list_cant for sweep in list_sweep]
+    unsolved = [point for point in grid if result(point, 'Euler')[0] is None]
+    if unsolved:
+        print(f"Screening {len(unsolved)} design points with Euler ({len(grid) - len(unsolved)} already solved)")
+        submit_points(unsolved, euler_steps, resources, executor, main_folder)
+        executor.wait(block=True)
+
+    results = {point: result(point, 'Euler') for point in grid}
+    ranked = screening.rank(results, metric)
+    failed = [point for point in grid if point not in {row[0] for row in ranked}]
+    selected = screening.select(ranked, top, margin)
+    create_directory(os.path.join(main_folder, "output"))
+    screening.write_screening(os.path.join(main_folder, "output", screening.SCREENING_FILE), ranked, failed, selected, metric)
+    screening.print_ranking(ranked, selected, metric)
+    if failed:
+        print(f"{len(failed)} design points without an Euler solution: " + ", ".join(f"c{cant}_s{sweep}" for cant, sweep in failed))
+    if not selected:
+        print("No design point was solved with Euler.")
+        return []
+
+    print(f"Running the prism-layer mesh and RANS CFD{' and ASO' if rans_steps['aso'] else ''} of {len(selected)} of {len(grid)} design points")
+    submit_points(selected, rans_steps, resources, executor, main_folder)
+    executor.wait(block=True)
+    for point in selected:
+        cl, cd = result(point, 'RANS')
+        print(f"c{point[0]}_s{point[1]}: " + (f"RANS CL = {cl:.5f}, CD = {cd:.5f}" if cl is not None else "RANS CFD did not complete"))
+    return selected
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Script to submit batch jobs')
@@ -133,11 +538,46 @@ if __name__ == "__main__":
     parser.add_argument('-aso-solver', type=str, help='ASO Solver to use (Euler or RANS)')
     parser.add_argument('-cant-list', nargs='+', type=int, help='List of cant angles to test')
     parser.add_argument('-sweep-list', nargs='+', type=int, help='List of sweep angles to test')
+    parser.add_argument('-cache-dir', type=str, help='Shared cache of geometry and mesh artefacts (disabled if not given)', default=None)
+    parser.add_argument('-cache-size', type=float, help='Size limit of the artefact cache in GB', default=50)
+    parser.add_argument('-array', type=int, choices=[0, 1], help='Submit the sweep as one PBS job array (0: No, 1: Yes)', default=0)
+    parser.add_argument('-array-max-concurrent', type=int, help='Maximum number of array design points running at the same time', default=None)
+    parser.add_argument('-resubmit-failed', type=int, choices=[0, 1], help='Resubmit only the failed points of the previous job array (0: No, 1: Yes)', default=0)
+    parser.add_argument('-dag', type=int, choices=[0, 1], help='Submit each stage as a separate job chained with afterok (0: No, 1: Yes)', default=0)
+    parser.add_argument('-warm-start', type=int, choices=[0, 1], help='Warm-start each CFD from the nearest converged neighbouring design (0: No, 1: Yes)', default=0)
+    parser.add_argument('-cfd-monitor', type=int, choices=[0, 1], help='Stop SU2_CFD early once the force coefficients have converged (0: No, 1: Yes)', default=0)
+    parser.add_argument('-cells-per-rank', type=int, help='Size the CFD/ASO jobs from the mesh cell count with this many cells per MPI rank (fixed -np if not given)', default=None)
+    parser.add_argument('-cores-per-node', type=int, help='Cores of a compute node, for -cells-per-rank', default=mpi_layout.DEFAULT_CORES_PER_NODE)
+    parser.add_argument('-max-nodes', type=int, help='Maximum number of nodes of a CFD/ASO job, for -cells-per-rank', default=None)
+    parser.add_argument('-predict-resources', type=int, choices=[0, 1], help='Request the walltime and memory predicted from the completed runs of the sweep, bounded by -time/-mem (0: No, 1: Yes)', default=0)
+    parser.add_argument('-resource-margin', type=float, help='Safety margin of the predicted walltime and memory (0.2 is 20%%)', default=resource_model.DEFAULT_MARGIN)
+    parser.add_argument('-requeue', type=int, choices=[0, 1], help='Stop the CFD and ASO before the walltime and resubmit them to resume (0: No, 1: Yes)', default=0)
+    parser.add_argument('-pilot', type=int, help='Queue the stages and submit this many pilot jobs that drain the queue (0: one job per design point)', default=0)
+    parser.add_argument('-async-jobs', type=int, help='Keep this many design point jobs in flight and follow them until the sweep finishes (0: submit all and exit)', default=0)
+    parser.add_argument('-poll-interval', type=float, help='Seconds between two qstat calls of -async-jobs', default=60.0)
+    parser.add_argument('-executor', type=str, choices=['pbs', 'local'], help='Run the stages through PBS or on this machine', default='pbs')
+    parser.add_argument('-local-cores', type=int, help='Core budget of the local executor (all cores if not given)', default=None)
+    parser.add_argument('-adaptive', type=int, choices=[0, 1], help='Solve only the grid points chosen by a surrogate of the objective (0: No, 1: Yes)', default=0)
+    parser.add_argument('-adaptive-budget', type=int, help='Maximum number of CFD runs of the adaptive study', default=20)
+    parser.add_argument('-adaptive-batch', type=int, help='Number of design points submitted per adaptive iteration', default=4)
+    parser.add_argument('-adaptive-init', type=int, help='Number of space-filling design points solved before the surrogate is used', default=6)
+    parser.add_argument('-adaptive-tol', type=float, help='Stop when the expected improvement is below this fraction of the best objective', default=1e-3)
+    parser.add_argument('-adaptive-acquisition', type=str, choices=adaptive_sampling.ACQUISITIONS, help='Expected improvement (ei) or maximum uncertainty (std)', default='ei')
+    parser.add_argument('-adaptive-objective', type=str, choices=adaptive_sampling.OBJECTIVES, help='Maximise L/D (ld), or minimise CD at fixed CL (cd) or the induced-drag factor CD/CL^2 (k)', default='ld')
+    parser.add_argument('-screening', type=int, choices=[0, 1], help='Solve the grid with Euler and run the prism-layer mesh, RANS CFD and ASO only for the best designs (0: No, 1: Yes)', default=0)
+    parser.add_argument('-screening-metric', type=str, choices=screening.METRICS, help='Rank the Euler designs by L/D (ld), -CD (cd) or the induced-drag factor CD/CL^2 (k)', default='ld')
+    parser.add_argument('-screening-top', type=int, help='Number of best Euler designs run with RANS (5 if neither this nor -screening-margin is given)', default=None)
+    parser.add_argument('-screening-margin', type=float, help='Also run with RANS the designs within this fraction of the best metric (e.g. 0.05)', default=None)
+    parser.add_argument('-pending-stage', type=str, choices=stage_jobs.STAGE_ORDER, help='Submit only the design points of the run index whose STAGE never ran or failed', default=None)
+    parser.add_argument('-pending-after', type=str, choices=stage_jobs.STAGE_ORDER, help='With -pending-stage, only the design points whose AFTER stage is done', default=None)
+    parser.add_argument('-stage-resources', nargs='+', type=str, help='Per-stage resources for -dag, as STAGE=NCPUS:MEM:HOURS (e.g. geo=1:8:1 mesh=8:32:4)', default=None)
 
     args = parser.parse_args()
 
     if args.np is None or args.mem is None or args.time is None:
         parser.error("Please provide -np, -mem, and -time arguments.")
+    if args.pending_stage in ('cfd', 'aso') and not getattr(args, f'{args.pending_stage}_solver'):
+        parser.error(f"Please provide -{args.pending_stage}-solver with -pending-stage {args.pending_stage}.")
 
     # Normalize solver names
     if args.cfd_solver:
@@ -152,7 +592,63 @@ if __name__ == "__main__":
         'cfd': args.cfd,
         'cfd_solver': args.cfd_solver,
         'aso': args.aso,
-        'aso_solver': args.aso_solver
+        'aso_solver': args.aso_solver,
+        'cache_dir': args.cache_dir,
+        'cache_size': args.cache_size,
+        'warm_start': args.warm_start,
+        'requeue': args.requeue,
+        'cells_per_rank': args.cells_per_rank,
+        'cores_per_node': args.cores_per_node,
+        'max_nodes': args.max_nodes,
+        'predict_resources': args.predict_resources,
+        'resource_margin': args.resource_margin,
+        'cfd_args': " ".join(flag for flag, enabled in [('--warm-start', args.warm_start), ('--monitor', args.cfd_monitor)] if enabled)
     }
 
-    main(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list)
\ No newline at end of file
+    if args.pending_stage:
+        main_folder = "/path/to/main"
+        executor = None
+        if args.executor == 'local':
+            main_folder = os.path.dirname(os.path.abspath(__file__))
+            executor = executors.LocalExecutor(args.local_cores, os.path.join(main_folder, 'bin'))
+        main_pending(args.np, args.mem, args.time, steps, args.pending_stage, args.pending_after, args.stage_resources, executor, main_folder)
+    elif args.adaptive == 1:
+        main_folder = "/path/to/main"
+        executor = None
+        if args.executor == 'local':
+            main_folder = os.path.dirname(os.path.abspath(__file__))
+            executor = executors.LocalExecutor(args.local_cores, os.path.join(main_folder, 'bin'))
+        main_adaptive(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.stage_resources, executor, main_folder,
+                      args.adaptive_budget, args.adaptive_batch, args.adaptive_init, args.adaptive_tol, args.adaptive_acquisition, args.adaptive_objective)
+    elif args.screening == 1:
+        main_folder = "/path/to/main"
+        executor = None
+        if args.executor == 'local':
+            main_folder = os.path.dirname(os.path.abspath(__file__))
+            executor = executors.LocalExecutor(args.local_cores, os.path.join(main_folder, 'bin'))
+        main_screening(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.stage_resources, executor, main_folder,
+                       args.screening_metric, args.screening_top, args.screening_margin)
+    elif args.pilot > 0:
+        main_folder = "/path/to/main"
+        local_cores = None
+        if args.executor == 'local':
+            main_folder = os.path.dirname(os.path.abspath(__file__))
+            local_cores = args.local_cores or 0
+        counts = main_pilot(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.pilot, args.stage_resources, local_cores, main_folder)
+        sys.exit(1 if counts and counts['failed'] else 0)
+    elif args.async_jobs > 0:
+        outcomes = main_async(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.async_jobs, args.poll_interval)
+        sys.exit(1 if any(outcome['status'] != 'done' for outcome in outcomes) else 0)
+    elif args.executor == 'local':
+        main_folder = os.path.dirname(os.path.abspath(__file__))
+        executor = executors.LocalExecutor(args.local_cores, os.path.join(main_folder, 'bin'))
+        status = main_dag(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.stage_resources, executor, main_folder)
+        failed = [job_id for job_id, returncode in status.items() if returncode != 0]
+        print(f"{len(status) - len(failed)} of {len(status)} stages completed successfully.")
+        sys.exit(1 if failed else 0)
+    elif args.dag == 1:
+        main_dag(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.stage_resources)
+    elif args.array == 1 or args.resubmit_failed == 1:
+        main_array(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list, args.array_max_concurrent, args.resubmit_failed == 1)
+    else:
+        main(args.np, args.mem, args.time, steps, args.cant_list, args.sweep_list)
\ No newline at end of file
@@ -27,7 +27,7 @@ public class macro_with_prism extends StarMacro {
 
     cadModel_1.resetSystemOptions();
 
-    simulation_0.get(SolidModelManager.class).importFilesInto3DCad(new StringVector(new String[] {resolvePath("/rds/general/user/jg2219/ephemeral/Final-RANS/bin/domain.STEP")}), cadModel_1, true, false, false, false, false, false, false, true, false, true, NeoProperty.fromString("{\'STEP\': 0, \'NX\': 0, \'CATIAV5\': 0, \'SE\': 0, \'JT\': 0}"));
+    simulation_0.get(SolidModelManager.class).importFilesInto3DCad(new StringVector(new String[] {resolvePath("./domain.STEP")}), cadModel_1, true, false, false, false, false, false, false, true, false, true, NeoProperty.fromString("{\'STEP\': 0, \'NX\': 0, \'CATIAV5\': 0, \'SE\': 0, \'JT\': 0}"));
 
     UniteBodiesFeature uniteBodiesFeature_1 = 
       cadModel_1.getFeatureManager().createUniteBodies();